@@ -180,14 +180,26 @@ def limited(items, request, max_limit=FLAGS.osapi_max_limit):
     return items[offset:range_end]
 
 
-def limited_by_marker(items, request, max_limit=FLAGS.osapi_max_limit):
-    """Return a slice of items according to the requested marker and limit."""
+def get_limit_and_marker(request, max_limit=FLAGS.osapi_max_limit):
+    """Return the requested limit, capped to max_limit, and marker.
+
+    The listings which can page in the database pass them down instead
+    of slicing the whole listing with limited_by_marker().
+
+    """
     params = get_pagination_params(request)
 
     limit = params.get('limit', max_limit)
     marker = params.get('marker')
 
     limit = min(max_limit, limit)
+    return limit, marker
+
+
+def limited_by_marker(items, request, max_limit=FLAGS.osapi_max_limit):
+    """Return a slice of items according to the requested marker and limit."""
+    limit, marker = get_limit_and_marker(request, max_limit)
+
     start_index = 0
     if marker:
         start_index = -1
@@ -102,11 +102,12 @@ class ServersDiskConfigTemplate(xmlutil.TemplateBuilder):
 
 
 class ServerDiskConfigController(wsgi.Controller):
-    def _add_disk_config(self, context, servers):
+    def _add_disk_config(self, context, servers, use_slave=True):
         # Get DB information for servers
         uuids = [server['id'] for server in servers]
         db_servers = db.instance_get_all_by_filters(context,
-                                                    {'uuid': uuids})
+                                                    {'uuid': uuids},
+                                                    use_slave=use_slave)
         db_servers_by_uuid = dict((s['uuid'], s) for s in db_servers)
 
         for server in servers:
@@ -115,11 +116,13 @@ class ServerDiskConfigController(wsgi.Controller):
                 value = db_server[INTERNAL_DISK_CONFIG]
                 server[API_DISK_CONFIG] = disk_config_to_api(value)
 
-    def _show(self, context, resp_obj):
+    def _show(self, context, resp_obj, use_slave=True):
+        # NOTE: the actions which just wrote the server read it back from
+        # the primary database, the replicas may not have the write yet
         if 'server' in resp_obj.obj:
             resp_obj.attach(xml=ServerDiskConfigTemplate())
             server = resp_obj.obj['server']
-            self._add_disk_config(context, [server])
+            self._add_disk_config(context, [server], use_slave=use_slave)
 
     @wsgi.extends
     def show(self, req, resp_obj, id):
@@ -147,7 +150,7 @@ class ServerDiskConfigController(wsgi.Controller):
         if authorize(context):
             self._set_disk_config(body['server'])
             resp_obj = (yield)
-            self._show(context, resp_obj)
+            self._show(context, resp_obj, use_slave=False)
 
     @wsgi.extends
     def update(self, req, id, body):
@@ -155,7 +158,7 @@ class ServerDiskConfigController(wsgi.Controller):
         if authorize(context):
             self._set_disk_config(body['server'])
             resp_obj = (yield)
-            self._show(context, resp_obj)
+            self._show(context, resp_obj, use_slave=False)
 
     @wsgi.extends(action='rebuild')
     def _action_rebuild(self, req, id, body):
@@ -163,7 +166,7 @@ class ServerDiskConfigController(wsgi.Controller):
         if authorize(context):
             self._set_disk_config(body['rebuild'])
             resp_obj = (yield)
-            self._show(context, resp_obj)
+            self._show(context, resp_obj, use_slave=False)
 
     @wsgi.extends(action='resize')
     def _action_resize(self, req, id, body):
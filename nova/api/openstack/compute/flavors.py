@@ -72,15 +72,13 @@ class Controller(wsgi.Controller):
     @wsgi.serializers(xml=MinimalFlavorsTemplate)
     def index(self, req):
         """Return all flavors in brief."""
-        flavors = self._get_flavors(req)
-        limited_flavors = common.limited_by_marker(flavors.values(), req)
+        limited_flavors = self._get_flavors(req)
         return self._view_builder.index(req, limited_flavors)
 
     @wsgi.serializers(xml=FlavorsTemplate)
     def detail(self, req):
         """Return all flavors in detail."""
-        flavors = self._get_flavors(req)
-        limited_flavors = common.limited_by_marker(flavors.values(), req)
+        limited_flavors = self._get_flavors(req)
         return self._view_builder.detail(req, limited_flavors)
 
     @wsgi.serializers(xml=FlavorTemplate)
@@ -94,7 +92,8 @@ class Controller(wsgi.Controller):
         return self._view_builder.show(req, flavor)
 
     def _get_flavors(self, req):
-        """Helper function that returns a list of flavor dicts."""
+        """Helper function that returns the requested page of the list
+        of flavor dicts."""
         filters = {}
         if 'minRam' in req.params:
             try:
@@ -108,7 +107,13 @@ class Controller(wsgi.Controller):
             except ValueError:
                 pass  # ignore bogus values per spec
 
-        return instance_types.get_all_types(filters=filters)
+        limit, marker = common.get_limit_and_marker(req)
+        try:
+            return instance_types.get_all_types_sorted_list(filters=filters,
+                                                            limit=limit,
+                                                            marker=marker)
+        except exception.MarkerNotFound as e:
+            raise webob.exc.HTTPBadRequest(explanation=str(e))
 
 
 def create_resource():
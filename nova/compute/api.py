@@ -521,17 +521,8 @@ class API(BaseAPI):
         instance has been determined.
         """
         elevated = context.elevated()
-        if security_group is None:
-            security_group = ['default']
-        if not isinstance(security_group, list):
-            security_group = [security_group]
-
-        security_groups = []
-        for security_group_name in security_group:
-            group = self.db.security_group_get_by_name(context,
-                    context.project_id,
-                    security_group_name)
-            security_groups.append(group['id'])
+        security_groups = self._get_security_group_ids(context,
+                                                       security_group)
 
         base_options.setdefault('launch_index', 0)
         instance = self.db.instance_create(context, base_options)
@@ -543,14 +534,8 @@ class API(BaseAPI):
                                                 instance_uuid,
                                                 security_group_id)
 
-        # BlockDeviceMapping table
-        self._update_image_block_device_mapping(elevated, instance_type,
-            instance_id, image['properties'].get('mappings', []))
-        self._update_block_device_mapping(elevated, instance_type, instance_id,
-            image['properties'].get('block_device_mapping', []))
-        # override via command line option
-        self._update_block_device_mapping(elevated, instance_type, instance_id,
-                                          block_device_mapping)
+        self._update_all_block_device_mappings(elevated, instance_type,
+                instance_id, image, block_device_mapping)
 
         # Set sane defaults if not specified
         updates = {}
@@ -565,16 +550,91 @@ class API(BaseAPI):
 
         updates['display_name'] = display_name
         updates['hostname'] = utils.sanitize_hostname(hostname)
-        updates['vm_state'] = vm_states.BUILDING
-        updates['task_state'] = task_states.SCHEDULING
+        updates.update(self._new_instance_states(image,
+                                                 block_device_mapping))
+
+        instance = self.update(context, instance, **updates)
+        return instance
+
+    def create_db_entries_for_new_instances(self, context, instance_type,
+            image, base_options_list, security_group, block_device_mapping):
+        """Create the DB entries of several new instances, like
+        create_db_entry_for_new_instance() does for one, inserting the
+        instances and their security group associations in a single
+        transaction.
+
+        Returns the list of instances, in the order of base_options_list.
+        """
+        elevated = context.elevated()
+        security_groups = self._get_security_group_ids(context,
+                                                       security_group)
+        states = self._new_instance_states(image, block_device_mapping)
+        values_list = []
+        for base_options in base_options_list:
+            values = dict(base_options)
+            values.setdefault('launch_index', 0)
+            values.update(states)
+            hostname = values.get('hostname')
+            if hostname is None:
+                hostname = values.get('display_name')
+            if hostname is not None:
+                values['hostname'] = utils.sanitize_hostname(hostname)
+            values_list.append(values)
+
+        instances = []
+        for instance in self.db.instance_create_bulk(context, values_list,
+                                                     security_groups):
+            instance_id = instance['id']
+            self._update_all_block_device_mappings(elevated, instance_type,
+                    instance_id, image, block_device_mapping)
+            instance = dict(instance.iteritems())
+            # NOTE: the default display name contains the instance id, so
+            # it can only be set once the instance has been created.
+            if instance['display_name'] is None:
+                display_name = self._default_display_name(instance_id)
+                updates = {'display_name': display_name}
+                if instance['hostname'] is None:
+                    updates['hostname'] = utils.sanitize_hostname(
+                            display_name)
+                instance = self.update(context, instance, **updates)
+            instances.append(instance)
+        return instances
+
+    def _get_security_group_ids(self, context, security_group):
+        if security_group is None:
+            security_group = ['default']
+        if not isinstance(security_group, list):
+            security_group = [security_group]
+
+        security_groups = []
+        for security_group_name in security_group:
+            group = self.db.security_group_get_by_name(context,
+                    context.project_id,
+                    security_group_name)
+            security_groups.append(group['id'])
+        return security_groups
 
+    def _update_all_block_device_mappings(self, elevated, instance_type,
+                                          instance_id, image,
+                                          block_device_mapping):
+        # BlockDeviceMapping table
+        self._update_image_block_device_mapping(elevated, instance_type,
+            instance_id, image['properties'].get('mappings', []))
+        self._update_block_device_mapping(elevated, instance_type, instance_id,
+            image['properties'].get('block_device_mapping', []))
+        # override via command line option
+        self._update_block_device_mapping(elevated, instance_type, instance_id,
+                                          block_device_mapping)
+
+    def _new_instance_states(self, image, block_device_mapping):
+        """Returns the states a new instance is created in."""
+        states = {'vm_state': vm_states.BUILDING,
+                  'task_state': task_states.SCHEDULING}
         if (image['properties'].get('mappings', []) or
             image['properties'].get('block_device_mapping', []) or
             block_device_mapping):
-            updates['shutdown_terminate'] = False
-
-        instance = self.update(context, instance, **updates)
-        return instance
+            states['shutdown_terminate'] = False
+        return states
 
     def _default_display_name(self, instance_id):
         return "Server %s" % instance_id
@@ -1036,7 +1096,7 @@ class API(BaseAPI):
         return inst
 
     def get_all(self, context, search_opts=None, sort_key='created_at',
-                sort_dir='desc'):
+                sort_dir='desc', limit=None, marker=None, use_slave=False):
         """Get all instances filtered by one of the given parameters.
 
         If there is no filter and the context is an admin, it will retrieve
@@ -1048,6 +1108,13 @@ class API(BaseAPI):
         The results will be returned sorted in the order specified by the
         'sort_dir' parameter using the key specified in the 'sort_key'
         parameter.
+
+        When 'limit' is given, at most that many instances are returned.
+        When 'marker', the uuid of an instance, is given, only the
+        instances after it are returned. The database does the paging.
+
+        When 'use_slave' is True, the instances are read from a database
+        replica, which may not have the latest writes yet.
         """
 
         #TODO(bcwaldon): determine the best argument for target here
@@ -1114,7 +1181,10 @@ class API(BaseAPI):
                         return []
 
         inst_models = self._get_instances_by_filters(context, filters,
-                                                     sort_key, sort_dir)
+                                                     sort_key, sort_dir,
+                                                     limit=limit,
+                                                     marker=marker,
+                                                     use_slave=use_slave)
 
         # Convert the models to dictionaries
         instances = []
@@ -1126,7 +1196,8 @@ class API(BaseAPI):
 
         return instances
 
-    def _get_instances_by_filters(self, context, filters, sort_key, sort_dir):
+    def _get_instances_by_filters(self, context, filters, sort_key, sort_dir,
+                                  limit=None, marker=None, use_slave=False):
         if 'ip6' in filters or 'ip' in filters:
             res = self.network_api.get_instance_uuids_by_ip_filter(context,
                                                                    filters)
@@ -1136,7 +1207,9 @@ class API(BaseAPI):
             filters['uuid'] = uuids
 
         return self.db.instance_get_all_by_filters(context, filters, sort_key,
-                                                   sort_dir)
+                                                   sort_dir, limit=limit,
+                                                   marker=marker,
+                                                   use_slave=use_slave)
 
     @wrap_check_policy
     @check_instance_state(vm_state=[vm_states.ACTIVE, vm_states.SHUTOFF])
@@ -103,6 +103,19 @@ def get_all_types(inactive=0, filters=None):
 get_all_flavors = get_all_types
 
 
+def get_all_types_sorted_list(inactive=False, filters=None, limit=None,
+                              marker=None):
+    """Get non-deleted instance_types ordered by name.
+
+    Returns at most limit of them, after the one with flavorid marker if
+    given, as the database pages them.
+
+    """
+    ctxt = context.get_admin_context()
+    return db.instance_type_get_all(ctxt, inactive, filters, limit=limit,
+                                    marker=marker)
+
+
 def get_default_instance_type():
     """Get the default instance type."""
     name = FLAGS.default_instance_type
@@ -64,6 +64,7 @@ from nova.network import model as network_model
 from nova.notifier import api as notifier
 from nova.openstack.common import cfg
 from nova import rpc
+from nova.scheduler import api as scheduler_api
 from nova import utils
 from nova.virt import driver
 from nova import vnc
@@ -247,6 +248,7 @@ class ComputeManager(manager.SchedulerDependentManager):
         self._last_host_check = 0
         self._last_bw_usage_poll = 0
         self._last_info_cache_heal = 0
+        self._compute_node_announced = False
         self.compute_api = compute.API()
 
         super(ComputeManager, self).__init__(service_name="compute",
@@ -657,6 +659,13 @@ class ComputeManager(manager.SchedulerDependentManager):
                         'compute.instance.%s' % event_suffix,
                         notifier.INFO, usage_info)
 
+    def _update_scheduler_usage(self, context, host, event, instance):
+        """Tell the schedulers that an instance with the resources of
+        instance was created on or deleted from host."""
+        usage = dict((key, instance[key]) for key in
+                     ('memory_mb', 'root_gb', 'ephemeral_gb', 'vcpus'))
+        scheduler_api.update_instance_usage(context, host, event, usage)
+
     def _deallocate_network(self, context, instance):
         if not FLAGS.stub_network:
             LOG.debug(_('Deallocating network for instance'),
@@ -776,6 +785,7 @@ class ComputeManager(manager.SchedulerDependentManager):
         #system_meta = self.db.instance_system_metadata_get(context,
         #        instance_uuid)
         self.db.instance_destroy(context, instance_id)
+        self._update_scheduler_usage(context, self.host, 'delete', instance)
         self._notify_about_instance_usage(instance, "delete.end")
 
     @exception.wrap_exception(notifier=notifier, publisher_id=publisher_id())
@@ -1293,6 +1303,11 @@ class ComputeManager(manager.SchedulerDependentManager):
                               instance_type_id=instance_type['id'],
                               vm_state=vm_states.ACTIVE,
                               task_state=None)
+        self._update_scheduler_usage(context, migration_ref['dest_compute'],
+                                     'delete', instance_ref)
+        self._update_scheduler_usage(context,
+                                     migration_ref['source_compute'],
+                                     'create', instance_type)
 
         self.db.migration_update(context, migration_id,
                 {'status': 'reverted'})
@@ -1403,6 +1418,7 @@ class ComputeManager(manager.SchedulerDependentManager):
     def _finish_resize(self, context, instance_ref, migration_ref, disk_info,
                        image):
         resize_instance = False
+        old_instance_ref = instance_ref
         old_instance_type_id = migration_ref['old_instance_type_id']
         new_instance_type_id = migration_ref['new_instance_type_id']
         if old_instance_type_id != new_instance_type_id:
@@ -1437,6 +1453,11 @@ class ComputeManager(manager.SchedulerDependentManager):
                               vm_state=vm_states.ACTIVE,
                               host=migration_ref['dest_compute'],
                               task_state=task_states.RESIZE_VERIFY)
+        # NOTE: the scheduler consumed the new resources on the destination
+        # when it picked it
+        self._update_scheduler_usage(context,
+                                     migration_ref['source_compute'],
+                                     'delete', old_instance_ref)
 
         self.db.migration_update(context, migration_ref.id,
                                  {'status': 'finished'})
@@ -2349,7 +2370,10 @@ class ComputeManager(manager.SchedulerDependentManager):
         If the instance is not found on the hypervisor, but is in the database,
         then it will be set to power_state.NOSTATE.
         """
-        db_instances = self.db.instance_get_all_by_host(context, self.host)
+        # NOTE: instance_get_all_by_host() adds the columns that
+        # instance_name_template reads, so the names match the VMs' names
+        db_instances = self.db.instance_get_all_by_host(context, self.host,
+                columns=['id', 'uuid', 'power_state', 'vm_state'])
 
         num_vm_instances = self.driver.get_num_instances()
         num_db_instances = len(db_instances)
@@ -2454,6 +2478,11 @@ class ComputeManager(manager.SchedulerDependentManager):
 
         """
         self.driver.update_available_resource(context, self.host)
+        if not self._compute_node_announced:
+            # NOTE: only once the service starts, each cast makes the
+            # schedulers reload the state of this host from the database
+            scheduler_api.update_compute_node(context, self.host)
+            self._compute_node_announced = True
 
     def add_instance_fault_from_exc(self, context, instance_uuid, fault,
                                     exc_info=None):
@@ -41,8 +41,15 @@ these objects be simple dictionaries.
 :enable_new_services:  when adding a new service to the database, is it in the
                        pool of available hardware (Default: True)
 
+:db_use_tpool:  run the calls to the backend in native threads so that they
+                do not block the other greenthreads (Default: False)
+
 """
 
+import functools
+
+from eventlet import tpool
+
 from nova import exception
 from nova import flags
 from nova.openstack.common import cfg
@@ -65,13 +72,30 @@ db_opts = [
     cfg.StrOpt('snapshot_name_template',
                default='snapshot-%08x',
                help='Template string to be used to generate snapshot names'),
+    cfg.BoolOpt('db_use_tpool',
+                default=False,
+                help='Run the calls to the db backend in a pool of native '
+                     'threads so that blocking queries do not stall the '
+                     'other greenthreads'),
     ]
 
 FLAGS = flags.FLAGS
 FLAGS.register_opts(db_opts)
 
-IMPL = utils.LazyPluggable('db_backend',
-                           sqlalchemy='nova.db.sqlalchemy.api')
+
+class TpoolLazyPluggable(utils.LazyPluggable):
+    """LazyPluggable which runs the functions of the backend with
+    eventlet.tpool.execute() when db_use_tpool is set."""
+
+    def __getattr__(self, key):
+        attr = super(TpoolLazyPluggable, self).__getattr__(key)
+        if FLAGS.db_use_tpool and callable(attr):
+            return functools.partial(tpool.execute, attr)
+        return attr
+
+
+IMPL = TpoolLazyPluggable('db_backend',
+                          sqlalchemy='nova.db.sqlalchemy.api')
 
 
 class NoMoreNetworks(exception.Error):
@@ -87,6 +111,14 @@ class NoMoreTargets(exception.Error):
 ###################
 
 
+def pool_stats_get():
+    """Get the connection pool counters of the backend, by database."""
+    return IMPL.pool_stats_get()
+
+
+###################
+
+
 def service_destroy(context, instance_id):
     """Destroy the service or raise if it does not exist."""
     return IMPL.service_destroy(context, instance_id)
@@ -131,6 +163,19 @@ def service_get_all_compute_sorted(context):
     return IMPL.service_get_all_compute_sorted(context)
 
 
+def service_get_all_compute_up_sorted(context, zone=None, hosts=None,
+                                      exclude_hosts=None, limit=None):
+    """Get the enabled compute services that are up, sorted by instance
+    cores, optionally in an availability zone, among hosts and not among
+    exclude_hosts, and at most limit of them.
+
+    :returns: a list of (Service, instance_cores) tuples.
+
+    """
+    return IMPL.service_get_all_compute_up_sorted(context, zone=zone,
+            hosts=hosts, exclude_hosts=exclude_hosts, limit=limit)
+
+
 def service_get_all_volume_sorted(context):
     """Get all volume services sorted by volume count.
 
@@ -167,9 +212,9 @@ def compute_node_get(context, compute_id):
     return IMPL.compute_node_get(context, compute_id)
 
 
-def compute_node_get_all(context):
-    """Get all computeNodes."""
-    return IMPL.compute_node_get_all(context)
+def compute_node_get_all(context, use_slave=True):
+    """Get all computeNodes, from a replica unless use_slave is False."""
+    return IMPL.compute_node_get_all(context, use_slave=use_slave)
 
 
 def compute_node_create(context, values):
@@ -190,10 +235,17 @@ def compute_node_get_by_host(context, host):
 
 
 def compute_node_utilization_update(context, host, free_ram_mb_delta=0,
-                          free_disk_gb_delta=0, work_delta=0, vm_delta=0):
+                          free_disk_gb_delta=0, work_delta=0, vm_delta=0,
+                          instance_uuid=None):
+    """Update the utilization of the ComputeNode of host by deltas.
+
+    If instance_uuid is given, the resource claims of that instance on
+    host are deleted in the same transaction, as the compute node now
+    accounts for its resources.
+    """
     return IMPL.compute_node_utilization_update(context, host,
                           free_ram_mb_delta, free_disk_gb_delta, work_delta,
-                          vm_delta)
+                          vm_delta, instance_uuid)
 
 
 def compute_node_utilization_set(context, host, free_ram_mb=None,
@@ -204,6 +256,33 @@ def compute_node_utilization_set(context, host, free_ram_mb=None,
 ###################
 
 
+def resource_claims_create(context, values_list):
+    """Create the resource claims of the values dictionaries in
+    values_list, in a single transaction."""
+    return IMPL.resource_claims_create(context, values_list)
+
+
+def resource_claim_get_all(context, created_since=None):
+    """Get the resource claims which have not expired, ordered by id.
+
+    With created_since, get the claims created at or after it instead,
+    deleted and expired ones included."""
+    return IMPL.resource_claim_get_all(context, created_since)
+
+
+def resource_claims_destroy_by_instance(context, instance_uuid):
+    """Delete the resource claims of an instance."""
+    return IMPL.resource_claims_destroy_by_instance(context, instance_uuid)
+
+
+def resource_claims_destroy_expired(context):
+    """Delete the resource claims which have expired."""
+    return IMPL.resource_claims_destroy_expired(context)
+
+
+###################
+
+
 def certificate_create(context, values):
     """Create a certificate from the values dictionary."""
     return IMPL.certificate_create(context, values)
@@ -520,6 +599,13 @@ def instance_create(context, values):
     return IMPL.instance_create(context, values)
 
 
+def instance_create_bulk(context, values_list, security_group_ids=None):
+    """Create instances from a list of values dictionaries in one
+    transaction, each associated with the given security groups."""
+    return IMPL.instance_create_bulk(context, values_list,
+                                     security_group_ids)
+
+
 def instance_data_get_for_project(context, project_id):
     """Get (instance_count, total_cores, total_ram) for project."""
     return IMPL.instance_data_get_for_project(context, project_id)
@@ -540,32 +626,49 @@ def instance_get(context, instance_id):
     return IMPL.instance_get(context, instance_id)
 
 
-def instance_get_all(context):
-    """Get all instances."""
-    return IMPL.instance_get_all(context)
+def instance_get_all(context, columns=None):
+    """Get all instances.
+
+    When columns is given, only these columns and those the instance
+    names are made of are read, and the instances are returned as rows
+    without any of their relationships. Whole instances are returned if
+    instance_name_template reads other attributes than columns.
+    """
+    return IMPL.instance_get_all(context, columns=columns)
 
 
 def instance_get_all_by_filters(context, filters, sort_key='created_at',
-                                sort_dir='desc'):
-    """Get all instances that match all filters."""
+                                sort_dir='desc', limit=None, marker=None,
+                                use_slave=False):
+    """Get all instances that match all filters, limit of them after
+    the instance with uuid marker if given.
+
+    The instances are read from a replica, which may lag behind the
+    writes, when use_slave is True."""
     return IMPL.instance_get_all_by_filters(context, filters, sort_key,
-                                            sort_dir)
+                                            sort_dir, limit=limit,
+                                            marker=marker,
+                                            use_slave=use_slave)
 
 
-def instance_get_active_by_window(context, begin, end=None, project_id=None):
+def instance_get_active_by_window(context, begin, end=None, project_id=None,
+                                  use_slave=True):
     """Get instances active during a certain time window.
 
-    Specifying a project_id will filter for a certain project."""
-    return IMPL.instance_get_active_by_window(context, begin, end, project_id)
+    Specifying a project_id will filter for a certain project. The
+    instances are read from a replica unless use_slave is False."""
+    return IMPL.instance_get_active_by_window(context, begin, end, project_id,
+                                              use_slave=use_slave)
 
 
 def instance_get_active_by_window_joined(context, begin, end=None,
-                                         project_id=None):
+                                         project_id=None, use_slave=True):
     """Get instances and joins active during a certain time window.
 
-    Specifying a project_id will filter for a certain project."""
+    Specifying a project_id will filter for a certain project. The
+    instances are read from a replica unless use_slave is False."""
     return IMPL.instance_get_active_by_window_joined(context, begin, end,
-                                              project_id)
+                                              project_id, use_slave=use_slave)
 
 
 def instance_get_all_by_project(context, project_id):
@@ -573,9 +676,15 @@ def instance_get_all_by_project(context, project_id):
     return IMPL.instance_get_all_by_project(context, project_id)
 
 
-def instance_get_all_by_host(context, host):
-    """Get all instance belonging to a host."""
-    return IMPL.instance_get_all_by_host(context, host)
+def instance_get_all_by_host(context, host, columns=None):
+    """Get all instance belonging to a host.
+
+    When columns is given, only these columns and those the instance
+    names are made of are read, and the instances are returned as rows
+    without any of their relationships. Whole instances are returned if
+    instance_name_template reads other attributes than columns.
+    """
+    return IMPL.instance_get_all_by_host(context, host, columns=columns)
 
 
 def instance_get_all_by_reservation(context, reservation_id):
@@ -1360,10 +1469,13 @@ def instance_type_create(context, values):
     return IMPL.instance_type_create(context, values)
 
 
-def instance_type_get_all(context, inactive=False, filters=None):
-    """Get all instance types."""
+def instance_type_get_all(context, inactive=False, filters=None,
+                          limit=None, marker=None):
+    """Get all instance types, limit of them after the one with flavorid
+    marker if given."""
     return IMPL.instance_type_get_all(
-        context, inactive=inactive, filters=filters)
+        context, inactive=inactive, filters=filters, limit=limit,
+        marker=marker)
 
 
 def instance_type_get(context, id):
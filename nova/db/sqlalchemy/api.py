@@ -33,6 +33,7 @@ from nova import log as logging
 from nova.compute import aggregate_states
 from nova.compute import vm_states
 from nova.db.sqlalchemy import models
+from nova.db.sqlalchemy.session import get_pool_stats
 from nova.db.sqlalchemy.session import get_session
 from sqlalchemy import and_
 from sqlalchemy import or_
@@ -42,7 +43,9 @@ from sqlalchemy.orm import joinedload_all
 from sqlalchemy.sql import func
 from sqlalchemy.sql.expression import asc
 from sqlalchemy.sql.expression import desc
+from sqlalchemy.sql.expression import exists
 from sqlalchemy.sql.expression import literal_column
+from sqlalchemy import types
 
 FLAGS = flags.FLAGS
 flags.DECLARE('reserved_host_disk_mb', 'nova.scheduler.host_manager')
@@ -236,6 +239,106 @@ def exact_filter(query, model, filters, legal_keys):
     return query
 
 
+def keyset_filter(query, model, sort_key, sort_dir, marker):
+    """Applies keyset pagination to a query.
+
+    Returns the updated query, which only matches the rows that come
+    after marker when ordered by sort_key and then id: the database seeks
+    to them instead of reading and skipping the rows of the pages before.
+
+    :param query: query to apply the pagination to, ordered by sort_key
+                  and id in sort_dir
+    :param model: model object the query applies to
+    :param sort_key: attribute of model the query is ordered by
+    :param sort_dir: direction of the order, 'asc' or 'desc'
+    :param marker: the last row of the previous page
+    """
+    sort_column = getattr(model, sort_key)
+    sort_value = getattr(marker, sort_key)
+    if sort_dir == 'desc':
+        return query.filter(or_(sort_column < sort_value,
+                                and_(sort_column == sort_value,
+                                     model.id < marker.id)))
+    return query.filter(or_(sort_column > sort_value,
+                            and_(sort_column == sort_value,
+                                 model.id > marker.id)))
+
+
+class _Row(object):
+    """A row of some of the columns of a model.
+
+    Rows hold their values in __slots__ and, like the model objects, can
+    be indexed by column name and iterated over as (column, value) pairs.
+    """
+
+    __slots__ = ()
+
+    def __init__(self, values):
+        for column, value in zip(self.__slots__, values):
+            setattr(self, column, value)
+
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def __iter__(self):
+        return self.iteritems()
+
+    def iteritems(self):
+        return ((column, getattr(self, column)) for column in self.__slots__)
+
+    def __repr__(self):
+        return '<%s %s>' % (self.__class__.__name__,
+                            ' '.join('%s=%r' % item for item in self))
+
+
+_ROW_TYPES = {}
+
+
+def _row_type(model, columns):
+    """Returns the class of the rows of the given columns of model.
+
+    The properties of model, such as Instance.name, are properties of the
+    rows as well and work when the columns they read were selected.
+    """
+    key = (model, columns)
+    row_type = _ROW_TYPES.get(key)
+    if row_type is None:
+        attrs = dict((name, value) for name, value in vars(model).iteritems()
+                     if isinstance(value, property) and name not in columns)
+        attrs['__slots__'] = columns
+        row_type = type('%sRow' % model.__name__, (_Row,), attrs)
+        _ROW_TYPES[key] = row_type
+    return row_type
+
+
+def column_query(context, model, columns, **kwargs):
+    """Returns a query of only the given columns of model, as with
+    model_query().
+
+    Use column_rows() to get the rows it returns as _Row objects; they
+    cost a fraction of the model objects, which have all the columns,
+    their joined relationships and the session's bookkeeping.
+    """
+    return model_query(context, *[getattr(model, column)
+                                  for column in columns], **kwargs)
+
+
+def column_rows(query, model, columns):
+    """Returns the rows of a column_query() as _Row objects."""
+    row_type = _row_type(model, tuple(columns))
+    return [row_type(values) for values in query]
+
+
+###################
+
+
+def pool_stats_get():
+    return get_pool_stats()
+
+
 ###################
 
 
@@ -349,6 +452,48 @@ def service_get_all_compute_sorted(context):
                                                label)
 
 
+@require_admin_context
+def service_get_all_compute_up_sorted(context, zone=None, hosts=None,
+                                      exclude_hosts=None, limit=None):
+    session = get_session()
+    if hosts is not None and not hosts:
+        return []
+    with session.begin():
+        # NOTE: the same query as service_get_all_compute_sorted(), with
+        # the availability zone, host and utils.service_is_up() checks
+        # done by the database so only the candidates are returned.
+        label = 'instance_cores'
+        subq = model_query(context, models.Instance.host,
+                           func.sum(models.Instance.vcpus).label(label),
+                           session=session, read_deleted="no").\
+                       group_by(models.Instance.host).\
+                       subquery()
+        instance_cores = func.coalesce(getattr(subq.c, label), 0)
+        now = utils.utcnow()
+        down_time = datetime.timedelta(seconds=FLAGS.service_down_time)
+        last_heartbeat = func.coalesce(models.Service.updated_at,
+                                       models.Service.created_at)
+        query = model_query(context, models.Service, instance_cores,
+                            session=session, read_deleted="no").\
+                    filter_by(topic='compute').\
+                    filter_by(disabled=False).\
+                    filter(last_heartbeat.between(now - down_time,
+                                                  now + down_time))
+        if zone:
+            query = query.filter_by(availability_zone=zone)
+        if hosts is not None:
+            query = query.filter(models.Service.host.in_(hosts))
+        if exclude_hosts:
+            query = query.filter(~models.Service.host.in_(exclude_hosts))
+        query = query.\
+                    outerjoin((subq, models.Service.host == subq.c.host)).\
+                    order_by(instance_cores).\
+                    order_by(models.Service.id)
+        if limit:
+            query = query.limit(limit)
+        return query.all()
+
+
 @require_admin_context
 def service_get_all_volume_sorted(context):
     session = get_session()
@@ -415,7 +560,9 @@ def compute_node_get(context, compute_id, session=None):
 
 
 @require_admin_context
-def compute_node_get_all(context, session=None):
+def compute_node_get_all(context, session=None, use_slave=True):
+    if not session:
+        session = get_session(slave=use_slave)
     return model_query(context, models.ComputeNode, session=session).\
                     options(joinedload('service')).\
                     all()
@@ -490,10 +637,13 @@ def compute_node_get_by_host(context, host):
 
 
 def compute_node_utilization_update(context, host, free_ram_mb_delta=0,
-                          free_disk_gb_delta=0, work_delta=0, vm_delta=0):
+                          free_disk_gb_delta=0, work_delta=0, vm_delta=0,
+                          instance_uuid=None):
     """Update a specific ComputeNode entry by a series of deltas.
     Do this as a single atomic action and lock the row for the
-    duration of the operation. Requires that ComputeNode record exist."""
+    duration of the operation. Requires that ComputeNode record exist.
+    The resource claims of instance_uuid on host, if given, are deleted
+    in the same transaction."""
     session = get_session()
     compute_node = None
     with session.begin(subtransactions=True):
@@ -520,6 +670,14 @@ def compute_node_utilization_update(context, host, free_ram_mb_delta=0,
                                              work_delta)
         if vm_delta != 0:
             compute_node.running_vms = table.c.running_vms + vm_delta
+        if instance_uuid is not None:
+            session.query(models.ResourceClaim).\
+                    filter_by(instance_uuid=instance_uuid).\
+                    filter_by(host=host).\
+                    filter_by(deleted=False).\
+                    update({'deleted': True,
+                            'deleted_at': utils.utcnow(),
+                            'updated_at': literal_column('updated_at')})
     return compute_node
 
 
@@ -557,6 +715,60 @@ def compute_node_utilization_set(context, host, free_ram_mb=None,
 ###################
 
 
+@require_admin_context
+def resource_claims_create(context, values_list):
+    session = get_session()
+    claim_refs = []
+    with session.begin():
+        for values in values_list:
+            claim_ref = models.ResourceClaim()
+            claim_ref.update(values)
+            session.add(claim_ref)
+            claim_refs.append(claim_ref)
+    return claim_refs
+
+
+@require_admin_context
+def resource_claim_get_all(context, created_since=None):
+    if created_since is None:
+        query = model_query(context, models.ResourceClaim,
+                            read_deleted="no").\
+                    filter(models.ResourceClaim.expires_at > utils.utcnow())
+    else:
+        query = model_query(context, models.ResourceClaim,
+                            read_deleted="yes").\
+                    filter(models.ResourceClaim.created_at >= created_since)
+    return query.order_by(models.ResourceClaim.id).all()
+
+
+@require_admin_context
+def resource_claims_destroy_by_instance(context, instance_uuid):
+    session = get_session()
+    with session.begin():
+        session.query(models.ResourceClaim).\
+                filter_by(instance_uuid=instance_uuid).\
+                filter_by(deleted=False).\
+                update({'deleted': True,
+                        'deleted_at': utils.utcnow(),
+                        'updated_at': literal_column('updated_at')})
+
+
+@require_admin_context
+def resource_claims_destroy_expired(context):
+    session = get_session()
+    with session.begin():
+        session.query(models.ResourceClaim).\
+                filter(models.ResourceClaim.expires_at <= utils.utcnow()).\
+                filter_by(deleted=False).\
+                update({'deleted': True,
+                        'deleted_at': utils.utcnow(),
+                        'updated_at': literal_column('updated_at')},
+                       synchronize_session=False)
+
+
+###################
+
+
 @require_admin_context
 def certificate_get(context, certificate_id, session=None):
     result = model_query(context, models.Certificate, session=session).\
@@ -1267,6 +1479,40 @@ def instance_create(context, values):
     return instance_ref
 
 
+@require_context
+def instance_create_bulk(context, values_list, security_group_ids=None):
+    """Create several Instance records, their info cache entries and
+    security group associations in a single transaction.
+
+    context - request context object
+    values_list - list of dicts containing column values.
+    security_group_ids - ids of the security groups of every instance.
+    """
+    instance_refs = []
+    session = get_session()
+    with session.begin():
+        security_group_refs = [security_group_get(context, security_group_id,
+                                                  session=session)
+                               for security_group_id in
+                               security_group_ids or []]
+        for values in values_list:
+            values = values.copy()
+            values['metadata'] = _metadata_refs(values.get('metadata'),
+                                                models.InstanceMetadata)
+            instance_ref = models.Instance()
+            if not values.get('uuid'):
+                values['uuid'] = str(utils.gen_uuid())
+            instance_ref.update(values)
+            instance_ref.security_groups = list(security_group_refs)
+            session.add(instance_ref)
+
+            info_cache = models.InstanceInfoCache()
+            info_cache.update({'instance_id': values['uuid']})
+            session.add(info_cache)
+            instance_refs.append(instance_ref)
+    return instance_refs
+
+
 @require_admin_context
 def instance_data_get_for_project(context, project_id):
     result = model_query(context,
@@ -1352,8 +1598,31 @@ def _build_instance_get(context, session=None):
             options(joinedload('instance_type'))
 
 
+# The keys of the instance_name_template fields, as in '%(uuid)s'
+_NAME_TEMPLATE_KEY_RE = re.compile(r'%\((\w+)\)')
+
+
+def _instance_columns(columns):
+    """Returns columns plus those Instance.name reads to fill in
+    instance_name_template, or None if the template reads attributes
+    which are not columns, so whole instances must be read."""
+    keys = _NAME_TEMPLATE_KEY_RE.findall(FLAGS.instance_name_template)
+    if not keys:
+        # A positional template like 'instance-%08x' is given the id
+        keys = ['id']
+    table_columns = models.Instance.__table__.columns
+    if not all(key in table_columns for key in keys):
+        return None
+    return list(columns) + [key for key in set(keys) if key not in columns]
+
+
 @require_admin_context
-def instance_get_all(context):
+def instance_get_all(context, columns=None):
+    if columns:
+        columns = _instance_columns(columns)
+    if columns:
+        return column_rows(column_query(context, models.Instance, columns),
+                           models.Instance, columns)
     return model_query(context, models.Instance).\
                    options(joinedload('info_cache')).\
                    options(joinedload('security_groups')).\
@@ -1362,24 +1631,115 @@ def instance_get_all(context):
                    all()
 
 
+# Characters with a special meaning in a regular expression
+_REGEXP_SPECIAL_CHARS = frozenset('.^$*+?{}[]\\|()')
+
+# The regular expression match operator of each database dialect; the
+# regexp filters of the others are applied to the instances in Python.
+_REGEXP_OPERATORS = {'mysql': 'REGEXP', 'postgresql': '~'}
+
+# The intervals and bracket expressions re and POSIX EREs agree on
+_ERE_INTERVAL_RE = re.compile(r'\{\d+(,\d*)?\}')
+_ERE_BRACKET_RE = re.compile(r'\[\^?\]?[^\]\[\\]*\]')
+
+
+def _is_ere_compatible(pattern):
+    """Returns whether pattern only uses the subset of the re syntax that
+    POSIX extended regular expressions give the same meaning.
+
+    Escape classes like \\d, inline flags, (?...) groups, non-greedy
+    quantifiers and escapes inside bracket expressions are not part of
+    it, so the database is not asked to match those."""
+    i = 0
+    # True where a quantifier would have nothing to repeat, or would
+    # follow another one (a non-greedy or possessive quantifier)
+    no_atom = True
+    while i < len(pattern):
+        c = pattern[i]
+        if c == '\\':
+            if i + 1 == len(pattern) or pattern[i + 1].isalnum():
+                return False
+            i += 2
+            no_atom = False
+            continue
+        if c == '{':
+            match = _ERE_INTERVAL_RE.match(pattern, i)
+            if no_atom or not match:
+                return False
+            i = match.end()
+            no_atom = True
+            continue
+        if c == '[':
+            match = _ERE_BRACKET_RE.match(pattern, i)
+            if not match:
+                return False
+            i = match.end()
+            no_atom = False
+            continue
+        if c in '*+?':
+            if no_atom:
+                return False
+            no_atom = True
+        elif c == '(':
+            if pattern.startswith('?', i + 1):
+                return False
+            no_atom = True
+        elif c in '|^':
+            no_atom = True
+        else:
+            no_atom = False
+        i += 1
+    return True
+
+
+def _regexp_filter_clause(column, pattern, dialect_name):
+    """Returns a clause matching the values of a string column like
+    re.match(pattern) does, or None if pattern is not a plain prefix and
+    dialect_name has no regexp operator or cannot match it."""
+    # NOTE: empty values never match, as in _regexp_filter_by_column()
+    if not _REGEXP_SPECIAL_CHARS.intersection(pattern):
+        prefix = pattern.replace('!', '!!').replace('%', '!%').\
+                         replace('_', '!_')
+        return and_(column != '', column.like(prefix + '%', escape='!'))
+    operator = _REGEXP_OPERATORS.get(dialect_name)
+    if operator is None or not _is_ere_compatible(pattern):
+        return None
+    return and_(column != '', column.op(operator)('^(%s)' % pattern))
+
+
+def _metadata_filter_clauses(meta):
+    """Returns the EXISTS clauses on instance_metadata matching the
+    instances which have all the key/value pairs of meta, a dict or a list
+    of single pair dicts, or None if no instance can match."""
+    if isinstance(meta, dict):
+        pairs = meta.items()
+    elif isinstance(meta, list):
+        pairs = []
+        for node in meta:
+            if not isinstance(node, dict) or len(node) != 1:
+                return None
+            pairs.extend(node.items())
+    else:
+        return []
+    return [exists().where(and_(
+                    models.InstanceMetadata.instance_id == models.Instance.id,
+                    models.InstanceMetadata.deleted == False,
+                    models.InstanceMetadata.key == key,
+                    models.InstanceMetadata.value == value))
+            for key, value in pairs]
+
+
 @require_context
-def instance_get_all_by_filters(context, filters, sort_key, sort_dir):
+def instance_get_all_by_filters(context, filters, sort_key, sort_dir,
+                                limit=None, marker=None, use_slave=False):
     """Return instances that match all filters.  Deleted instances
     will be returned by default, unless there's a filter that says
-    otherwise"""
-
-    def _regexp_filter_by_metadata(instance, meta):
-        inst_metadata = [{node['key']: node['value']}
-                         for node in instance['metadata']]
-        if isinstance(meta, list):
-            for node in meta:
-                if node not in inst_metadata:
-                    return False
-        elif isinstance(meta, dict):
-            for k, v in meta.iteritems():
-                if {k: v} not in inst_metadata:
-                    return False
-        return True
+    otherwise.
+
+    When limit is given, at most limit instances are returned. When
+    marker, the uuid of an instance, is given, only the instances after
+    it are returned. The instances are read from a replica when
+    use_slave is True."""
 
     def _regexp_filter_by_column(instance, filter_name, filter_re):
         try:
@@ -1392,20 +1752,21 @@ def instance_get_all_by_filters(context, filters, sort_key, sort_dir):
 
     sort_fn = {'desc': desc, 'asc': asc}
 
-    session = get_session()
+    session = get_session(slave=use_slave)
     query_prefix = session.query(models.Instance).\
             options(joinedload('info_cache')).\
             options(joinedload('security_groups')).\
             options(joinedload('metadata')).\
             options(joinedload('instance_type')).\
-            order_by(sort_fn[sort_dir](getattr(models.Instance, sort_key)))
+            order_by(sort_fn[sort_dir](getattr(models.Instance, sort_key))).\
+            order_by(sort_fn[sort_dir](models.Instance.id))
 
     # Make a copy of the filters dictionary to use going forward, as we'll
     # be modifying it and we shouldn't affect the caller's use of it.
     filters = filters.copy()
 
     if 'changes-since' in filters:
-        changes_since = utils.normalize_time(filters['changes-since'])
+        changes_since = utils.normalize_time(filters.pop('changes-since'))
         query_prefix = query_prefix.\
                             filter(models.Instance.updated_at > changes_since)
 
@@ -1437,37 +1798,83 @@ def instance_get_all_by_filters(context, filters, sort_key, sort_dir):
     query_prefix = exact_filter(query_prefix, models.Instance,
                                 filters, exact_match_filter_names)
 
-    instances = query_prefix.all()
-    if not instances:
-        return []
+    if 'metadata' in filters:
+        clauses = _metadata_filter_clauses(filters.pop('metadata'))
+        if clauses is None:
+            return []
+        for clause in clauses:
+            query_prefix = query_prefix.filter(clause)
 
     # Now filter on everything else for regexp matching..
     # For filters not in the list, we'll attempt to use the filter_name
-    # as a column name in Instance..
-    regexp_filter_funcs = {}
-
-    for filter_name in filters.iterkeys():
-        filter_func = regexp_filter_funcs.get(filter_name, None)
-        filter_re = re.compile(str(filters[filter_name]))
-        if filter_func:
-            filter_l = lambda instance: filter_func(instance, filter_re)
-        elif filter_name == 'metadata':
-            filter_l = lambda instance: _regexp_filter_by_metadata(instance,
-                    filters[filter_name])
-        else:
-            filter_l = lambda instance: _regexp_filter_by_column(instance,
-                    filter_name, filter_re)
-        instances = filter(filter_l, instances)
-        if not instances:
+    # as a column name in Instance. The regexps on string columns are
+    # matched by the database, those it cannot match and those on other
+    # attributes are matched against the instances it returns.
+    dialect_name = session.bind.dialect.name
+    columns = models.Instance.__table__.columns
+    python_filters = []
+    for filter_name, value in filters.iteritems():
+        if not hasattr(models.Instance, filter_name):
+            # Matches every instance, see _regexp_filter_by_column()
+            continue
+        pattern = str(value)
+        filter_re = re.compile(pattern)
+        column = columns.get(filter_name)
+        if column is None or not isinstance(column.type, types.String):
+            python_filters.append((filter_name, filter_re))
+            continue
+        clause = _regexp_filter_clause(getattr(models.Instance, filter_name),
+                                       pattern, dialect_name)
+        if clause is not None:
+            query_prefix = query_prefix.filter(clause)
+        if clause is None or dialect_name != 'postgresql':
+            # NOTE: LIKE ignores the case on sqlite, and so do LIKE and
+            # REGEXP under the default collations of MySQL
+            python_filters.append((filter_name, filter_re))
+
+    if marker is not None:
+        # NOTE: the marker may have been deleted since it was listed
+        marker_instance = model_query(context, models.Instance,
+                                      session=session, read_deleted="yes",
+                                      project_only=True).\
+                                  filter_by(uuid=marker).\
+                                  first()
+        if not marker_instance:
+            raise exception.MarkerNotFound(marker=marker)
+        query_prefix = keyset_filter(query_prefix, models.Instance,
+                                     sort_key, sort_dir, marker_instance)
+
+    if limit is None:
+        instances = query_prefix.all()
+        for filter_name, filter_re in python_filters:
+            instances = [instance for instance in instances
+                         if _regexp_filter_by_column(instance, filter_name,
+                                                     filter_re)]
+        return instances
+
+    # The instances the database returns may not match the other filters,
+    # so read pages of limit instances until enough do.
+    instances = []
+    page_query = query_prefix
+    while len(instances) < limit:
+        page = page_query.limit(limit).all()
+        for instance in page:
+            if all(_regexp_filter_by_column(instance, filter_name,
+                                            filter_re)
+                   for filter_name, filter_re in python_filters):
+                instances.append(instance)
+        if len(page) < limit:
             break
-
-    return instances
+        page_query = keyset_filter(query_prefix, models.Instance,
+                                   sort_key, sort_dir, page[-1])
+    return instances[:limit]
 
 
 @require_context
-def instance_get_active_by_window(context, begin, end=None, project_id=None):
+def instance_get_active_by_window(context, begin, end=None, project_id=None,
+                                  use_slave=True):
     """Return instances that were active during window."""
-    session = get_session()
+    session = get_session(slave=use_slave)
     query = session.query(models.Instance)
 
     query = query.filter(or_(models.Instance.terminated_at == None,
@@ -1482,9 +1889,9 @@ def instance_get_active_by_window(context, begin, end=None, project_id=None):
 
 @require_admin_context
 def instance_get_active_by_window_joined(context, begin, end=None,
-                                         project_id=None):
+                                         project_id=None, use_slave=True):
     """Return instances and joins that were active during window."""
-    session = get_session()
+    session = get_session(slave=use_slave)
     query = session.query(models.Instance)
 
     query = query.options(joinedload('info_cache')).\
@@ -1511,7 +1918,13 @@ def _instance_get_all_query(context, project_only=False):
 
 
 @require_admin_context
-def instance_get_all_by_host(context, host):
+def instance_get_all_by_host(context, host, columns=None):
+    if columns:
+        columns = _instance_columns(columns)
+    if columns:
+        query = column_query(context, models.Instance, columns).\
+                        filter_by(host=host)
+        return column_rows(query, models.Instance, columns)
     return _instance_get_all_query(context).filter_by(host=host).all()
 
 
@@ -3378,13 +3791,20 @@ def _instance_type_get_query(context, session=None, read_deleted=None):
 
 
 @require_context
-def instance_type_get_all(context, inactive=False, filters=None):
+def instance_type_get_all(context, inactive=False, filters=None,
+                          limit=None, marker=None):
     """
-    Returns all instance types.
+    Returns all instance types, ordered by name.
+
+    When limit is given, at most limit instance types are returned. When
+    marker, the flavorid of an instance type, is given, only the instance
+    types after it are returned.
     """
     filters = filters or {}
     read_deleted = "yes" if inactive else "no"
-    query = _instance_type_get_query(context, read_deleted=read_deleted)
+    session = get_session()
+    query = _instance_type_get_query(context, session=session,
+                                     read_deleted=read_deleted)
 
     if 'min_memory_mb' in filters:
         query = query.filter(
@@ -3393,7 +3813,21 @@ def instance_type_get_all(context, inactive=False, filters=None):
         query = query.filter(
                 models.InstanceTypes.root_gb >= filters['min_root_gb'])
 
-    inst_types = query.order_by("name").all()
+    query = query.order_by(asc(models.InstanceTypes.name)).\
+                  order_by(asc(models.InstanceTypes.id))
+    if marker is not None:
+        marker_type = _instance_type_get_query(context, session=session,
+                                               read_deleted=read_deleted).\
+                              filter_by(flavorid=marker).\
+                              first()
+        if not marker_type:
+            raise exception.MarkerNotFound(marker=marker)
+        query = keyset_filter(query, models.InstanceTypes, 'name', 'asc',
+                              marker_type)
+    if limit is not None:
+        query = query.limit(limit)
+
+    inst_types = query.all()
 
     return [_dict_with_extra_specs(i) for i in inst_types]
 
@@ -0,0 +1,61 @@
+# Copyright 2012 OpenStack LLC.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from sqlalchemy import Boolean, Column, DateTime, Integer
+from sqlalchemy import Index, MetaData, String, Table
+from nova import log as logging
+
+LOG = logging.getLogger(__name__)
+
+
+def upgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+    #
+    # New Tables
+    #
+    resource_claims = Table('resource_claims', meta,
+            Column('created_at', DateTime(timezone=False)),
+            Column('updated_at', DateTime(timezone=False)),
+            Column('deleted_at', DateTime(timezone=False)),
+            Column('deleted', Boolean(create_constraint=True, name=None),
+                    default=False),
+            Column('id', Integer(), primary_key=True, nullable=False),
+            Column('host',
+                   String(length=255, convert_unicode=False,
+                          assert_unicode=None,
+                          unicode_error=None, _warn_on_bytestring=False)),
+            Column('instance_uuid', String(36)),
+            Column('memory_mb', Integer()),
+            Column('root_gb', Integer()),
+            Column('ephemeral_gb', Integer()),
+            Column('vcpus', Integer()),
+            Column('expires_at', DateTime(timezone=False)),
+            )
+    try:
+        resource_claims.create()
+    except Exception:
+        LOG.info(repr(resource_claims))
+
+    Index('resource_claims_instance_uuid_idx',
+          resource_claims.c.instance_uuid).create(migrate_engine)
+    Index('resource_claims_created_at_idx',
+          resource_claims.c.created_at).create(migrate_engine)
+
+
+def downgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+    resource_claims = Table('resource_claims', meta, autoload=True)
+    resource_claims.drop()
@@ -977,6 +977,20 @@ class InstanceFault(BASE, NovaBase):
     details = Column(Text)
 
 
+class ResourceClaim(BASE, NovaBase):
+    """Resources of a host claimed by a scheduler for an instance, until
+    the compute node accounts for them or the claim expires."""
+    __tablename__ = 'resource_claims'
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    host = Column(String(255))
+    instance_uuid = Column(String(36))
+    memory_mb = Column(Integer)
+    root_gb = Column(Integer)
+    ephemeral_gb = Column(Integer)
+    vcpus = Column(Integer)
+    expires_at = Column(DateTime)
+
+
 def register_models():
     """Register Models and create metadata.
 
@@ -1006,6 +1020,7 @@ def register_models():
               Migration,
               Network,
               Project,
+              ResourceClaim,
               SecurityGroup,
               SecurityGroupIngressRule,
               SecurityGroupInstanceAssociation,
@@ -18,12 +18,15 @@
 
 """Session Handling for SQLAlchemy backend."""
 
+import random
+import threading
 import time
 
+import sqlalchemy.event
 import sqlalchemy.interfaces
 import sqlalchemy.orm
 from sqlalchemy.exc import DisconnectionError, OperationalError
-from sqlalchemy.pool import NullPool, StaticPool
+from sqlalchemy.pool import NullPool, QueuePool, StaticPool
 
 import nova.exception
 import nova.flags as flags
@@ -35,17 +38,36 @@ LOG = logging.getLogger(__name__)
 
 _ENGINE = None
 _MAKER = None
+# The engines and session makers of the sql_slave_connections
+_SLAVE_ENGINES = {}
+_SLAVE_MAKERS = {}
+# The PoolMetrics of each engine, by connection url without password
+_POOL_METRICS = {}
 
 
-def get_session(autocommit=True, expire_on_commit=False):
-    """Return a SQLAlchemy session."""
-    global _MAKER
+def get_session(autocommit=True, expire_on_commit=False, slave=False):
+    """Return a SQLAlchemy session.
 
-    if _MAKER is None:
-        engine = get_engine()
-        _MAKER = get_maker(engine, autocommit, expire_on_commit)
+    When slave is True and sql_slave_connections are set, the session is
+    bound to one of those replicas picked at random. Its reads may not
+    see the latest writes, and it must not be used to write.
+    """
+    global _MAKER
 
-    session = _MAKER()
+    if slave and FLAGS.sql_slave_connections:
+        sql_connection = random.choice(FLAGS.sql_slave_connections)
+        maker = _SLAVE_MAKERS.get(sql_connection)
+        if maker is None:
+            engine = _get_slave_engine(sql_connection)
+            maker = get_maker(engine, autocommit, expire_on_commit)
+            _SLAVE_MAKERS[sql_connection] = maker
+    else:
+        if _MAKER is None:
+            engine = get_engine()
+            _MAKER = get_maker(engine, autocommit, expire_on_commit)
+        maker = _MAKER
+
+    session = maker()
     session.query = nova.exception.wrap_db_error(session.query)
     session.flush = nova.exception.wrap_db_error(session.flush)
     return session
@@ -65,11 +87,26 @@ class MySQLPingListener(object):
     Ensures that MySQL connections checked out of the
     pool are alive.
 
+    Only the connections which have been idle in the pool for
+    sql_ping_idle_time seconds are pinged, the others were used too
+    recently for the server to have dropped them.
+
     Borrowed from:
     http://groups.google.com/group/sqlalchemy/msg/a4ce563d802c929f
     """
 
+    def connect(self, dbapi_con, con_record):
+        con_record.info['checked_in_at'] = time.time()
+
+    def checkin(self, dbapi_con, con_record):
+        if con_record is not None:
+            con_record.info['checked_in_at'] = time.time()
+
     def checkout(self, dbapi_con, con_record, con_proxy):
+        checked_in_at = con_record.info.get('checked_in_at')
+        if (checked_in_at is not None and
+            time.time() - checked_in_at < FLAGS.sql_ping_idle_time):
+            return
         try:
             dbapi_con.cursor().execute('select 1')
         except dbapi_con.OperationalError, ex:
@@ -80,6 +117,85 @@ class MySQLPingListener(object):
                 raise
 
 
+class PoolMetrics(object):
+
+    """Counts the connections checked out of a pool and the time spent
+    waiting for them.
+
+    The counters are not locked and are only meant for monitoring.
+    """
+
+    def __init__(self):
+        self.checkouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.in_use = 0
+        self.max_in_use = 0
+
+    def add_wait(self, seconds):
+        self.wait_seconds += seconds
+        self.max_wait_seconds = max(self.max_wait_seconds, seconds)
+
+    def checkout(self, dbapi_con, con_record, con_proxy):
+        self.checkouts += 1
+        self.in_use += 1
+        self.max_in_use = max(self.max_in_use, self.in_use)
+
+    def checkin(self, dbapi_con, con_record):
+        self.in_use = max(self.in_use - 1, 0)
+
+    def stats(self):
+        return {'checkouts': self.checkouts,
+                'wait_seconds': self.wait_seconds,
+                'max_wait_seconds': self.max_wait_seconds,
+                'in_use': self.in_use,
+                'max_in_use': self.max_in_use}
+
+
+def _metered_pool_class(poolclass, metrics):
+    """Return a subclass of poolclass adding the time spent waiting for a
+    free connection of the pool to metrics.
+
+    The time spent opening new connections is not a wait for a free one
+    and is left out.
+    """
+
+    # The getting state of each greenthread, _do_get() may call itself
+    getting = threading.local()
+
+    class MeteredPool(poolclass):
+        def _create_connection(self):
+            start = time.time()
+            try:
+                return super(MeteredPool, self)._create_connection()
+            finally:
+                if getattr(getting, 'active', False):
+                    getting.connecting += time.time() - start
+
+        def _do_get(self):
+            if getattr(getting, 'active', False):
+                return super(MeteredPool, self)._do_get()
+            getting.active = True
+            getting.connecting = 0.0
+            start = time.time()
+            try:
+                return super(MeteredPool, self)._do_get()
+            finally:
+                getting.active = False
+                metrics.add_wait(max(time.time() - start -
+                                     getting.connecting, 0.0))
+
+    MeteredPool.__name__ = 'Metered%s' % poolclass.__name__
+    return MeteredPool
+
+
+def get_pool_stats():
+    """Return the connection pool counters of each engine created so far,
+    by connection url without password."""
+    return dict((url, metrics.stats())
+                for url, metrics in _POOL_METRICS.items())
+
+
 def is_db_connection_error(args):
     """Return True if error in connecting to db."""
     # NOTE(adam_g): This is currently MySQL specific and needs to be extended
@@ -95,58 +211,92 @@ def get_engine():
     """Return a SQLAlchemy engine."""
     global _ENGINE
     if _ENGINE is None:
-        connection_dict = sqlalchemy.engine.url.make_url(FLAGS.sql_connection)
-
-        engine_args = {
-            "pool_recycle": FLAGS.sql_idle_timeout,
-            "echo": False,
-            'convert_unicode': True,
-        }
-
-        # Map our SQL debug level to SQLAlchemy's options
-        if FLAGS.sql_connection_debug >= 100:
-            engine_args['echo'] = 'debug'
-        elif FLAGS.sql_connection_debug >= 50:
-            engine_args['echo'] = True
-
-        if "sqlite" in connection_dict.drivername:
-            engine_args["poolclass"] = NullPool
-
-            if FLAGS.sql_connection == "sqlite://":
-                engine_args["poolclass"] = StaticPool
-                engine_args["connect_args"] = {'check_same_thread': False}
-
-            if not FLAGS.sqlite_synchronous:
-                engine_args["listeners"] = [SynchronousSwitchListener()]
-
-        if 'mysql' in connection_dict.drivername:
-            engine_args['listeners'] = [MySQLPingListener()]
-
-        _ENGINE = sqlalchemy.create_engine(FLAGS.sql_connection, **engine_args)
+        _ENGINE = _create_engine(FLAGS.sql_connection)
+    return _ENGINE
 
-        try:
-            _ENGINE.connect()
-        except OperationalError, e:
-            if not is_db_connection_error(e.args[0]):
-                raise
 
-            remaining = FLAGS.sql_max_retries
-            if remaining == -1:
-                remaining = 'infinite'
-            while True:
-                msg = _('SQL connection failed. %s attempts left.')
-                LOG.warn(msg % remaining)
-                if remaining != 'infinite':
-                    remaining -= 1
-                time.sleep(FLAGS.sql_retry_interval)
-                try:
-                    _ENGINE.connect()
-                    break
-                except OperationalError, e:
-                    if (remaining != 'infinite' and remaining == 0) or \
-                       not is_db_connection_error(e.args[0]):
-                        raise
-    return _ENGINE
+def _get_slave_engine(sql_connection):
+    """Return the SQLAlchemy engine of a replica."""
+    engine = _SLAVE_ENGINES.get(sql_connection)
+    if engine is None:
+        engine = _create_engine(sql_connection)
+        _SLAVE_ENGINES[sql_connection] = engine
+    return engine
+
+
+def _create_engine(sql_connection):
+    """Return a new SQLAlchemy engine connected to sql_connection."""
+    connection_dict = sqlalchemy.engine.url.make_url(sql_connection)
+
+    engine_args = {
+        "pool_recycle": FLAGS.sql_idle_timeout,
+        "echo": False,
+        'convert_unicode': True,
+    }
+
+    # Map our SQL debug level to SQLAlchemy's options
+    if FLAGS.sql_connection_debug >= 100:
+        engine_args['echo'] = 'debug'
+    elif FLAGS.sql_connection_debug >= 50:
+        engine_args['echo'] = True
+
+    listeners = []
+    if "sqlite" in connection_dict.drivername:
+        poolclass = NullPool
+
+        if sql_connection == "sqlite://":
+            poolclass = StaticPool
+            engine_args["connect_args"] = {'check_same_thread': False}
+
+        if not FLAGS.sqlite_synchronous:
+            listeners.append(SynchronousSwitchListener())
+    else:
+        poolclass = QueuePool
+        engine_args['pool_size'] = FLAGS.sql_max_pool_size
+        engine_args['max_overflow'] = FLAGS.sql_max_overflow
+        engine_args['pool_timeout'] = FLAGS.sql_pool_timeout
+
+    if 'mysql' in connection_dict.drivername:
+        listeners.append(MySQLPingListener())
+
+    if listeners:
+        engine_args['listeners'] = listeners
+
+    metrics = PoolMetrics()
+    engine_args['poolclass'] = _metered_pool_class(poolclass, metrics)
+    if connection_dict.password:
+        connection_dict.password = '****'
+    _POOL_METRICS[str(connection_dict)] = metrics
+
+    engine = sqlalchemy.create_engine(sql_connection, **engine_args)
+    # NOTE: the metrics listen after the ping so that the checkouts
+    # retried after a failed ping are only counted once.
+    sqlalchemy.event.listen(engine, 'checkout', metrics.checkout)
+    sqlalchemy.event.listen(engine, 'checkin', metrics.checkin)
+
+    try:
+        engine.connect()
+    except OperationalError, e:
+        if not is_db_connection_error(e.args[0]):
+            raise
+
+        remaining = FLAGS.sql_max_retries
+        if remaining == -1:
+            remaining = 'infinite'
+        while True:
+            msg = _('SQL connection failed. %s attempts left.')
+            LOG.warn(msg % remaining)
+            if remaining != 'infinite':
+                remaining -= 1
+            time.sleep(FLAGS.sql_retry_interval)
+            try:
+                engine.connect()
+                break
+            except OperationalError, e:
+                if (remaining != 'infinite' and remaining == 0) or \
+                   not is_db_connection_error(e.args[0]):
+                    raise
+    return engine
 
 
 def get_maker(engine, autocommit=True, expire_on_commit=False):
@@ -772,6 +772,10 @@ class FlavorNotFound(NotFound):
     message = _("Flavor %(flavor_id)s could not be found.")
 
 
+class MarkerNotFound(NotFound):
+    message = _("Marker %(marker)s could not be found.")
+
+
 class CellNotFound(NotFound):
     message = _("Cell %(cell_id)s could not be found.")
 
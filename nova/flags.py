@@ -99,6 +99,11 @@ core_opts = [
                default='sqlite:///$state_path/$sqlite_db',
                help='The SQLAlchemy connection string used to connect to the '
                     'database'),
+    cfg.ListOpt('sql_slave_connections',
+                default=[],
+                help='SQLAlchemy connection strings of read-only replicas '
+                     'of the sql_connection database; the listings which '
+                     'can lag behind the writes are spread over them'),
     cfg.IntOpt('sql_connection_debug',
                default=0,
                help='Verbosity of SQL debugging information. 0=None, '
@@ -332,6 +337,23 @@ global_opts = [
     cfg.IntOpt('sql_retry_interval',
                default=10,
                help='interval between retries of opening a sql connection'),
+    cfg.IntOpt('sql_max_pool_size',
+               default=5,
+               help='Number of SQL connections kept open in the pool of '
+                    'each database other than sqlite'),
+    cfg.IntOpt('sql_max_overflow',
+               default=10,
+               help='Number of SQL connections opened beyond '
+                    'sql_max_pool_size while they are all in use'),
+    cfg.IntOpt('sql_pool_timeout',
+               default=30,
+               help='Seconds to wait for a SQL connection while they are '
+                    'all in use'),
+    cfg.IntOpt('sql_ping_idle_time',
+               default=30,
+               help='Seconds a MySQL connection must have been idle in the '
+                    'pool for to be pinged when checked out; 0 pings it on '
+                    'every checkout'),
     cfg.StrOpt('compute_manager',
                default='nova.compute.manager.ComputeManager',
                help='full class name for the Manager for compute'),
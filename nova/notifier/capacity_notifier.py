@@ -74,8 +74,15 @@ def notify(message):
               "ram %(free_ram_mb)d, disk %(free_disk_gb)d, "
               "work %(work)d, vms%(vms)d" % locals())
 
+    kwargs = {}
+    if ended and event in ('create', 'finish_resize'):
+        # The instance now runs on the host, which accounts for the
+        # resources the scheduler claimed for it.
+        kwargs['instance_uuid'] = message.get('payload', {}).get(
+                'instance_id')
+
     db.api.compute_node_utilization_update(context.get_admin_context(), host,
         free_ram_mb_delta=free_ram_mb, free_disk_gb_delta=free_disk_gb,
-        work_delta=work, vm_delta=vms)
+        work_delta=work, vm_delta=vms, **kwargs)
 
     return True
@@ -50,6 +50,12 @@ def get_service_capabilities(context):
     return _call_scheduler('get_service_capabilities', context)
 
 
+def get_scheduler_stats(context):
+    """Return the counters, histograms and last traces of the scheduling
+    requests."""
+    return _call_scheduler('get_scheduler_stats', context)
+
+
 def update_service_capabilities(context, service_name, host, capabilities):
     """Send an update to all the scheduler services informing them
        of the capabilities of this service."""
@@ -59,6 +65,22 @@ def update_service_capabilities(context, service_name, host, capabilities):
     return rpc.fanout_cast(context, 'scheduler', kwargs)
 
 
+def update_instance_usage(context, host, event, usage):
+    """Inform all the scheduler services that an instance was created
+       on or deleted from host. usage holds the memory_mb, root_gb,
+       ephemeral_gb and vcpus of the instance."""
+    kwargs = dict(method='update_instance_usage',
+                  args=dict(host=host, event=event, usage=usage))
+    return rpc.fanout_cast(context, 'scheduler', kwargs)
+
+
+def update_compute_node(context, host):
+    """Inform all the scheduler services that the compute node of host
+       was created or updated by its starting compute service."""
+    kwargs = dict(method='update_compute_node', args=dict(host=host))
+    return rpc.fanout_cast(context, 'scheduler', kwargs)
+
+
 def live_migration(context, block_migration, disk_over_commit,
                    instance_id, dest, topic):
     """Migrate a server to a new host"""
@@ -0,0 +1,177 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2012 OpenStack, LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+CapabilityStore keeps the capabilities reported by the services of each
+host, indexed so that neither expiring them nor rolling them up scans
+all of them.
+
+Reports are queued in the order they arrive, which is the order of their
+timestamps, so the stale ones are popped from the head of the queue; a
+report superseded by a newer one from the same service is dropped when
+it reaches the head. The <service>_<cap> min/max rollup is kept in a
+min-heap and a max-heap per key, updated as reports arrive and leave;
+entries of superseded reports are discarded lazily when they surface.
+"""
+
+import collections
+import heapq
+import itertools
+
+
+class _Reversed(object):
+    """Inverts the ordering of a value, for max-heaps."""
+
+    __slots__ = ['value']
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+
+class _Extremes(object):
+    """The min and max of the values of a capability across hosts."""
+
+    _seq = itertools.count()
+
+    def __init__(self):
+        self.values = {}  # { host : (seq, value) }
+        self._min_heap = []
+        self._max_heap = []
+
+    def __len__(self):
+        return len(self.values)
+
+    def add(self, host, value):
+        seq = self._seq.next()
+        self.values[host] = (seq, value)
+        heapq.heappush(self._min_heap, (value, seq, host))
+        heapq.heappush(self._max_heap, (_Reversed(value), seq, host))
+        if len(self._min_heap) > 2 * len(self.values) + 16:
+            self._compact()
+
+    def remove(self, host):
+        del self.values[host]
+
+    def _compact(self):
+        """Rebuilds the heaps without the entries of old values."""
+        self._min_heap = [(value, seq, host)
+                          for host, (seq, value) in self.values.iteritems()]
+        self._max_heap = [(_Reversed(value), seq, host)
+                          for value, seq, host in self._min_heap]
+        heapq.heapify(self._min_heap)
+        heapq.heapify(self._max_heap)
+
+    def _top(self, heap):
+        while True:
+            _value, seq, host = heap[0]
+            if self.values.get(host, (None,))[0] == seq:
+                return heap[0]
+            heapq.heappop(heap)
+
+    def min_max(self):
+        return (self._top(self._min_heap)[0],
+                self._top(self._max_heap)[0].value)
+
+
+class CapabilityStore(object):
+    """Capabilities of the services of each host, with their rollup."""
+
+    def __init__(self, service_states=None):
+        self.load(service_states or {})
+
+    def load(self, service_states):
+        """Uses service_states, { <host> : { <service> : { cap k : v }}},
+        as the store, indexing the capabilities it holds."""
+        self.service_states = service_states
+        self._extremes = {}  # { <service>_<cap> : _Extremes }
+        self._reports = collections.deque()
+        reports = []
+        for host, host_dict in service_states.iteritems():
+            for service_name, capabilities in host_dict.iteritems():
+                self._add(host, service_name, capabilities)
+                if 'timestamp' in capabilities:
+                    reports.append((capabilities['timestamp'], host,
+                                    service_name, capabilities))
+        reports.sort(key=lambda report: report[0])
+        self._reports.extend(reports)
+
+    def _add(self, host, service_name, capabilities):
+        if not capabilities.get("enabled", True):
+            # Service is disabled; do no include it
+            return
+        for cap, value in capabilities.iteritems():
+            if cap == "timestamp":  # Timestamp is not needed
+                continue
+            key = "%s_%s" % (service_name, cap)
+            extremes = self._extremes.get(key)
+            if extremes is None:
+                extremes = self._extremes[key] = _Extremes()
+            extremes.add(host, value)
+
+    def _discard(self, host, service_name, capabilities):
+        if not capabilities.get("enabled", True):
+            return
+        for cap in capabilities:
+            if cap == "timestamp":
+                continue
+            key = "%s_%s" % (service_name, cap)
+            extremes = self._extremes[key]
+            extremes.remove(host)
+            if not extremes:
+                del self._extremes[key]
+
+    def update(self, host, service_name, capabilities):
+        """Stores the capabilities a service reported, with their
+        timestamp, replacing its previous report."""
+        service_caps = self.service_states.setdefault(host, {})
+        old_capabilities = service_caps.get(service_name)
+        if old_capabilities is not None:
+            self._discard(host, service_name, old_capabilities)
+        service_caps[service_name] = capabilities
+        self._add(host, service_name, capabilities)
+        self._reports.append((capabilities['timestamp'], host,
+                              service_name, capabilities))
+
+    def remove(self, host, service_name):
+        """Drops the capabilities of a service."""
+        service_caps = self.service_states[host]
+        capabilities = service_caps.pop(service_name)
+        self._discard(host, service_name, capabilities)
+        if len(service_caps) == 0:  # Delete host if no services
+            del self.service_states[host]
+
+    def pop_expired(self, cutoff):
+        """Returns the services whose last report is older than cutoff,
+        as { host : [service, ...] }, for the caller to remove.
+        """
+        expired = {}
+        reports = self._reports
+        while reports and reports[0][0] < cutoff:
+            _timestamp, host, service_name, capabilities = reports.popleft()
+            current = self.service_states.get(host, {}).get(service_name)
+            if current is capabilities:
+                expired.setdefault(host, []).append(service_name)
+        return expired
+
+    def rollup(self):
+        """Returns { <service>_<cap> : (min, max) } over the enabled
+        services."""
+        return dict((key, extremes.min_max())
+                    for key, extremes in self._extremes.iteritems())
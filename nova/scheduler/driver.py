@@ -31,6 +31,7 @@ from nova import log as logging
 from nova.openstack.common import cfg
 from nova import rpc
 from nova.rpc import common as rpc_common
+from nova.scheduler import stats
 from nova import utils
 
 
@@ -133,6 +134,7 @@ class Scheduler(object):
         self.host_manager = utils.import_object(
                 FLAGS.scheduler_host_manager)
         self.compute_api = compute_api.API()
+        self.stats = stats.SchedulerStats()
 
     def get_host_list(self):
         """Get a list of hosts from the HostManager."""
@@ -143,11 +145,29 @@ class Scheduler(object):
         """
         return self.host_manager.get_service_capabilities()
 
+    def set_shard(self, shard):
+        """Set the scheduler shard this driver schedules on the hosts
+        of."""
+        self.host_manager.set_shard(shard)
+
+    def get_scheduler_stats(self):
+        """Get the counters, histograms and last traces of the
+        scheduling requests."""
+        return self.stats.snapshot()
+
     def update_service_capabilities(self, service_name, host, capabilities):
         """Process a capability update from a service node."""
         self.host_manager.update_service_capabilities(service_name,
                 host, capabilities)
 
+    def update_instance_usage(self, host, event, usage):
+        """Process an instance create/delete event from a compute node."""
+        self.host_manager.update_instance_usage(host, event, usage)
+
+    def update_compute_node(self, host):
+        """Process a compute node update from a starting compute node."""
+        self.host_manager.update_compute_node(host)
+
     def hosts_up(self, context, topic):
         """Return the list of hosts that have a running service for topic."""
 
@@ -176,6 +196,19 @@ class Scheduler(object):
         base_options['uuid'] = instance['uuid']
         return instance
 
+    def create_instance_db_entries(self, context, request_spec,
+                                   base_options_list):
+        """Create the instance DB entries of base_options_list, a list of
+        instance_properties of request_spec, in bulk"""
+        image = request_spec['image']
+        instance_type = request_spec.get('instance_type')
+        security_group = request_spec.get('security_group', 'default')
+        block_device_mapping = request_spec.get('block_device_mapping', [])
+
+        return self.compute_api.create_db_entries_for_new_instances(
+                context, instance_type, image, base_options_list,
+                security_group, block_device_mapping)
+
     def schedule(self, context, topic, method, *_args, **_kwargs):
         """Must override schedule method for scheduler to work."""
         raise NotImplementedError(_("Must implement a fallback schedule"))
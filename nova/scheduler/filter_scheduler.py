@@ -19,6 +19,7 @@ You can customize this scheduler by specifying your own Host Filters and
 Weighing Functions.
 """
 
+import heapq
 import operator
 
 # dkang
@@ -32,29 +33,25 @@ from nova.notifier import api as notifier
 from nova.scheduler import driver
 from nova.scheduler import least_cost
 from nova.scheduler import scheduler_options
+from nova.scheduler import stats
+from nova.scheduler import vectorized
 from nova import utils
 
 
 FLAGS = flags.FLAGS
 # dkang
-simple_scheduler_opts = [
-    cfg.IntOpt("max_cores",
-               default=16,
-               help="maximum number of instance cores to allow per host"),
-    cfg.IntOpt("max_gigabytes",
-               default=10000,
-               help="maximum number of volume gigabytes to allow per host"),
-    cfg.IntOpt("max_networks",
-               default=1000,
-               help="maximum number of networks to allow per host"),
-    cfg.BoolOpt('skip_isolated_core_check',
-                default=True,
-                help='Allow overcommitting vcpus on isolated hosts'),
+flags.DECLARE('max_gigabytes', 'nova.scheduler.simple')
+#!dkang
+
+filter_scheduler_opts = [
+    cfg.BoolOpt('scheduler_batch_placement',
+                default=False,
+                help='Place all the instances of a request in one pass over '
+                     'the filtered hosts, then create their DB entries and '
+                     'cast them to their compute hosts in bulk'),
     ]
 
-FLAGS = flags.FLAGS
-FLAGS.register_opts(simple_scheduler_opts)
-#!dkang
+FLAGS.register_opts(filter_scheduler_opts)
 LOG = logging.getLogger(__name__)
 
 
@@ -64,6 +61,9 @@ class FilterScheduler(driver.Scheduler):
         super(FilterScheduler, self).__init__(*args, **kwargs)
         self.cost_function_cache = {}
         self.options = scheduler_options.SchedulerOptions()
+        if FLAGS.scheduler_vectorized_engine and not vectorized.is_available():
+            LOG.warn(_("numpy could not be imported; the vectorized "
+                       "engine is disabled"))
 
     def schedule(self, context, topic, method, *args, **kwargs):
         """The schedule() contract requires we return the one
@@ -101,6 +101,15 @@ class FilterScheduler(driver.Scheduler):
         # contains an instance of RpcContext that cannot be serialized.
         kwargs.pop('filter_properties', None)
 
+        if (FLAGS.scheduler_batch_placement and
+            not request_spec['instance_properties'].get('uuid')):
+            instances = self._provision_resources(elevated,
+                    weighted_hosts[:num_instances], request_spec, kwargs)
+            notifier.notify(notifier.publisher_id("scheduler"),
+                            'scheduler.run_instance.end', notifier.INFO,
+                            payload)
+            return instances
+
         instances = []
         for num in xrange(num_instances):
             if not weighted_hosts:
@@ -136,6 +145,10 @@ class FilterScheduler(driver.Scheduler):
         # contains an instance of RpcContext that cannot be serialized.
         kwargs.pop('filter_properties', None)
 
+        self.host_manager.claim_resources(context.elevated(),
+                [(host.host_state.host, kwargs.get('instance_uuid'))],
+                request_spec['instance_properties'])
+
         # Forward off to the host
         driver.cast_to_compute_host(context, host.host_state.host,
                 'prep_resize', **kwargs)
@@ -144,6 +157,9 @@ class FilterScheduler(driver.Scheduler):
             kwargs):
         """Create the requested resource in this Zone."""
         instance = self.create_instance_db_entry(context, request_spec)
+        self.host_manager.claim_resources(context,
+                [(weighted_host.host_state.host, instance['uuid'])],
+                request_spec['instance_properties'])
 
         payload = dict(request_spec=request_spec,
                        weighted_host=weighted_host.to_dict(),
@@ -161,6 +177,42 @@ class FilterScheduler(driver.Scheduler):
         del request_spec['instance_properties']['uuid']
         return inst
 
+    def _provision_resources(self, context, weighted_hosts, request_spec,
+            kwargs):
+        """Create the requested resources on weighted_hosts, one instance
+        per host in the list, creating the DB entries in bulk."""
+        now = utils.utcnow()
+        base_options_list = []
+        for num, weighted_host in enumerate(weighted_hosts):
+            base_options = dict(request_spec['instance_properties'])
+            base_options.update(launch_index=num,
+                                host=weighted_host.host_state.host,
+                                scheduled_at=now)
+            base_options_list.append(base_options)
+        instances = self.create_instance_db_entries(context, request_spec,
+                                                    base_options_list)
+        self.host_manager.claim_resources(context,
+                [(weighted_host.host_state.host, instance['uuid'])
+                 for weighted_host, instance in zip(weighted_hosts,
+                                                    instances)],
+                request_spec['instance_properties'])
+
+        for weighted_host, instance in zip(weighted_hosts, instances):
+            payload = dict(request_spec=request_spec,
+                           weighted_host=weighted_host.to_dict(),
+                           instance_id=instance['uuid'])
+            notifier.notify(notifier.publisher_id("scheduler"),
+                            'scheduler.run_instance.scheduled', notifier.INFO,
+                            payload)
+        # NOTE: the host of the instances was set when they were created
+        for weighted_host, instance in zip(weighted_hosts, instances):
+            driver.cast_to_compute_host(context,
+                    weighted_host.host_state.host, 'run_instance',
+                    update_db=False, instance_uuid=instance['uuid'],
+                    **kwargs)
+        return [driver.encode_instance(instance, local=True)
+                for instance in instances]
+
     def _get_configuration_options(self):
         """Fetch options dictionary. Broken out for testing."""
         return self.options.get_configuration()
@@ -180,6 +232,24 @@ class FilterScheduler(driver.Scheduler):
             msg = _("Scheduler only understands Compute nodes (for now)")
             raise NotImplementedError(msg)
 
+        num_instances = request_spec.get('num_instances', 1)
+        selected_hosts = None
+        trace = self.stats.start_request()
+        try:
+            selected_hosts = self._select_hosts(context, elevated, topic,
+                    request_spec, num_instances, trace, **kwargs)
+            return selected_hosts
+        finally:
+            # NOTE: failed requests are recorded too
+            if selected_hosts is None:
+                trace.finish(num_instances, 0, failed=True)
+            else:
+                trace.finish(num_instances, len(selected_hosts))
+
+    def _select_hosts(self, context, elevated, topic, request_spec,
+                      num_instances, trace, **kwargs):
+        """Returns the hosts selected by _schedule(), adding the time
+        spent in each step to trace."""
         instance_properties = request_spec['instance_properties']
         instance_type = request_spec.get("instance_type", None)
 
@@ -201,20 +271,41 @@ class FilterScheduler(driver.Scheduler):
         # selections can adjust accordingly.
 
         # unfiltered_hosts_dict is {host : ZoneManager.HostInfo()}
-        unfiltered_hosts_dict = self.host_manager.get_all_host_states(
-                elevated, topic)
+        unfiltered_hosts_dict = trace.timed('get_all_host_states',
+                self.host_manager.get_all_host_states, elevated, topic)
+
+        if FLAGS.scheduler_vectorized_engine and vectorized.is_available():
+            host_arrays = vectorized.HostArrays(
+                    unfiltered_hosts_dict.itervalues())
+            # NOTE: the cost functions are not wrapped by the trace, as
+            # the engine looks up their vectorized versions by identity.
+            filter_fns = trace.filter_fns(
+                    self.host_manager._choose_host_filters(None))
+            selected_hosts = vectorized.select_hosts(host_arrays,
+                    filter_fns, cost_functions, filter_properties,
+                    instance_properties, num_instances)
+            selected_hosts.sort(key=operator.attrgetter('weight'))
+            return selected_hosts
+
+        cost_functions = trace.cost_functions(cost_functions)
 
         # Note: remember, we are using an iterator here. So only
         # traverse this list once. This can bite you if the hosts
         # are being scanned in a filter or weighing function.
         hosts = unfiltered_hosts_dict.itervalues()
 
-        num_instances = request_spec.get('num_instances', 1)
+        if FLAGS.scheduler_batch_placement:
+            selected_hosts = self._place_batch(hosts, filter_properties,
+                    cost_functions, instance_properties, num_instances,
+                    trace=trace)
+            selected_hosts.sort(key=operator.attrgetter('weight'))
+            return selected_hosts
+
         selected_hosts = []
         for num in xrange(num_instances):
             # Filter local hosts based on requirements ...
             hosts = self.host_manager.filter_hosts(hosts,
-                    filter_properties)
+                    filter_properties, trace=trace)
             if not hosts:
                 # Can't get any more locally.
                 break
@@ -240,6 +331,41 @@ class FilterScheduler(driver.Scheduler):
         selected_hosts.sort(key=operator.attrgetter('weight'))
         return selected_hosts[:num_instances]
 
+    def _place_batch(self, hosts, filter_properties, cost_functions,
+                     instance_properties, num_instances,
+                     trace=stats.NULL_TRACE):
+        """Returns up to num_instances WeightedHosts picked like the loop
+        in _schedule() does, in a single pass over the hosts.
+
+        The hosts are filtered and weighed once and kept in a heap by
+        weight. Consuming an instance only changes the host it was placed
+        on, so only that host is filtered and weighed again before it is
+        pushed back onto the heap.
+        """
+        filter_fns = trace.filter_fns(
+                self.host_manager._choose_host_filters(None))
+        hosts = self.host_manager.filter_hosts(hosts, filter_properties,
+                                               trace=trace)
+        LOG.debug(_("Filtered %d hosts"), len(hosts))
+
+        heap = [(least_cost.weighted_score(cost_functions, host_state,
+                                           filter_properties),
+                 idx, host_state)
+                for idx, host_state in enumerate(hosts)]
+        heapq.heapify(heap)
+
+        selected_hosts = []
+        while heap and len(selected_hosts) < num_instances:
+            weight, idx, host_state = heapq.heappop(heap)
+            selected_hosts.append(least_cost.WeightedHost(weight,
+                    host_state=host_state))
+            host_state.consume_from_instance(instance_properties)
+            if host_state.passes_filters(filter_fns, filter_properties):
+                weight = least_cost.weighted_score(cost_functions,
+                        host_state, filter_properties)
+                heapq.heappush(heap, (weight, idx, host_state))
+        return selected_hosts
+
     def get_cost_functions(self, topic=None):
         """Returns a list of tuples containing weights and cost functions to
         use for weighing hosts
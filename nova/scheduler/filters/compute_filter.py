@@ -115,3 +115,15 @@ class ComputeFilter(filters.BaseHostFilter):
                     "requirements"), locals())
             return False
         return True
+
+    def host_mask(self, host_arrays, filter_properties):
+        """host_passes for all hosts of a vectorized.HostArrays, or None
+        for instance types with extra_specs, which are matched per host."""
+        instance_type = filter_properties.get('instance_type')
+        if not instance_type:
+            return True
+        if instance_type.get('extra_specs'):
+            return None
+        return ~host_arrays.is_compute | (host_arrays.services_up() &
+                                          ~host_arrays.disabled &
+                                          host_arrays.enabled)
@@ -48,3 +48,20 @@ class CoreFilter(filters.BaseHostFilter):
         instance_vcpus = instance_type['vcpus']
         vcpus_total = host_state.vcpus_total * FLAGS.cpu_allocation_ratio
         return (vcpus_total - host_state.vcpus_used) >= instance_vcpus
+
+    def host_mask(self, host_arrays, filter_properties):
+        """host_passes for all hosts of a vectorized.HostArrays."""
+        instance_type = filter_properties.get('instance_type')
+        if not instance_type:
+            return True
+
+        unset = host_arrays.vcpus_total == 0
+        if unset.any():
+            # Fail safe
+            LOG.warning(_("VCPUs not set on %d hosts; assuming CPU "
+                          "collection broken"), unset.sum())
+
+        instance_vcpus = instance_type['vcpus']
+        vcpus_total = host_arrays.vcpus_total * FLAGS.cpu_allocation_ratio
+        return (~host_arrays.is_compute | unset |
+                ((vcpus_total - host_arrays.vcpus_used) >= instance_vcpus))
@@ -14,115 +14,202 @@
 #    under the License.
 
 
+"""
+JSON query host filter.
+
+A query is compiled once into a tree of closures, with the capability
+lookups split into their attribute and keys and the constant parts
+evaluated up front; the compiled queries are kept in an LRU cache keyed
+on the query string, so filtering a host only runs the lookups and
+comparisons of the query.
+"""
+
 import json
 import operator
 
+from nova import flags
+from nova.openstack.common import cfg
 from nova.scheduler import filters
+from nova import utils
 
 
-class JsonFilter(filters.BaseHostFilter):
-    """Host Filter to allow simple JSON-based grammar for
-    selecting hosts.
+json_filter_opts = [
+    cfg.IntOpt('scheduler_json_filter_cache_size',
+               default=128,
+               help='Number of compiled JsonFilter queries to keep'),
+    ]
+
+FLAGS = flags.FLAGS
+FLAGS.register_opts(json_filter_opts)
+
+
+def _op_compare(args, op):
+    """Returns True if the specified operator can successfully
+    compare the first item in the args with all the rest. Will
+    return False if only one item is in the list.
     """
-    def _op_compare(self, args, op):
-        """Returns True if the specified operator can successfully
-        compare the first item in the args with all the rest. Will
-        return False if only one item is in the list.
-        """
-        if len(args) < 2:
-            return False
-        if op is operator.contains:
-            bad = not args[0] in args[1:]
-        else:
-            bad = [arg for arg in args[1:]
-                    if not op(args[0], arg)]
-        return not bool(bad)
-
-    def _equals(self, args):
-        """First term is == all the other terms."""
-        return self._op_compare(args, operator.eq)
-
-    def _less_than(self, args):
-        """First term is < all the other terms."""
-        return self._op_compare(args, operator.lt)
-
-    def _greater_than(self, args):
-        """First term is > all the other terms."""
-        return self._op_compare(args, operator.gt)
-
-    def _in(self, args):
-        """First term is in set of remaining terms"""
-        return self._op_compare(args, operator.contains)
-
-    def _less_than_equal(self, args):
-        """First term is <= all the other terms."""
-        return self._op_compare(args, operator.le)
-
-    def _greater_than_equal(self, args):
-        """First term is >= all the other terms."""
-        return self._op_compare(args, operator.ge)
-
-    def _not(self, args):
-        """Flip each of the arguments."""
-        return [not arg for arg in args]
-
-    def _or(self, args):
-        """True if any arg is True."""
-        return any(args)
-
-    def _and(self, args):
-        """True if all args are True."""
-        return all(args)
-
-    commands = {
-        '=': _equals,
-        '<': _less_than,
-        '>': _greater_than,
-        'in': _in,
-        '<=': _less_than_equal,
-        '>=': _greater_than_equal,
-        'not': _not,
-        'or': _or,
-        'and': _and,
-    }
-
-    def _parse_string(self, string, host_state):
-        """Strings prefixed with $ are capability lookups in the
-        form '$variable' where 'variable' is an attribute in the
-        HostState class.  If $variable is a dictionary, you may
-        use: $variable.dictkey
-        """
-        if not string:
-            return None
-        if not string.startswith("$"):
-            return string
-
-        path = string[1:].split(".")
-        obj = getattr(host_state, path[0], None)
-        if obj is None:
-            return None
-        for item in path[1:]:
-            obj = obj.get(item, None)
+    if len(args) < 2:
+        return False
+    if op is operator.contains:
+        bad = not args[0] in args[1:]
+    else:
+        bad = [arg for arg in args[1:]
+                if not op(args[0], arg)]
+    return not bool(bad)
+
+
+def _equals(args):
+    """First term is == all the other terms."""
+    return _op_compare(args, operator.eq)
+
+
+def _less_than(args):
+    """First term is < all the other terms."""
+    return _op_compare(args, operator.lt)
+
+
+def _greater_than(args):
+    """First term is > all the other terms."""
+    return _op_compare(args, operator.gt)
+
+
+def _in(args):
+    """First term is in set of remaining terms"""
+    return _op_compare(args, operator.contains)
+
+
+def _less_than_equal(args):
+    """First term is <= all the other terms."""
+    return _op_compare(args, operator.le)
+
+
+def _greater_than_equal(args):
+    """First term is >= all the other terms."""
+    return _op_compare(args, operator.ge)
+
+
+def _not(args):
+    """Flip each of the arguments."""
+    return [not arg for arg in args]
+
+
+def _or(args):
+    """True if any arg is True."""
+    return any(args)
+
+
+def _and(args):
+    """True if all args are True."""
+    return all(args)
+
+
+commands = {
+    '=': _equals,
+    '<': _less_than,
+    '>': _greater_than,
+    'in': _in,
+    '<=': _less_than_equal,
+    '>=': _greater_than_equal,
+    'not': _not,
+    'or': _or,
+    'and': _and,
+}
+
+
+def _constant(value):
+    return lambda host_state: value
+
+
+def _lookup(string):
+    """Compiles a capability lookup in the form '$variable' where
+    'variable' is an attribute in the HostState class.  If $variable is
+    a dictionary, you may use: $variable.dictkey
+    """
+    path = string[1:].split(".")
+    attr = path[0]
+    keys = path[1:]
+
+    def lookup(host_state):
+        obj = getattr(host_state, attr, None)
+        for key in keys:
             if obj is None:
                 return None
+            obj = obj.get(key, None)
         return obj
+    return lookup
+
+
+def _compile(query):
+    """Returns (fn, constant) for a parsed query, where fn(host_state)
+    evaluates it and constant tells whether it depends on the host."""
+    if not query:
+        return _constant(True), True
+    method = commands[query[0]]
+    getters = []
+    constant = True
+    for arg in query[1:]:
+        if isinstance(arg, list):
+            getter, arg_constant = _compile(arg)
+            if arg_constant:
+                getter = _constant(getter(None))
+            constant = constant and arg_constant
+        elif isinstance(arg, basestring):
+            if not arg:
+                continue
+            if arg.startswith("$"):
+                getter = _lookup(arg)
+                constant = False
+            else:
+                getter = _constant(arg)
+        elif arg is None:
+            continue
+        else:
+            getter = _constant(arg)
+        getters.append(getter)
 
-    def _process_filter(self, query, host_state):
-        """Recursively parse the query structure."""
-        if not query:
-            return True
-        cmd = query[0]
-        method = self.commands[cmd]
-        cooked_args = []
-        for arg in query[1:]:
-            if isinstance(arg, list):
-                arg = self._process_filter(arg, host_state)
-            elif isinstance(arg, basestring):
-                arg = self._parse_string(arg, host_state)
+    def evaluate(host_state):
+        args = []
+        for getter in getters:
+            arg = getter(host_state)
             if arg is not None:
-                cooked_args.append(arg)
-        result = method(self, cooked_args)
-        return result
+                args.append(arg)
+        return method(args)
+
+    if constant:
+        return _constant(evaluate(None)), True
+    return evaluate, False
+
+
+def compile_query(query):
+    """Compiles a parsed query into a function of a host state returning
+    the result of the query for that host.
+
+    Raises KeyError for unknown commands.
+    """
+    return _compile(query)[0]
+
+
+_compiled_queries = utils.OrderedDict()
+
+
+def get_compiled_query(query):
+    """Returns the compiled form of a JSON query string, from an LRU
+    cache of scheduler_json_filter_cache_size queries."""
+    try:
+        compiled = _compiled_queries.pop(query)
+    except KeyError:
+        compiled = compile_query(json.loads(query))
+        cache_size = FLAGS.scheduler_json_filter_cache_size
+        while _compiled_queries and len(_compiled_queries) >= cache_size:
+            _compiled_queries.popitem(last=False)
+    _compiled_queries[query] = compiled
+    return compiled
+
+
+class JsonFilter(filters.BaseHostFilter):
+    """Host Filter to allow simple JSON-based grammar for
+    selecting hosts.
+    """
 
     def host_passes(self, host_state, filter_properties):
         """Return a list of hosts that can fulfill the requirements
@@ -138,7 +225,7 @@ class JsonFilter(filters.BaseHostFilter):
         # NOTE(comstud): Not checking capabilities or service for
         # enabled/disabled so that a provided json filter can decide
 
-        result = self._process_filter(json.loads(query), host_state)
+        result = get_compiled_query(query)(host_state)
         if isinstance(result, list):
             # If any succeeded, include the host
             result = any(result)
@@ -38,3 +38,10 @@ class RamFilter(filters.BaseHostFilter):
         requested_ram = instance_type['memory_mb']
         free_ram_mb = host_state.free_ram_mb
         return free_ram_mb * FLAGS.ram_allocation_ratio >= requested_ram
+
+    def host_mask(self, host_arrays, filter_properties):
+        """host_passes for all hosts of a vectorized.HostArrays."""
+        instance_type = filter_properties.get('instance_type')
+        requested_ram = instance_type['memory_mb']
+        free_ram_mb = host_arrays.free_ram_mb
+        return free_ram_mb * FLAGS.ram_allocation_ratio >= requested_ram
@@ -0,0 +1,55 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2012 OpenStack, LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Consistent hashing of keys, such as compute host names, to nodes, such
+as scheduler shards.
+
+Each node is placed at `replicas` points of a hash ring and a key maps to
+the node of the first point at or after its hash, so adding or removing a
+node only moves the keys of its own points.
+"""
+
+import bisect
+import hashlib
+
+
+class HashRing(object):
+    """Maps keys to a set of nodes by consistent hashing."""
+
+    def __init__(self, nodes, replicas=100):
+        self.nodes = list(nodes)
+        points = []
+        for node in self.nodes:
+            for idx in xrange(replicas):
+                points.append((self._hash('%s-%d' % (node, idx)), node))
+        points.sort()
+        self._hashes = [point_hash for point_hash, _node in points]
+        self._nodes = [node for _point_hash, node in points]
+
+    @staticmethod
+    def _hash(key):
+        if isinstance(key, unicode):
+            key = key.encode('utf-8')
+        return int(hashlib.md5(key).hexdigest()[:8], 16)
+
+    def get_node(self, key):
+        """Returns the node key maps to, or None if there are none."""
+        if not self._nodes:
+            return None
+        idx = bisect.bisect_left(self._hashes, self._hash(key))
+        return self._nodes[idx % len(self._nodes)]
@@ -25,7 +25,10 @@ from nova import exception
 from nova import flags
 from nova import log as logging
 from nova.openstack.common import cfg
+from nova.scheduler import capability_store
 from nova.scheduler import filters
+from nova.scheduler import hash_ring
+from nova.scheduler import stats
 from nova import utils
 
 
@@ -50,6 +53,40 @@ host_manager_opts = [
                   ],
                 help='Which filter class names to use for filtering hosts '
                       'when not specified in the request.'),
+    cfg.IntOpt('scheduler_host_state_reconcile_interval',
+               default=600,
+               help='Seconds between rebuilds of the cached host states '
+                    'from the compute nodes and instances in the database. '
+                    '0 rebuilds them for every request'),
+    cfg.IntOpt('scheduler_service_refresh_interval',
+               default=10,
+               help='Seconds between refreshes of the service records, '
+                    'heartbeats and disabled flags, of the cached host '
+                    'states'),
+    cfg.ListOpt('scheduler_shards',
+                default=[],
+                help='Hosts of the scheduler workers among which the '
+                     'compute hosts are partitioned by consistent hashing; '
+                     'empty to have every scheduler keep every host'),
+    cfg.IntOpt('scheduler_shard_replicas',
+               default=100,
+               help='Points of each scheduler shard on the hash ring'),
+    cfg.BoolOpt('scheduler_resource_claims',
+                default=False,
+                help='Record the resources picked on a host for each '
+                     'instance in the database, for the other schedulers '
+                     'to consume from their cached host states, when '
+                     'several schedulers place instances on the same hosts'),
+    cfg.IntOpt('scheduler_resource_claim_ttl',
+               default=300,
+               help='Seconds a resource claim is kept if its compute node '
+                    'does not account for the instance'),
+    cfg.IntOpt('scheduler_resource_claim_sync_overlap',
+               default=60,
+               help='Seconds before its last look from which a scheduler '
+                    'reads the resource claims of the other schedulers '
+                    'again, to catch the claims committed late or made by '
+                    'schedulers whose clock lags behind'),
     ]
 
 FLAGS = flags.FLAGS
@@ -57,6 +94,11 @@ FLAGS.register_opts(host_manager_opts)
 
 LOG = logging.getLogger(__name__)
 
+# The columns of the instances read to consume their resources from the
+# host states; the rest of the instance is not needed.
+INSTANCE_USAGE_COLUMNS = ['uuid', 'host', 'memory_mb', 'root_gb',
+                          'ephemeral_gb', 'vcpus']
+
 
 class ReadOnlyDict(UserDict.IterableUserDict):
     """A read-only dict."""
@@ -137,6 +179,15 @@ class HostState(object):
         self.free_disk_mb -= disk_mb
         self.vcpus_used += vcpus
 
+    def release_from_instance(self, instance):
+        """Give back the resources consumed by an instance."""
+        disk_mb = (instance['root_gb'] + instance['ephemeral_gb']) * 1024
+        ram_mb = instance['memory_mb']
+        vcpus = instance['vcpus']
+        self.free_ram_mb += ram_mb
+        self.free_disk_mb += disk_mb
+        self.vcpus_used -= vcpus
+
     def passes_filters(self, filter_fns, filter_properties):
         """Return whether or not this host passes filters."""
 
@@ -175,9 +226,42 @@ class HostManager(object):
     host_state_cls = HostState
 
     def __init__(self):
-        self.service_states = {}  # { <host> : { <service> : { cap k : v }}}
+        self.capability_store = capability_store.CapabilityStore()
         self.filter_classes = filters.get_filter_classes(
                 FLAGS.scheduler_available_filters)
+        # Resident compute host states, see get_all_host_states()
+        self.host_state_map = {}
+        self.host_states_built_at = None
+        self.services_refreshed_at = None
+        # The scheduler shard this host manager keeps the hosts of
+        self.shard = None
+        self.hash_ring = None
+        # Time of the last look at the resource claims and of the last
+        # rebuild from the db, and creation time of the claims made here
+        # or consumed since then by id, see _apply_new_claims()
+        self.claims_synced_at = None
+        self.claims_rebuilt_at = None
+        self.seen_claims = {}
+
+    def set_shard(self, shard):
+        """Only keep the compute hosts which map to shard among the
+        scheduler_shards, if they are set."""
+        if not FLAGS.scheduler_shards:
+            return
+        if shard not in FLAGS.scheduler_shards:
+            LOG.warn(_("Scheduler %(shard)s is not one of the "
+                       "scheduler_shards, it owns no hosts") % locals())
+        self.shard = shard
+        self.hash_ring = hash_ring.HashRing(FLAGS.scheduler_shards,
+                                           FLAGS.scheduler_shard_replicas)
+        self.host_state_map = {}
+        self.host_states_built_at = None
+
+    def owns_host(self, host):
+        """Returns whether host belongs to the shard of this host
+        manager."""
+        return (self.hash_ring is None or
+                self.hash_ring.get_node(host) == self.shard)
 
     def _choose_host_filters(self, filters):
         """Since the caller may specify which filters to use we need
@@ -210,10 +294,11 @@ class HostManager(object):
             raise exception.SchedulerHostFilterNotFound(filter_name=msg)
         return good_filters
 
-    def filter_hosts(self, hosts, filter_properties, filters=None):
+    def filter_hosts(self, hosts, filter_properties, filters=None,
+                     trace=stats.NULL_TRACE):
         """Filter hosts and return only ones passing all filters"""
         filtered_hosts = []
-        filter_fns = self._choose_host_filters(filters)
+        filter_fns = trace.filter_fns(self._choose_host_filters(filters))
         for host in hosts:
             if host.passes_filters(filter_fns, filter_properties):
                 filtered_hosts.append(host)
@@ -231,52 +316,48 @@ class HostManager(object):
                 ret.append({"service": svc, "host_name": host})
         return ret
 
+    @property
+    def service_states(self):
+        """{ <host> : { <service> : { cap k : v }}}"""
+        return self.capability_store.service_states
+
+    @service_states.setter
+    def service_states(self, service_states):
+        self.capability_store.load(service_states)
+
     def get_service_capabilities(self):
         """Roll up all the individual host info to generic 'service'
            capabilities. Each capability is aggregated into
-           <cap>_min and <cap>_max values."""
-        hosts_dict = self.service_states
-
-        # TODO(sandy) - be smarter about fabricating this structure.
-        # But it's likely to change once we understand what the Best-Match
-        # code will need better.
-        combined = {}  # { <service>_<cap> : (min, max), ... }
-        stale_host_services = {}  # { host1 : [svc1, svc2], host2 :[svc1]}
-        for host, host_dict in hosts_dict.iteritems():
-            for service_name, service_dict in host_dict.iteritems():
-                if not service_dict.get("enabled", True):
-                    # Service is disabled; do no include it
-                    continue
-
-                # Check if the service capabilities became stale
-                if self.host_service_caps_stale(host, service_name):
-                    if host not in stale_host_services:
-                        stale_host_services[host] = []  # Adding host key once
-                    stale_host_services[host].append(service_name)
-                    continue
-                for cap, value in service_dict.iteritems():
-                    if cap == "timestamp":  # Timestamp is not needed
-                        continue
-                    key = "%s_%s" % (service_name, cap)
-                    min_value, max_value = combined.get(key, (value, value))
-                    min_value = min(min_value, value)
-                    max_value = max(max_value, value)
-                    combined[key] = (min_value, max_value)
+           <cap>_min and <cap>_max values.
+
+           The rollup is maintained as capabilities are reported and
+           expire, so this only drops the stale services."""
+        allowed_time_diff = FLAGS.periodic_interval * 3
+        cutoff = utils.utcnow() - datetime.timedelta(
+                seconds=allowed_time_diff)
+        stale_host_services = self.capability_store.pop_expired(cutoff)
 
         # Delete the expired host services
         self.delete_expired_host_services(stale_host_services)
-        return combined
+        return self.capability_store.rollup()
 
     def update_service_capabilities(self, service_name, host, capabilities):
         """Update the per-service capabilities based on this notification."""
         LOG.debug(_("Received %(service_name)s service update from "
                     "%(host)s.") % locals())
-        service_caps = self.service_states.get(host, {})
+        if not self.owns_host(host):
+            return
         # Copy the capabilities, so we don't modify the original dict
         capab_copy = dict(capabilities)
         capab_copy["timestamp"] = utils.utcnow()  # Reported time
-        service_caps[service_name] = capab_copy
-        self.service_states[host] = service_caps
+        self.capability_store.update(host, service_name, capab_copy)
+        self._update_cached_capabilities(host, service_name)
+
+    def _update_cached_capabilities(self, host, service_name):
+        host_state = self.host_state_map.get(host)
+        if host_state and host_state.topic == service_name:
+            host_state.capabilities = ReadOnlyDict(
+                    self.service_states.get(host, {}).get(service_name))
 
     def host_service_caps_stale(self, host, service):
         """Check if host service capabilites are not recent enough."""
@@ -290,31 +371,115 @@ class HostManager(object):
     def delete_expired_host_services(self, host_services_dict):
         """Delete all the inactive host services information."""
         for host, services in host_services_dict.iteritems():
-            service_caps = self.service_states[host]
             for service in services:
-                del service_caps[service]
-                if len(service_caps) == 0:  # Delete host if no services
-                    del self.service_states[host]
-
-    def get_all_host_states(self, context, topic):
-        """Returns a dict of all the hosts the HostManager
-        knows about. Also, each of the consumable resources in HostState
-        are pre-populated and adjusted based on data in the db.
+                self.capability_store.remove(host, service)
+                self._update_cached_capabilities(host, service)
 
-        For example:
-        {'192.168.1.100': HostState(), ...}
-
-        Note: this can be very slow with a lot of instances.
-        InstanceType table isn't required since a copy is stored
-        with the instance (in case the InstanceType changed since the
-        instance was created)."""
-
-        if topic != 'compute':
-            raise NotImplementedError(_(
-                "host_manager only implemented for 'compute'"))
+    def update_instance_usage(self, host, event, usage):
+        """Apply an instance 'create' or 'delete' on host to the cached
+        host states. usage holds the memory_mb, root_gb, ephemeral_gb and
+        vcpus of the instance.
+        """
+        host_state = self.host_state_map.get(host)
+        if not host_state:
+            return
+        if event == 'create':
+            host_state.consume_from_instance(usage)
+        elif event == 'delete':
+            host_state.release_from_instance(usage)
+        else:
+            LOG.warn(_("Ignoring unknown instance event %(event)s from "
+                       "%(host)s") % locals())
 
+    def update_compute_node(self, host):
+        """Reload the cached host state of host, whose compute service
+        started, and re-read the service records with the next request,
+        which also drops the hosts whose service is gone.
+        """
+        if not self.owns_host(host):
+            return
+        self.host_state_map.pop(host, None)
+        self.services_refreshed_at = None
+
+    def claim_resources(self, context, placements, usage):
+        """Record in the db the resources of an instance, usage, picked
+        on the hosts of placements, a list of (host, instance_uuid), until
+        the compute nodes account for them or scheduler_resource_claim_ttl
+        seconds pass. The cached host states should already have usage
+        consumed.
+        """
+        if not FLAGS.scheduler_resource_claims or not placements:
+            return
+        expires_at = utils.utcnow() + datetime.timedelta(
+                seconds=FLAGS.scheduler_resource_claim_ttl)
+        values_list = []
+        for host, instance_uuid in placements:
+            values = dict((key, usage.get(key, 0)) for key in
+                          ('memory_mb', 'root_gb', 'ephemeral_gb', 'vcpus'))
+            values.update(host=host, instance_uuid=instance_uuid,
+                          expires_at=expires_at)
+            values_list.append(values)
+        claims = db.resource_claims_create(context, values_list)
+        if self.hash_ring is None:
+            self.seen_claims.update((claim['id'], claim['created_at'])
+                                    for claim in claims)
+
+    def _apply_new_claims(self, context):
+        """Consume the resources other schedulers claimed since the last
+        look from the cached host states.
+
+        The claims are read by creation time, from
+        scheduler_resource_claim_sync_overlap seconds before the last look
+        on, since a claim can be committed after one with a later id or
+        time was read. Those deleted or expired since are consumed too:
+        the instance then runs on the host, or failed there and takes its
+        resources until it is deleted, as the rebuild from the db counts
+        them. Only those which went away before the last rebuild, which
+        counted their instance or dropped them, are skipped.
+
+        Sharded host managers skip this, the shard which owns a host
+        being the only one to consume from it.
+        """
+        now = utils.utcnow()
+        overlap = datetime.timedelta(
+                seconds=FLAGS.scheduler_resource_claim_sync_overlap)
+        rebuilt_at = self.claims_rebuilt_at
+        for claim in db.resource_claim_get_all(context,
+                created_since=self.claims_synced_at - overlap):
+            if claim['id'] in self.seen_claims:
+                continue
+            self.seen_claims[claim['id']] = claim['created_at']
+            if rebuilt_at and (claim['expires_at'] <= rebuilt_at or
+                               (claim['deleted'] and
+                                claim['deleted_at'] <= rebuilt_at)):
+                continue
+            host_state = self.host_state_map.get(claim['host'])
+            if host_state:
+                host_state.consume_from_instance(claim)
+        self.claims_synced_at = now
+        # Forget the claims the next look will not read again
+        for claim_id, created_at in self.seen_claims.items():
+            if created_at < now - overlap:
+                del self.seen_claims[claim_id]
+
+    @staticmethod
+    def _is_due(last, interval):
+        return (last is None or
+                utils.total_seconds(utils.utcnow() - last) >= interval)
+
+    def _make_host_state(self, host, topic, service, compute):
+        capabilities = self.service_states.get(host, None)
+        host_state = self.host_state_cls(host, topic,
+                capabilities=capabilities,
+                service=dict(service.iteritems()))
+        host_state.update_from_compute_node(compute)
+        return host_state
+
+    def _build_host_states(self, context, topic):
+        """Rebuild all the cached host states from the database."""
         host_state_map = {}
 
+        built_at = utils.utcnow()
         # Make a compute node dict with the bare essential metrics.
         compute_nodes = db.compute_node_get_all(context)
         for compute in compute_nodes:
@@ -323,15 +488,14 @@ class HostManager(object):
                 LOG.warn(_("No service for compute ID %s") % compute['id'])
                 continue
             host = service['host']
-            capabilities = self.service_states.get(host, None)
-            host_state = self.host_state_cls(host, topic,
-                    capabilities=capabilities,
-                    service=dict(service.iteritems()))
-            host_state.update_from_compute_node(compute)
-            host_state_map[host] = host_state
+            if not self.owns_host(host):
+                continue
+            host_state_map[host] = self._make_host_state(host, topic,
+                                                         service, compute)
 
         # "Consume" resources from the host the instance resides on.
-        instances = db.instance_get_all(context)
+        instances = db.instance_get_all(context,
+                                        columns=INSTANCE_USAGE_COLUMNS)
         for instance in instances:
             host = instance['host']
             if not host:
@@ -340,4 +504,102 @@ class HostManager(object):
             if not host_state:
                 continue
             host_state.consume_from_instance(instance)
-        return host_state_map
+
+        self.claims_synced_at = built_at
+        self.claims_rebuilt_at = built_at
+        self.seen_claims = {}
+        if FLAGS.scheduler_resource_claims:
+            self._apply_claims(context, host_state_map, instances)
+
+        self.host_state_map = host_state_map
+        self.host_states_built_at = utils.utcnow()
+        self.services_refreshed_at = self.host_states_built_at
+
+    def _apply_claims(self, context, host_state_map, instances):
+        """Consume the claims for instances which do not reside on the
+        claimed host yet, such as those being resized to it."""
+        instance_hosts = dict((instance['uuid'], instance['host'])
+                              for instance in instances)
+        for claim in db.resource_claim_get_all(context):
+            self.seen_claims[claim['id']] = claim['created_at']
+            host = claim['host']
+            if instance_hosts.get(claim['instance_uuid']) == host:
+                continue
+            host_state = host_state_map.get(host, None)
+            if host_state:
+                host_state.consume_from_instance(claim)
+
+    def _load_host_state(self, context, topic, host):
+        """Add the cached state of a host which showed up since the last
+        rebuild.
+        """
+        try:
+            service = db.service_get_all_compute_by_host(context, host)[0]
+        except exception.ComputeHostNotFound:
+            return
+        if not service['compute_node']:
+            # NOTE: the compute service has not reported its resources yet
+            return
+        host_state = self._make_host_state(host, topic, service,
+                                           service['compute_node'][0])
+        for instance in db.instance_get_all_by_host(context, host,
+                columns=INSTANCE_USAGE_COLUMNS):
+            host_state.consume_from_instance(instance)
+        self.host_state_map[host] = host_state
+
+    def _refresh_services(self, context, topic):
+        """Refresh the service records of the cached host states, adding
+        new hosts and dropping the hosts whose service was deleted.
+        """
+        hosts = set()
+        for service in db.service_get_all(context):
+            if service['topic'] != topic:
+                continue
+            host = service['host']
+            if not self.owns_host(host):
+                continue
+            hosts.add(host)
+            host_state = self.host_state_map.get(host)
+            if host_state:
+                host_state.service = ReadOnlyDict(dict(service.iteritems()))
+            else:
+                self._load_host_state(context, topic, host)
+        for host in self.host_state_map.keys():
+            if host not in hosts:
+                del self.host_state_map[host]
+        self.services_refreshed_at = utils.utcnow()
+
+    def get_all_host_states(self, context, topic):
+        """Returns a dict of all the hosts the HostManager
+        knows about. Also, each of the consumable resources in HostState
+        are pre-populated and adjusted based on data in the db.
+
+        For example:
+        {'192.168.1.100': HostState(), ...}
+
+        The host states are cached. They are rebuilt from the compute
+        nodes, instances and resource claims in the db every
+        scheduler_host_state_reconcile_interval seconds, which can be very
+        slow with a lot of instances. In between, capability reports,
+        instance create/delete events and the resource claims made by the
+        other schedulers keep them up to date, and their service records
+        are refreshed every scheduler_service_refresh_interval seconds and
+        when a compute service starts.
+        InstanceType table isn't required since a copy is stored
+        with the instance (in case the InstanceType changed since the
+        instance was created)."""
+
+        if topic != 'compute':
+            raise NotImplementedError(_(
+                "host_manager only implemented for 'compute'"))
+
+        if self._is_due(self.host_states_built_at,
+                        FLAGS.scheduler_host_state_reconcile_interval):
+            self._build_host_states(context, topic)
+            return self.host_state_map
+        if self._is_due(self.services_refreshed_at,
+                        FLAGS.scheduler_service_refresh_interval):
+            self._refresh_services(context, topic)
+        if FLAGS.scheduler_resource_claims and self.hash_ring is None:
+            self._apply_new_claims(context)
+        return self.host_state_map
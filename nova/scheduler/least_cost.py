@@ -79,6 +79,32 @@ def compute_fill_first_cost_fn(host_state, weighing_properties):
     return host_state.free_ram_mb
 
 
+def noop_cost_scores(host_arrays, weighing_properties):
+    """noop_cost_fn for all hosts of a vectorized.HostArrays"""
+    return 1
+
+
+def compute_fill_first_cost_scores(host_arrays, weighing_properties):
+    """compute_fill_first_cost_fn for all hosts of a vectorized.HostArrays"""
+    return host_arrays.free_ram_mb
+
+
+# Cost functions computed for all hosts at once by the vectorized engine
+host_score_fns = {
+    noop_cost_fn: noop_cost_scores,
+    compute_fill_first_cost_fn: compute_fill_first_cost_scores,
+}
+
+
+def weighted_score(weighted_fns, host_state, weighing_properties):
+    """Returns the weighted sum of the cost functions for one host, the
+    score weighted_sum() gives it."""
+    score = 0.0
+    for weight, fn in weighted_fns:
+        score += weight * fn(host_state, weighing_properties)
+    return score
+
+
 def weighted_sum(weighted_fns, host_states, weighing_properties):
     """Use the weighted-sum method to compute a score for an array of objects.
 
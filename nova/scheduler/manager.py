@@ -31,6 +31,7 @@ from nova import log as logging
 from nova import manager
 from nova.notifier import api as notifier
 from nova.openstack.common import cfg
+from nova.scheduler import stats
 from nova import utils
 
 
@@ -42,6 +43,7 @@ scheduler_driver_opt = cfg.StrOpt('scheduler_driver',
 
 FLAGS = flags.FLAGS
 FLAGS.register_opt(scheduler_driver_opt)
+flags.DECLARE('scheduler_resource_claims', 'nova.scheduler.host_manager')
 
 
 class SchedulerManager(manager.Manager):
@@ -52,6 +54,7 @@ class SchedulerManager(manager.Manager):
             scheduler_driver = FLAGS.scheduler_driver
         self.driver = utils.import_object(scheduler_driver)
         super(SchedulerManager, self).__init__(*args, **kwargs)
+        self.driver.set_shard(self.host)
 
     def __getattr__(self, key):
         """Converts all method calls to use the schedule method"""
@@ -65,6 +68,31 @@ class SchedulerManager(manager.Manager):
         """Get the normalized set of capabilities for this zone."""
         return self.driver.get_service_capabilities()
 
+    def get_scheduler_stats(self, context):
+        """Get the counters, histograms and last traces of the
+        scheduling requests."""
+        return self.driver.get_scheduler_stats()
+
+    def select_hosts(self, context, request_spec, filter_properties):
+        """Pick hosts for request_spec among the hosts of this scheduler
+        shard, see ShardedScheduler."""
+        return self.driver.select_hosts(context, request_spec,
+                                        filter_properties)
+
+    @manager.periodic_task
+    def _dump_scheduler_stats(self, context):
+        """Write the scheduling stats to scheduler_stats_file."""
+        if FLAGS.scheduler_stats and FLAGS.scheduler_stats_file:
+            stats.dump(self.driver.get_scheduler_stats(),
+                       FLAGS.scheduler_stats_file)
+
+    @manager.periodic_task
+    def _expire_resource_claims(self, context):
+        """Delete the resource claims whose compute nodes never accounted
+        for their instance."""
+        if FLAGS.scheduler_resource_claims:
+            db.resource_claims_destroy_expired(context)
+
     def update_service_capabilities(self, context, service_name=None,
             host=None, capabilities=None, **kwargs):
         """Process a capability update from a service node."""
@@ -73,6 +101,15 @@ class SchedulerManager(manager.Manager):
         self.driver.update_service_capabilities(service_name, host,
                 capabilities)
 
+    def update_instance_usage(self, context, host=None, event=None,
+            usage=None, **kwargs):
+        """Process an instance create/delete event from a compute node."""
+        self.driver.update_instance_usage(host, event, usage)
+
+    def update_compute_node(self, context, host=None, **kwargs):
+        """Process a compute node update from a starting compute node."""
+        self.driver.update_compute_node(host)
+
     def _schedule(self, method, context, topic, *args, **kwargs):
         """Tries to call schedule_* method on the driver to retrieve host.
         Falls back to schedule(context, topic) if method doesn't exist.
@@ -80,8 +80,25 @@ class MultiScheduler(driver.Scheduler):
     def schedule_prep_resize(self, *args, **kwargs):
         return self.drivers['compute'].schedule_prep_resize(*args, **kwargs)
 
+    def select_hosts(self, *args, **kwargs):
+        return self.drivers['compute'].select_hosts(*args, **kwargs)
+
+    def set_shard(self, shard):
+        super(MultiScheduler, self).set_shard(shard)
+        for d in self.drivers.values():
+            d.set_shard(shard)
+
+    def get_scheduler_stats(self):
+        return self.drivers['compute'].get_scheduler_stats()
+
     def update_service_capabilities(self, service_name, host, capabilities):
         # Multi scheduler is only a holder of sub-schedulers, so
         # pass the capabilities to the schedulers that matter
         for d in self.drivers.values():
             d.update_service_capabilities(service_name, host, capabilities)
+
+    def update_instance_usage(self, host, event, usage):
+        self.drivers['compute'].update_instance_usage(host, event, usage)
+
+    def update_compute_node(self, host):
+        self.drivers['compute'].update_compute_node(host)
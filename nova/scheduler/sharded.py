@@ -0,0 +1,161 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2012 OpenStack, LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+The Sharded Scheduler partitions the compute hosts among several
+scheduler workers.
+
+Each scheduler listed in scheduler_shards keeps the state of the compute
+hosts which map to it on a consistent hash ring (see
+HostManager.set_shard()). The scheduler a request is cast to asks the
+shards for their best hosts with rpc.call(), runs the FilterScheduler on
+its own shard directly, and keeps the best of all the candidates. The
+shards consumed the request on every candidate they returned, so the
+candidates which were not kept are released with the same
+update_instance_usage message compute nodes send for deleted instances.
+"""
+
+import operator
+import random
+
+import eventlet
+
+from nova import db
+from nova import flags
+from nova import log as logging
+from nova.openstack.common import cfg
+from nova import rpc
+from nova.scheduler import filter_scheduler
+from nova.scheduler import least_cost
+
+
+sharded_scheduler_opts = [
+    cfg.IntOpt('scheduler_shard_fanout',
+               default=0,
+               help='Number of scheduler shards, picked at random, asked '
+                    'for hosts for each request; 0 asks all of them'),
+    ]
+
+FLAGS = flags.FLAGS
+FLAGS.register_opts(sharded_scheduler_opts)
+flags.DECLARE('scheduler_shards', 'nova.scheduler.host_manager')
+
+LOG = logging.getLogger(__name__)
+
+
+class ShardedScheduler(filter_scheduler.FilterScheduler):
+    """FilterScheduler over compute hosts partitioned among the
+    scheduler_shards."""
+
+    def __init__(self, *args, **kwargs):
+        super(ShardedScheduler, self).__init__(*args, **kwargs)
+        self.shard = None
+
+    def set_shard(self, shard):
+        super(ShardedScheduler, self).set_shard(shard)
+        self.shard = shard
+
+    def select_hosts(self, context, request_spec, filter_properties):
+        """Returns the [weight, host] of the hosts picked for request_spec
+        among the hosts of this shard, best first."""
+        weighted_hosts = super(ShardedScheduler, self)._schedule(context,
+                'compute', request_spec, filter_properties=filter_properties)
+        return [[weighted_host.weight, weighted_host.host_state.host]
+                for weighted_host in weighted_hosts]
+
+    def _schedule(self, context, topic, request_spec, *args, **kwargs):
+        """Returns the best WeightedHosts picked by the shards."""
+        if not FLAGS.scheduler_shards:
+            return super(ShardedScheduler, self)._schedule(context, topic,
+                    request_spec, *args, **kwargs)
+        if topic != "compute":
+            msg = _("Scheduler only understands Compute nodes (for now)")
+            raise NotImplementedError(msg)
+
+        filter_properties = kwargs.get('filter_properties', {})
+        shards = self._choose_shards(filter_properties)
+
+        def _select_hosts(shard):
+            return shard, self._select_hosts_on_shard(context, shard,
+                    request_spec, filter_properties)
+
+        candidates = []  # [(weight, shard, host), ...]
+        pool = eventlet.GreenPool()
+        for shard, selected in pool.imap(_select_hosts, shards):
+            candidates.extend((weight, shard, host)
+                              for weight, host in selected)
+        candidates.sort(key=operator.itemgetter(0))
+
+        num_instances = request_spec.get('num_instances', 1)
+        self._release_hosts(context, request_spec,
+                            candidates[num_instances:])
+        host_state_cls = self.host_manager.host_state_cls
+        return [least_cost.WeightedHost(weight,
+                        host_state=host_state_cls(host, topic))
+                for weight, _shard, host in candidates[:num_instances]]
+
+    def _choose_shards(self, filter_properties):
+        """Returns the shards to ask for hosts: the owners of the forced
+        hosts if any, else scheduler_shard_fanout shards at random."""
+        force_hosts = filter_properties.get('force_hosts')
+        if force_hosts:
+            ring = self.host_manager.hash_ring
+            return list(set(ring.get_node(host) for host in force_hosts))
+        shards = list(FLAGS.scheduler_shards)
+        fanout = FLAGS.scheduler_shard_fanout
+        if 0 < fanout < len(shards):
+            shards = random.sample(shards, fanout)
+        return shards
+
+    def _select_hosts_on_shard(self, context, shard, request_spec,
+                               filter_properties):
+        if shard == self.shard:
+            # NOTE: _schedule() adds the context and more to the filter
+            # properties, the other shards need the original ones.
+            return self.select_hosts(context, request_spec,
+                                     dict(filter_properties))
+        try:
+            return rpc.call(context,
+                            db.queue_get_for(context, FLAGS.scheduler_topic,
+                                             shard),
+                            {'method': 'select_hosts',
+                             'args': {'request_spec': request_spec,
+                                      'filter_properties':
+                                            filter_properties}}) or []
+        except Exception:
+            LOG.exception(_("Scheduler shard %(shard)s failed to select "
+                            "hosts") % locals())
+            return []
+
+    def _release_hosts(self, context, request_spec, candidates):
+        """Gives back the resources the shards consumed on the candidates
+        which were not picked."""
+        instance_properties = request_spec['instance_properties']
+        usage = dict((key, instance_properties.get(key, 0))
+                     for key in ('memory_mb', 'root_gb', 'ephemeral_gb',
+                                 'vcpus'))
+        for _weight, shard, host in candidates:
+            if shard == self.shard:
+                self.host_manager.update_instance_usage(host, 'delete',
+                                                        usage)
+                continue
+            rpc.cast(context,
+                     db.queue_get_for(context, FLAGS.scheduler_topic, shard),
+                     {'method': 'update_instance_usage',
+                      'args': {'host': host,
+                               'event': 'delete',
+                               'usage': usage}})
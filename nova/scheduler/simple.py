@@ -21,6 +21,8 @@
 Simple Scheduler
 """
 
+import heapq
+
 from nova import db
 from nova import flags
 from nova import exception
@@ -52,8 +54,10 @@ FLAGS.register_opts(simple_scheduler_opts)
 class SimpleScheduler(chance.ChanceScheduler):
     """Implements Naive Scheduler that tries to find least loaded host."""
 
-    def _schedule_instance(self, context, instance_opts, *_args, **_kwargs):
-        """Picks a host that is up and has the fewest running instances."""
+    def _schedule_instances(self, context, instance_opts, num_instances):
+        """Picks a host for each of num_instances instances: a host that
+        is up and has the fewest running instance cores, counting those of
+        the instances picked before."""
         elevated = context.elevated()
 
         availability_zone = instance_opts.get('availability_zone')
@@ -66,37 +70,47 @@ class SimpleScheduler(chance.ChanceScheduler):
             service = db.service_get_by_args(elevated, host, 'nova-compute')
             if not utils.service_is_up(service):
                 raise exception.WillNotSchedule(host=host)
-            return host
+            return [host] * num_instances
 
-        results = db.service_get_all_compute_sorted(elevated)
         in_isolation = instance_opts['image_ref'] in FLAGS.isolated_images
         check_cores = not in_isolation or not FLAGS.skip_isolated_core_check
-        if zone:
-            results = [(service, cores) for (service, cores) in results
-                       if service['availability_zone'] == zone]
-        for result in results:
-            (service, instance_cores) = result
-            if in_isolation and service['host'] not in FLAGS.isolated_hosts:
-                # isloated images run on isolated hosts
-                continue
-            if service['host'] in FLAGS.isolated_hosts and not in_isolation:
-                # images that aren't isolated only run on general hosts
-                continue
-            if (check_cores and
-                instance_cores + instance_opts['vcpus'] > FLAGS.max_cores):
+        if in_isolation:
+            # isloated images run on isolated hosts
+            hosts, exclude_hosts = FLAGS.isolated_hosts, None
+        else:
+            # images that aren't isolated only run on general hosts
+            hosts, exclude_hosts = None, FLAGS.isolated_hosts
+        # NOTE: picking the least loaded host num_instances times in a row
+        # never goes past the num_instances least loaded hosts.
+        results = db.service_get_all_compute_up_sorted(elevated, zone=zone,
+                hosts=hosts, exclude_hosts=exclude_hosts,
+                limit=num_instances)
+        if not results:
+            msg = _("Is the appropriate service running?")
+            raise exception.NoValidHost(reason=msg)
+
+        # A heap of (instance_cores, index, host), sorted as returned
+        candidates = [(instance_cores, index, compute['host'])
+                      for index, (compute, instance_cores)
+                      in enumerate(results)]
+        vcpus = instance_opts.get('vcpus', 0)
+        selected = []
+        for _num in xrange(num_instances):
+            instance_cores, index, host = candidates[0]
+            if check_cores and instance_cores + vcpus > FLAGS.max_cores:
                 msg = _("Not enough allocatable CPU cores remaining")
                 raise exception.NoValidHost(reason=msg)
-            if utils.service_is_up(service) and not service['disabled']:
-                return service['host']
-        msg = _("Is the appropriate service running?")
-        raise exception.NoValidHost(reason=msg)
+            heapq.heapreplace(candidates,
+                              (instance_cores + vcpus, index, host))
+            selected.append(host)
+        return selected
 
     def schedule_run_instance(self, context, request_spec, *_args, **_kwargs):
         num_instances = request_spec.get('num_instances', 1)
+        hosts = self._schedule_instances(context,
+                request_spec['instance_properties'], num_instances)
         instances = []
-        for num in xrange(num_instances):
-            host = self._schedule_instance(context,
-                    request_spec['instance_properties'], *_args, **_kwargs)
+        for num, host in enumerate(hosts):
             request_spec['instance_properties']['launch_index'] = num
             instance_ref = self.create_instance_db_entry(context,
                     request_spec)
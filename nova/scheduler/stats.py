@@ -0,0 +1,257 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2012 OpenStack, LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Counters and latency histograms of scheduling decisions.
+
+When scheduler_stats is set, the scheduler driver traces each request:
+the time spent getting the host states, in each filter class and in each
+cost function, and the number of hosts each filter was given and let
+through. Finished traces are folded into per-name counters and
+histograms, and the last few are kept as they are.
+
+The stats are returned by the scheduler's get_scheduler_stats() RPC
+call, which "nova-manage service scheduler_stats" prints, and, when
+scheduler_stats_file is set, dumped to that file as JSON by a periodic
+task. When scheduler_stats is not set, a request only
+costs a flag lookup.
+"""
+
+import bisect
+import collections
+import json
+import os
+import time
+
+from nova import flags
+from nova.openstack.common import cfg
+
+
+scheduler_stats_opts = [
+    cfg.BoolOpt('scheduler_stats',
+                default=False,
+                help='Record the time spent in each filter and cost '
+                     'function, and the hosts each filter removes, for '
+                     'every scheduling request'),
+    cfg.StrOpt('scheduler_stats_file',
+               default=None,
+               help='File the scheduler periodically dumps its stats to, '
+                    'as JSON'),
+    cfg.IntOpt('scheduler_stats_traces',
+               default=20,
+               help='Number of the last request traces kept in the '
+                    'scheduler stats'),
+    ]
+
+FLAGS = flags.FLAGS
+FLAGS.register_opts(scheduler_stats_opts)
+
+# Upper bounds of the histogram buckets, in seconds: 10us to ~5s
+BUCKETS = [0.00001 * 2 ** i for i in xrange(20)]
+
+
+class Histogram(object):
+    """Counts of values per bucket, with their sum, min and max."""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def to_dict(self):
+        """Returns the histogram with the counts of the non-empty buckets
+        as [upper bound, count] pairs; the last bound is None."""
+        bounds = BUCKETS + [None]
+        return {'count': self.count,
+                'sum': self.sum,
+                'min': self.min,
+                'max': self.max,
+                'buckets': [[bounds[idx], count]
+                            for idx, count in enumerate(self.counts)
+                            if count]}
+
+
+class _TimedFilter(object):
+    """A filter's host_passes() that adds its time and hosts to a trace.
+
+    The filter's host_mask(), if any, is timed as well and exposed
+    through im_self, where the vectorized engine looks for it.
+    """
+
+    def __init__(self, trace, filter_fn):
+        self.trace = trace
+        self.filter_fn = filter_fn
+        filter_obj = getattr(filter_fn, 'im_self', None)
+        if filter_obj is not None:
+            self.name = 'filter.%s' % filter_obj.__class__.__name__
+        else:
+            self.name = 'filter.%s' % filter_fn.__name__
+        self.im_self = self
+        self._host_mask = getattr(filter_obj, 'host_mask', None)
+        if self._host_mask is None:
+            self.host_mask = None
+
+    def __call__(self, host_state, filter_properties):
+        start = time.time()
+        passes = self.filter_fn(host_state, filter_properties)
+        self.trace.add_time(self.name, time.time() - start)
+        self.trace.add_hosts(self.name, 1, passes and 1 or 0)
+        return passes
+
+    def host_mask(self, host_arrays, filter_properties):
+        start = time.time()
+        mask = self._host_mask(host_arrays, filter_properties)
+        self.trace.add_time(self.name, time.time() - start)
+        if mask is not None:
+            self.trace.add_hosts(self.name, len(mask), int(mask.sum()))
+        return mask
+
+    def __repr__(self):
+        return repr(self.filter_fn)
+
+
+class RequestTrace(object):
+    """The time spent and the hosts filtered while scheduling a request."""
+
+    def __init__(self, stats):
+        self.stats = stats
+        self.started_at = time.time()
+        self.timings = collections.defaultdict(float)  # { name : seconds }
+        self.hosts = {}  # { filter name : [hosts in, hosts out] }
+
+    def add_time(self, name, seconds):
+        self.timings[name] += seconds
+
+    def add_hosts(self, name, hosts_in, hosts_out):
+        counts = self.hosts.setdefault(name, [0, 0])
+        counts[0] += hosts_in
+        counts[1] += hosts_out
+
+    def timed(self, name, fn, *args, **kwargs):
+        """Calls fn, adding the time it took to name."""
+        start = time.time()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self.add_time(name, time.time() - start)
+
+    def filter_fns(self, filter_fns):
+        """Returns filter_fns timing themselves and counting hosts."""
+        return [_TimedFilter(self, filter_fn) for filter_fn in filter_fns]
+
+    def cost_functions(self, weighted_fns):
+        """Returns weighted_fns with the cost functions timing
+        themselves."""
+        return [(weight, self._timed_cost_fn(cost_fn))
+                for weight, cost_fn in weighted_fns]
+
+    def _timed_cost_fn(self, cost_fn):
+        name = 'cost.%s' % cost_fn.__name__
+
+        def _cost_fn(host_state, weighing_properties):
+            return self.timed(name, cost_fn, host_state, weighing_properties)
+        return _cost_fn
+
+    def finish(self, num_instances, selected, failed=False):
+        """Adds the trace of a request for num_instances instances, of
+        which selected were placed, to the stats. failed is set when
+        the request raised."""
+        self.timings['total'] = time.time() - self.started_at
+        self.stats.record(self, num_instances, selected, failed)
+
+
+class _NullTrace(object):
+    """The trace of requests when scheduler_stats is not set."""
+
+    def timed(self, name, fn, *args, **kwargs):
+        return fn(*args, **kwargs)
+
+    def filter_fns(self, filter_fns):
+        return filter_fns
+
+    def cost_functions(self, weighted_fns):
+        return weighted_fns
+
+    def finish(self, num_instances, selected, failed=False):
+        pass
+
+
+NULL_TRACE = _NullTrace()
+
+
+class SchedulerStats(object):
+    """Counters and histograms folded from the traces of requests."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.counters = collections.defaultdict(int)
+        self.histograms = collections.defaultdict(Histogram)
+        self.traces = collections.deque(maxlen=FLAGS.scheduler_stats_traces)
+
+    def start_request(self):
+        """Returns a RequestTrace, or NULL_TRACE when scheduler_stats is
+        not set."""
+        if not FLAGS.scheduler_stats:
+            return NULL_TRACE
+        return RequestTrace(self)
+
+    def record(self, trace, num_instances, selected, failed=False):
+        self.counters['requests'] += 1
+        if failed:
+            self.counters['requests_failed'] += 1
+        self.counters['instances_requested'] += num_instances
+        self.counters['instances_placed'] += selected
+        for name, seconds in trace.timings.iteritems():
+            self.histograms['%s.seconds' % name].observe(seconds)
+        for name, (hosts_in, hosts_out) in trace.hosts.iteritems():
+            self.counters['%s.hosts_in' % name] += hosts_in
+            self.counters['%s.hosts_out' % name] += hosts_out
+        self.traces.append({'started_at': trace.started_at,
+                            'instances_requested': num_instances,
+                            'instances_placed': selected,
+                            'failed': failed,
+                            'timings': dict(trace.timings),
+                            'hosts': dict(trace.hosts)})
+
+    def snapshot(self):
+        """Returns the stats as a JSON serializable dict."""
+        return {'counters': dict(self.counters),
+                'histograms': dict((name, histogram.to_dict())
+                                   for name, histogram
+                                   in self.histograms.iteritems()),
+                'traces': list(self.traces)}
+
+
+def dump(snapshot, path):
+    """Writes a snapshot of the stats to path, replacing it atomically."""
+    tmp_path = '%s.tmp' % path
+    with open(tmp_path, 'w') as f:
+        json.dump(snapshot, f, indent=4, sort_keys=True)
+    os.rename(tmp_path, path)
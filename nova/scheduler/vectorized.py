@@ -0,0 +1,224 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2012 OpenStack, LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+NumPy backed filtering and weighing of host states.
+
+HostArrays keeps the resources of a list of HostStates in arrays with one
+element per host. Filters providing a host_mask() method and cost
+functions listed in least_cost.host_score_fns are evaluated for all hosts
+at once; the other filters and cost functions are called per host, once.
+Consuming an instance updates its host in the arrays in place, and only
+that host is passed to the per-host functions again, so a multi-instance
+request does not rebuild or rescan host lists.
+"""
+
+import datetime
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from nova import flags
+from nova import log as logging
+from nova.openstack.common import cfg
+from nova.scheduler import least_cost
+from nova import utils
+
+
+vectorized_opts = [
+    cfg.BoolOpt('scheduler_vectorized_engine',
+                default=False,
+                help='Filter and weigh compute hosts in NumPy arrays in the '
+                     'FilterScheduler; requires numpy'),
+    ]
+
+FLAGS = flags.FLAGS
+FLAGS.register_opts(vectorized_opts)
+
+LOG = logging.getLogger(__name__)
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def is_available():
+    """Returns whether numpy could be imported."""
+    return numpy is not None
+
+
+def _heartbeat(service):
+    """Returns the last heartbeat of a service in seconds since the epoch,
+    or NaN for a host without a service record."""
+    last_heartbeat = service.get('updated_at') or service.get('created_at')
+    if last_heartbeat is None:
+        return float('nan')
+    return utils.total_seconds(last_heartbeat - EPOCH)
+
+
+class HostArrays(object):
+    """The resources of a list of HostStates, in arrays indexed like it."""
+
+    def __init__(self, host_states):
+        self.host_states = list(host_states)
+        self.hosts = [host_state.host for host_state in self.host_states]
+        self.free_ram_mb = self._array('free_ram_mb', numpy.int64)
+        self.free_disk_mb = self._array('free_disk_mb', numpy.int64)
+        self.vcpus_total = self._array('vcpus_total', numpy.int64)
+        self.vcpus_used = self._array('vcpus_used', numpy.int64)
+        self.is_compute = numpy.array([host_state.topic == 'compute'
+                                       for host_state in self.host_states],
+                                      dtype=bool)
+        self.disabled = numpy.array([host_state.service.get('disabled', True)
+                                     for host_state in self.host_states],
+                                    dtype=bool)
+        self.heartbeat = numpy.array([_heartbeat(host_state.service)
+                                      for host_state in self.host_states],
+                                     dtype=float)
+        self.enabled = numpy.array([host_state.capabilities.get('enabled',
+                                                                True)
+                                    for host_state in self.host_states],
+                                   dtype=bool)
+
+    def _array(self, name, dtype):
+        return numpy.array([getattr(host_state, name)
+                            for host_state in self.host_states], dtype=dtype)
+
+    def __len__(self):
+        return len(self.host_states)
+
+    def load(self, idx):
+        """Copies the resources of the idx-th host state into the arrays."""
+        host_state = self.host_states[idx]
+        self.free_ram_mb[idx] = host_state.free_ram_mb
+        self.free_disk_mb[idx] = host_state.free_disk_mb
+        self.vcpus_total[idx] = host_state.vcpus_total
+        self.vcpus_used[idx] = host_state.vcpus_used
+
+    def consume_from_instance(self, idx, instance):
+        """Consumes instance on the idx-th host state and its arrays."""
+        self.host_states[idx].consume_from_instance(instance)
+        self.load(idx)
+
+    def services_up(self):
+        """Vectorized utils.service_is_up()."""
+        now = utils.total_seconds(utils.utcnow() - EPOCH)
+        with numpy.errstate(invalid='ignore'):
+            return numpy.abs(now - self.heartbeat) <= FLAGS.service_down_time
+
+    def hosts_mask(self, filter_properties):
+        """Applies ignore_hosts and force_hosts like
+        HostState.passes_filters(); returns the mask and whether hosts
+        were forced."""
+        ignore_hosts = set(filter_properties.get('ignore_hosts', []))
+        force_hosts = set(filter_properties.get('force_hosts', []))
+        mask = numpy.array([host not in ignore_hosts and
+                            (not force_hosts or host in force_hosts)
+                            for host in self.hosts], dtype=bool)
+        return mask, bool(force_hosts)
+
+
+def _host_mask_fn(filter_fn):
+    """Returns the host_mask method of the filter of a host_passes method,
+    if it has one."""
+    return getattr(getattr(filter_fn, 'im_self', None), 'host_mask', None)
+
+
+def select_hosts(host_arrays, filter_fns, weighted_fns, filter_properties,
+                 instance_properties, num_instances):
+    """Picks up to num_instances hosts, consuming instance_properties on
+    each one picked, like FilterScheduler._schedule() does with
+    HostManager.filter_hosts() and least_cost.weighted_sum().
+
+    :returns: the WeightedHosts picked, in order.
+    """
+    passing, forced = host_arrays.hosts_mask(filter_properties)
+    mask_fns = []
+    host_fns = []
+    if not forced:
+        for filter_fn in filter_fns:
+            mask_fn = _host_mask_fn(filter_fn)
+            # NOTE: a filter returns None when it cannot vectorize the
+            # request, e.g. ComputeFilter for instance types with
+            # extra_specs.
+            mask = mask_fn and mask_fn(host_arrays, filter_properties)
+            if mask is not None:
+                passing &= mask
+                mask_fns.append(mask_fn)
+            else:
+                host_fns.append(filter_fn)
+
+    score_fns = []
+    host_scores = numpy.zeros(len(host_arrays))
+    host_cost_fns = []
+    for weight, cost_fn in weighted_fns:
+        score_fn = least_cost.host_score_fns.get(cost_fn)
+        if score_fn:
+            score_fns.append((weight, score_fn))
+        else:
+            host_cost_fns.append((weight, cost_fn))
+
+    def _host_passes(idx):
+        host_state = host_arrays.host_states[idx]
+        for filter_fn in host_fns:
+            if not filter_fn(host_state, filter_properties):
+                return False
+        return True
+
+    def _host_score(idx):
+        host_state = host_arrays.host_states[idx]
+        return sum(weight * cost_fn(host_state, filter_properties)
+                   for weight, cost_fn in host_cost_fns)
+
+    selected = []
+    for num in xrange(num_instances):
+        if num == 0:
+            # NOTE: the per-host functions only depend on the state of the
+            # host, so after the first pass they are called again for the
+            # host consumed from only.
+            for idx in numpy.flatnonzero(passing):
+                passing[idx] = _host_passes(idx)
+            if host_cost_fns:
+                for idx in numpy.flatnonzero(passing):
+                    host_scores[idx] = _host_score(idx)
+        else:
+            for mask_fn in mask_fns:
+                passing &= mask_fn(host_arrays, filter_properties)
+            if passing[idx]:
+                passing[idx] = _host_passes(idx)
+            if passing[idx] and host_cost_fns:
+                host_scores[idx] = _host_score(idx)
+
+        candidates = numpy.flatnonzero(passing)
+        if not len(candidates):
+            break
+        LOG.debug(_("Filtered %d hosts"), len(candidates))
+
+        scores = host_scores[candidates]
+        for weight, score_fn in score_fns:
+            values = score_fn(host_arrays, filter_properties)
+            if numpy.ndim(values):
+                values = values[candidates]
+            scores = scores + weight * values
+        best = numpy.argmin(scores)
+        idx = candidates[best]
+        weighted_host = least_cost.WeightedHost(float(scores[best]),
+                host_state=host_arrays.host_states[idx])
+        LOG.debug(_("Weighted %(weighted_host)s") % locals())
+        selected.append(weighted_host)
+        host_arrays.consume_from_instance(idx, instance_properties)
+    return selected
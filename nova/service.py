@@ -46,6 +46,10 @@ service_opts = [
     cfg.IntOpt('periodic_interval',
                default=60,
                help='seconds between running periodic tasks'),
+    cfg.IntOpt('db_pool_stats_interval',
+               default=0,
+               help='seconds between logging the counters of the database '
+                    'connection pools, 0 disables it'),
     cfg.StrOpt('ec2_listen',
                default="0.0.0.0",
                help='IP address for EC2 API to listen'),
@@ -79,6 +83,23 @@ FLAGS = flags.FLAGS
 FLAGS.register_opts(service_opts)
 
 
+def log_db_pool_stats():
+    """Log the counters of the database connection pools of this process."""
+    for url, stats in db.pool_stats_get().items():
+        LOG.info(_('Database pool %(url)s: %(checkouts)d checkouts, '
+                   '%(in_use)d connections in use (max %(max_in_use)d), '
+                   'waited %(wait_seconds).3f seconds for a free connection '
+                   '(max %(max_wait_seconds).3f)'),
+                 dict(stats, url=url))
+
+
+def _start_db_pool_stats_timer(timers):
+    if FLAGS.db_pool_stats_interval:
+        dump = utils.LoopingCall(log_db_pool_stats)
+        dump.start(interval=FLAGS.db_pool_stats_interval, now=False)
+        timers.append(dump)
+
+
 class Launcher(object):
     """Launch one or more services and wait for them to complete."""
 
@@ -198,6 +219,8 @@ class Service(object):
             periodic.start(interval=self.periodic_interval, now=False)
             self.timers.append(periodic)
 
+        _start_db_pool_stats_timer(self.timers)
+
     def _create_service_ref(self, context):
         zone = FLAGS.node_availability_zone
         service_ref = db.service_create(context,
@@ -330,6 +353,7 @@ class WSGIService(object):
                                   self.app,
                                   host=self.host,
                                   port=self.port)
+        self.timers = []
 
     def _get_manager(self):
         """Initialize a Manager object appropriate for this service.
@@ -366,6 +390,7 @@ class WSGIService(object):
             self.manager.init_host()
         self.server.start()
         self.port = self.server.port
+        _start_db_pool_stats_timer(self.timers)
 
     def stop(self):
         """Stop serving this API.
@@ -374,6 +399,9 @@ class WSGIService(object):
 
         """
         self.server.stop()
+        for x in self.timers:
+            x.stop()
+        self.timers = []
 
     def wait(self):
         """Wait for the service to stop serving this API.
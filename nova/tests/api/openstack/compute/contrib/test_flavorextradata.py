@@ -50,12 +50,20 @@ def fake_get_all_types(inactive=0, filters=None):
     }
 
 
+def fake_get_all_types_sorted_list(inactive=False, filters=None, limit=None,
+                                   marker=None):
+    return [fake_get_instance_type_by_flavor_id(1),
+            fake_get_instance_type_by_flavor_id(2)]
+
+
 class FlavorextradataTest(test.TestCase):
     def setUp(self):
         super(FlavorextradataTest, self).setUp()
         self.stubs.Set(instance_types, 'get_instance_type_by_flavor_id',
                                         fake_get_instance_type_by_flavor_id)
         self.stubs.Set(instance_types, 'get_all_types', fake_get_all_types)
+        self.stubs.Set(instance_types, 'get_all_types_sorted_list',
+                       fake_get_all_types_sorted_list)
 
     def _verify_server_response(self, flavor, expected):
         for key in expected:
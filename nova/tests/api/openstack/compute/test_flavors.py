@@ -57,26 +57,35 @@ def fake_instance_type_get_by_flavor_id(flavorid):
     return FAKE_FLAVORS['flavor %s' % flavorid]
 
 
-def fake_instance_type_get_all(inactive=False, filters=None):
+def fake_instance_type_get_all(inactive=False, filters=None, limit=None,
+                               marker=None):
     def reject_min(db_attr, filter_attr):
         return (filter_attr in filters and
                 int(flavor[db_attr]) < int(filters[filter_attr]))
 
     filters = filters or {}
-    output = {}
-    for (flavor_name, flavor) in FAKE_FLAVORS.items():
+    output = []
+    for (flavor_name, flavor) in sorted(FAKE_FLAVORS.items()):
         if reject_min('memory_mb', 'min_memory_mb'):
             continue
         elif reject_min('root_gb', 'min_root_gb'):
             continue
 
-        output[flavor_name] = flavor
+        output.append(flavor)
+        if flavor['flavorid'] == marker:
+            output = []
 
+    if marker is not None and marker not in [flavor['flavorid'] for flavor
+                                             in FAKE_FLAVORS.values()]:
+        raise exception.MarkerNotFound(marker=marker)
+    if limit is not None:
+        output = output[:limit]
     return output
 
 
-def empty_instance_type_get_all(inactive=False, filters=None):
-    return {}
+def empty_instance_type_get_all(inactive=False, filters=None, limit=None,
+                                marker=None):
+    return []
 
 
 def return_instance_type_not_found(flavor_id):
@@ -88,7 +97,8 @@ class FlavorsTest(test.TestCase):
         super(FlavorsTest, self).setUp()
         fakes.stub_out_networking(self.stubs)
         fakes.stub_out_rate_limiting(self.stubs)
-        self.stubs.Set(nova.compute.instance_types, "get_all_types",
+        self.stubs.Set(nova.compute.instance_types,
+                       "get_all_types_sorted_list",
                        fake_instance_type_get_all)
         self.stubs.Set(nova.compute.instance_types,
                        "get_instance_type_by_flavor_id",
@@ -273,6 +283,16 @@ class FlavorsTest(test.TestCase):
         params = urlparse.parse_qs(href_parts.query)
         self.assertDictMatch({'limit': ['2'], 'marker': ['2']}, params)
 
+    def test_get_flavor_with_marker(self):
+        req = fakes.HTTPRequest.blank('/v2/fake/flavors?marker=1')
+        flavors = self.controller.index(req)['flavors']
+        self.assertEqual([flavor['id'] for flavor in flavors], ['2'])
+
+    def test_get_flavor_with_bad_marker(self):
+        req = fakes.HTTPRequest.blank('/v2/fake/flavors?marker=asdf')
+        self.assertRaises(webob.exc.HTTPBadRequest,
+                          self.controller.index, req)
+
     def test_get_flavor_list_detail(self):
         req = fakes.HTTPRequest.blank('/v2/fake/flavors/detail')
         flavor = self.controller.detail(req)
@@ -321,7 +341,8 @@ class FlavorsTest(test.TestCase):
         self.assertEqual(flavor, expected)
 
     def test_get_empty_flavor_list(self):
-        self.stubs.Set(nova.compute.instance_types, "get_all_types",
+        self.stubs.Set(nova.compute.instance_types,
+                       "get_all_types_sorted_list",
                        empty_instance_type_get_all)
 
         req = fakes.HTTPRequest.blank('/v2/fake/flavors')
@@ -497,10 +497,22 @@ def fake_instance_get(**kwargs):
 def fake_instance_get_all_by_filters(num_servers=5, **kwargs):
     def _return_servers(context, *args, **kwargs):
         servers_list = []
+        marker = kwargs.pop('marker', None)
+        limit = kwargs.pop('limit', None)
+        kwargs.pop('use_slave', None)
+        found_marker = False
         for i in xrange(num_servers):
-            server = stub_instance(id=i + 1, uuid=get_fake_uuid(i),
+            uuid = get_fake_uuid(i)
+            server = stub_instance(id=i + 1, uuid=uuid,
                     **kwargs)
             servers_list.append(server)
+            if marker is not None and uuid == marker:
+                found_marker = True
+                servers_list = []
+        if marker is not None and not found_marker:
+            raise exc.MarkerNotFound(marker=marker)
+        if limit is not None:
+            servers_list = servers_list[:limit]
         return servers_list
     return _return_servers
 
@@ -0,0 +1,75 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2011 University of Southern California
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+
+import __builtin__
+import os
+
+from nova import test
+from nova import utils
+from nova.virt.baremetal import console
+
+
+class ConsoleLogTestCase(test.TestCase):
+
+    def test_append_and_read(self):
+        with utils.tempdir() as tmpdir:
+            path = os.path.join(tmpdir, 'console.log')
+            log = console.ConsoleLog(path, max_bytes=16, tail_bytes=4)
+            log.append('hello ')
+            log.append('world')
+
+            self.assertEqual(log.read(), 'hello world')
+            self.assertEqual(log.tail(5), 'world')
+            self.assertEqual(log.tail(100), 'hello world')
+
+    def test_ring_wraps(self):
+        with utils.tempdir() as tmpdir:
+            path = os.path.join(tmpdir, 'console.log')
+            log = console.ConsoleLog(path, max_bytes=10, tail_bytes=4)
+            for line in ('0123456', '789abc', 'defghijklmnopq'):
+                log.append(line)
+                self.assertTrue(os.path.getsize(path) <=
+                                console.HEADER_SIZE + 10)
+
+            self.assertEqual(log.written, 27)
+            self.assertEqual(log.read(), 'hijklmnopq')
+            self.assertEqual(log.tail(6), 'lmnopq')
+
+            reopened = console.ConsoleLog(path, max_bytes=10, tail_bytes=4)
+            self.assertEqual(reopened.read(), 'hijklmnopq')
+            self.assertEqual(reopened.tail(6), 'lmnopq')
+
+    def test_tail_is_served_from_memory(self):
+        with utils.tempdir() as tmpdir:
+            path = os.path.join(tmpdir, 'console.log')
+            log = console.ConsoleLog(path, max_bytes=10, tail_bytes=4)
+            log.append('0123456789')
+
+            self.mox.StubOutWithMock(__builtin__, 'open')
+            self.mox.ReplayAll()
+            self.assertEqual(log.tail(4), '6789')
+
+    def test_update_appends_new_output(self):
+        self.stubs.Set(console, 'MARKER_SIZE', 4)
+        with utils.tempdir() as tmpdir:
+            path = os.path.join(tmpdir, 'console.log')
+            log = console.ConsoleLog(path, max_bytes=100, tail_bytes=10)
+            log.update('boot\nup\n')
+            log.update('boot\nup\nlogin\n')
+            log.update('rebooted\n')
+
+            self.assertEqual(log.read(), 'boot\nup\nlogin\nrebooted\n')
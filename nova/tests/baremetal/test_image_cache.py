@@ -0,0 +1,126 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2011 University of Southern California
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+
+import os
+
+from eventlet import greenpool
+from eventlet import greenthread
+
+from nova import test
+from nova.tests import fake_utils
+from nova import utils
+from nova.virt.baremetal import image_cache
+
+
+class BaseImageCacheTestCase(test.TestCase):
+
+    def setUp(self):
+        super(BaseImageCacheTestCase, self).setUp()
+        self.downloads = []
+
+    def _fake_fetch(self, target, size=1024):
+        self.downloads.append(target)
+        greenthread.sleep(0)
+        with open(target, 'w') as f:
+            f.write('x' * size)
+
+    def test_image_is_downloaded_once(self):
+        with utils.tempdir() as tmpdir:
+            cache = image_cache.BaseImageCache(tmpdir)
+            pool = greenpool.GreenPool()
+            for _i in xrange(5):
+                pool.spawn_n(cache.fetch, 'abc', self._fake_fetch)
+            pool.waitall()
+
+            self.assertEqual(self.downloads, [os.path.join(tmpdir, 'abc')])
+
+    def test_clone_methods(self):
+        fake_utils.stub_out_utils_execute(self.stubs)
+        cache = image_cache.BaseImageCache('/base')
+
+        cache.clone('/base/abc', '/inst/root')
+        cache.clone('/base/abc', '/inst/root', 'cow')
+        cache.clone('/base/abc', '/inst/root', 'copy')
+
+        self.assertEqual(fake_utils.fake_execute_get_log(),
+                         ['cp --reflink=auto --sparse=always '
+                          '/base/abc /inst/root',
+                          'qemu-img create -f qcow2 -o '
+                          'cluster_size=2M,backing_file=/base/abc /inst/root',
+                          'cp /base/abc /inst/root'])
+
+    def test_evict_unreferenced_least_recently_used(self):
+        with utils.tempdir() as tmpdir:
+            base_dir = os.path.join(tmpdir, '_base')
+            cache = image_cache.BaseImageCache(base_dir, tmpdir)
+            for age, fname in enumerate(['old', 'used', 'new']):
+                cache.fetch(fname, self._fake_fetch, size=1024 * 1024)
+                os.utime(cache.base_path(fname), (age, age))
+            cache.acquire('used', 'instance-00000001')
+
+            self.assertEqual(cache.evict(max_size_mb=2), ['old'])
+            self.assertEqual(cache.evict(max_size_mb=1), ['new'])
+            self.assertEqual(os.listdir(base_dir), ['used'])
+
+            self.flags(baremetal_image_cache_size_mb=1)
+            cache.release('instance-00000001')
+            self.assertEqual(os.listdir(base_dir), ['used'])
+            self.assertEqual(cache.refs, {})
+
+    def test_base_is_not_evicted_while_downloading(self):
+        with utils.tempdir() as tmpdir:
+            cache = image_cache.BaseImageCache(tmpdir)
+            evicted = []
+
+            def _fetch(target):
+                self._fake_fetch(target, size=2 * 1024 * 1024)
+                evicted.extend(cache.evict(max_size_mb=1))
+
+            cache.fetch('abc', _fetch)
+            self.assertEqual(evicted, [])
+            self.assertEqual(cache.fetching, {})
+            self.assertEqual(cache.evict(max_size_mb=1), ['abc'])
+
+    def test_refs_are_rebuilt_after_restart(self):
+        with utils.tempdir() as tmpdir:
+            base_dir = os.path.join(tmpdir, '_base')
+            os.mkdir(os.path.join(tmpdir, 'instance-00000001'))
+            cache = image_cache.BaseImageCache(base_dir, tmpdir)
+            for fname in ('root', 'kernel'):
+                cache.fetch(fname, self._fake_fetch, size=1024 * 1024)
+                cache.acquire(fname, 'instance-00000001')
+            cache.acquire('root', 'instance-00000001')
+            # Taken before the instance directory is created
+            cache.acquire('root', 'instance-00000002')
+
+            cache = image_cache.BaseImageCache(base_dir, tmpdir)
+            self.assertEqual(cache.refs,
+                             {'root': set(['instance-00000001',
+                                           'instance-00000002']),
+                              'kernel': set(['instance-00000001'])})
+            self.assertEqual(cache.evict(max_size_mb=1), [])
+
+            cache.release('instance-00000001')
+            cache.release('instance-00000002')
+            cache = image_cache.BaseImageCache(base_dir, tmpdir)
+            self.assertEqual(cache.refs, {})
+
+    def test_evict_without_limit(self):
+        with utils.tempdir() as tmpdir:
+            cache = image_cache.BaseImageCache(tmpdir)
+            cache.fetch('abc', self._fake_fetch)
+            self.assertEqual(cache.evict(), [])
@@ -0,0 +1,100 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2011 University of Southern California
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+
+from nova.compute import power_state
+from nova import exception
+from nova import test
+from nova.virt.baremetal import inventory
+
+
+def _make_node(node_id, status=power_state.NOSTATE):
+    return {'node_id': node_id,
+            'ip_addr': '10.0.2.%d' % node_id,
+            'mac_addr': '00:1A:CA:00:58:%02d' % node_id,
+            'status': status,
+            'vcpus': 10,
+            'memory_mb': 16218,
+            'local_gb': 917,
+            'memory_mb_used': 476,
+            'local_gb_used': 1}
+
+
+class NodeInventoryTestCase(test.TestCase):
+
+    def setUp(self):
+        super(NodeInventoryTestCase, self).setUp()
+        self.inventory = inventory.NodeInventory(
+                [_make_node(node_id) for node_id in (6, 7, 8)])
+
+    def test_get(self):
+        self.assertEqual(self.inventory.get(7)['ip_addr'], '10.0.2.7')
+        self.assertEqual(self.inventory.get(42), None)
+        self.assertEqual(self.inventory.first()['node_id'], 6)
+        self.assertEqual(len(self.inventory), 3)
+
+    def test_add_duplicate(self):
+        self.assertRaises(exception.Duplicate, self.inventory.add,
+                          _make_node(6))
+
+    def test_allocate_in_order(self):
+        self.assertEqual(self.inventory.allocate()['node_id'], 6)
+        self.assertEqual(self.inventory.allocate()['node_id'], 7)
+        self.assertEqual(self.inventory.count(power_state.RUNNING), 2)
+        self.assertEqual(self.inventory.node_ids(power_state.NOSTATE), [8])
+
+    def test_allocate_exhausted(self):
+        for _i in xrange(3):
+            self.inventory.allocate()
+        self.assertRaises(exception.NotFound, self.inventory.allocate)
+
+    def test_freed_node_is_reused_last(self):
+        self.inventory.allocate()
+        self.inventory.set_status(6, power_state.NOSTATE)
+        self.assertEqual(self.inventory.node_ids(power_state.NOSTATE),
+                         [7, 8, 6])
+
+    def test_set_status_unknown_node(self):
+        self.assertFalse(self.inventory.set_status(42, power_state.RUNNING))
+
+    def test_capacity_is_updated_incrementally(self):
+        self.assertEqual(self.inventory.get_capacity(),
+                         {'vcpus': 30, 'vcpus_used': 0,
+                          'memory_mb': 48654, 'memory_mb_used': 1428,
+                          'local_gb': 2751, 'local_gb_used': 3})
+
+        self.inventory.allocate()
+        self.assertEqual(self.inventory.get_capacity(),
+                         {'vcpus': 30, 'vcpus_used': 10,
+                          'memory_mb': 48654, 'memory_mb_used': 17170,
+                          'local_gb': 2751, 'local_gb_used': 919})
+
+        self.inventory.set_status(6, power_state.NOSTATE)
+        self.assertEqual(self.inventory.get_capacity()['vcpus_used'], 0)
+        self.assertEqual(self.inventory.get_capacity()['memory_mb_used'],
+                         1428)
+
+    def test_listeners_are_told_about_status_changes(self):
+        changes = []
+        self.inventory.add_listener(lambda *args: changes.append(args))
+
+        self.inventory.allocate()
+        self.inventory.set_status(6, power_state.RUNNING)
+        self.inventory.set_status(6, power_state.NOSTATE)
+
+        self.assertEqual(changes,
+                         [(6, power_state.NOSTATE, power_state.RUNNING),
+                          (6, power_state.RUNNING, power_state.NOSTATE)])
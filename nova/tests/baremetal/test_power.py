@@ -0,0 +1,145 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2011 University of Southern California
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+
+import os
+
+from eventlet import greenpool
+from eventlet import greenthread
+
+from nova import exception
+from nova import test
+from nova.tests import fake_utils
+from nova import utils
+from nova.virt.baremetal import power
+
+
+class PDUMapTestCase(test.TestCase):
+
+    def test_read_pdu_map(self):
+        with utils.tempdir() as tmpdir:
+            fname = os.path.join(tmpdir, 'pdu_map')
+            with open(fname, 'w') as f:
+                f.write("# node_id pdu_address outlet\n"
+                        "6 10.0.100.2 6\n"
+                        "\n"
+                        "7 10.0.100.3 1\n")
+            self.assertEqual(power.read_pdu_map(fname),
+                             {6: ('10.0.100.2', 6), 7: ('10.0.100.3', 1)})
+
+    def test_read_missing_pdu_map(self):
+        self.assertEqual(power.read_pdu_map('/nonexistent/pdu_map'), {})
+
+    def test_unmapped_node_uses_legacy_outlet(self):
+        driver = power.PDUPowerDriver({6: ('10.0.100.3', 1)})
+        self.assertEqual(driver.get_outlet(6), ('10.0.100.3', 1))
+        self.assertEqual(driver.get_outlet(2), ('10.0.100.1', 7))
+        self.assertEqual(driver.get_outlet(9), ('10.0.100.2', 9))
+
+
+class CoalesceTestCase(test.TestCase):
+
+    def test_same_mode_is_merged(self):
+        ops = [(6, power.POWER_OFF), (7, power.POWER_OFF),
+               (8, power.POWER_ON)]
+        self.assertEqual(power.coalesce(ops),
+                         [(power.POWER_OFF, [(6, power.POWER_OFF),
+                                             (7, power.POWER_OFF)]),
+                          (power.POWER_ON, [(8, power.POWER_ON)])])
+
+    def test_outlet_order_is_kept(self):
+        ops = [(6, power.POWER_OFF), (6, power.POWER_REBOOT),
+               (7, power.POWER_OFF), (7, power.POWER_REBOOT)]
+        self.assertEqual(power.coalesce(ops),
+                         [(power.POWER_OFF, [(6, power.POWER_OFF),
+                                             (7, power.POWER_OFF)]),
+                          (power.POWER_REBOOT, [(6, power.POWER_REBOOT),
+                                                (7, power.POWER_REBOOT)])])
+
+
+class PDUPowerDriverTestCase(test.TestCase):
+
+    def setUp(self):
+        super(PDUPowerDriverTestCase, self).setUp()
+        self.flags(baremetal_pdu_batch_window=0)
+
+    def test_concurrent_operations_are_batched(self):
+        pdu_map = dict((node_id, ('10.0.100.%d' % (node_id % 2), node_id))
+                       for node_id in xrange(10))
+        driver = power.FakePDUPowerDriver(pdu_map)
+
+        pool = greenpool.GreenPool()
+        for node_id in xrange(10):
+            pool.spawn_n(driver.power, node_id, power.POWER_REBOOT)
+        pool.waitall()
+
+        self.assertEqual(sorted(driver.invocations),
+                         [('10.0.100.0', (0, 2, 4, 6, 8), power.POWER_REBOOT),
+                          ('10.0.100.1', (1, 3, 5, 7, 9), power.POWER_REBOOT)])
+        self.assertEqual(driver.outlet_modes[('10.0.100.1', 3)],
+                         power.POWER_REBOOT)
+
+    def test_pdu_mgr_command(self):
+        fake_utils.stub_out_utils_execute(self.stubs)
+        driver = power.PDUPowerDriver({6: ('10.0.100.2', 6),
+                                       7: ('10.0.100.2', 7)})
+
+        driver.power_many([6, 7], power.POWER_OFF)
+
+        self.assertEqual(fake_utils.fake_execute_get_log(),
+                         ['/tftpboot/pdu_mgr 10.0.100.2 6 2',
+                          '/tftpboot/pdu_mgr 10.0.100.2 7 2'])
+
+    def test_pdu_mgr_command_with_outlet_lists(self):
+        self.flags(baremetal_pdu_mgr_outlet_lists=True)
+        fake_utils.stub_out_utils_execute(self.stubs)
+        driver = power.PDUPowerDriver({6: ('10.0.100.2', 6),
+                                       7: ('10.0.100.2', 7)})
+
+        driver.power_many([6, 7], power.POWER_OFF)
+
+        self.assertEqual(fake_utils.fake_execute_get_log(),
+                         ['/tftpboot/pdu_mgr 10.0.100.2 6,7 2'])
+
+    def test_batches_of_a_pdu_are_sent_in_order(self):
+        driver = power.PDUPowerDriver({6: ('10.0.100.2', 6)})
+        switched = []
+
+        def fake_switch(pdu, outlets, mode):
+            # Powering off is slower than powering on
+            if mode == power.POWER_OFF:
+                greenthread.sleep(0.02)
+            switched.append(mode)
+
+        self.stubs.Set(driver, '_switch', fake_switch)
+        first = greenthread.spawn(driver.power, 6, power.POWER_OFF)
+        # Queued while the first batch is being sent
+        greenthread.sleep(0.005)
+        second = greenthread.spawn(driver.power, 6, power.POWER_ON)
+        first.wait()
+        second.wait()
+
+        self.assertEqual(switched, [power.POWER_OFF, power.POWER_ON])
+
+    def test_failure_is_raised_to_every_caller(self):
+        driver = power.FakePDUPowerDriver({6: ('10.0.100.2', 6)})
+
+        def fake_switch(pdu, outlets, mode):
+            raise exception.ProcessExecutionError()
+
+        self.stubs.Set(driver, '_switch', fake_switch)
+        self.assertRaises(exception.ProcessExecutionError,
+                          driver.power, 6, power.POWER_ON)
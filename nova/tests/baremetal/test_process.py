@@ -0,0 +1,57 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2011 University of Southern California
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+
+from eventlet import greenthread
+
+from nova import exception
+from nova import test
+from nova.virt.baremetal import process
+
+
+class ProcessTestCase(test.TestCase):
+
+    def test_execute_returns_output(self):
+        self.assertEqual(process.execute('cat', process_input='hello'),
+                         ('hello', ''))
+
+    def test_exit_code_is_checked(self):
+        self.assertRaises(exception.ProcessExecutionError,
+                          process.execute, 'false')
+        self.assertEqual(process.execute('false', check_exit_code=False),
+                         ('', ''))
+
+    def test_timeout_kills_and_reaps_child(self):
+        proc = process.spawn('sleep', '10', timeout=0.1)
+        self.assertRaises(exception.ProcessExecutionError, proc.wait)
+        self.assertTrue(proc.timed_out)
+        self.assertFalse(proc.running())
+        self.assertNotEqual(proc._obj.returncode, None)
+
+    def test_other_greenthreads_run_meanwhile(self):
+        proc = process.spawn('sleep', '0.2')
+        ticks = []
+        while proc.running():
+            ticks.append(1)
+            greenthread.sleep(0.01)
+        proc.wait()
+        self.assertTrue(len(ticks) > 1)
+
+    def test_cancel(self):
+        proc = process.spawn('sleep', '10')
+        proc.cancel()
+        self.assertRaises(exception.ProcessExecutionError, proc.wait)
+        self.assertFalse(proc.running())
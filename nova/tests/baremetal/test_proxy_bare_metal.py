@@ -17,6 +17,7 @@ import __builtin__
 
 import functools
 import mox
+import os
 import StringIO
 
 from nova import flags
@@ -28,6 +29,7 @@ from nova import exception
 
 from nova.virt.baremetal import proxy
 from nova.virt.baremetal import dom
+from nova.virt.baremetal import inventory
 
 FLAGS = flags.FLAGS
 
@@ -101,13 +103,16 @@ class DomainReadWriteTestCase(test.TestCase):
     def test_write_domain(self):
         """Write the domain to file"""
         self.mox.StubOutWithMock(__builtin__, 'open')
+        self.mox.StubOutWithMock(os, 'fsync')
+        self.mox.StubOutWithMock(os, 'rename')
+        self.mox.StubOutWithMock(utils, 'delete_if_exists')
         mock_file = self.mox.CreateMock(file)
         expected_json = '''[{"status": 1,
                "image_id": "1552326678", "vcpus": 1, "node_id": 6,
                "name": "instance-00000001", "memory_kb": 16777216,
                "mac_address": "02:16:3e:01:4e:c9", "kernel_id": "1896115634",
                "ramdisk_id": "", "ip_address": "10.5.1.2"}]'''
-        open('/tftpboot/test_fake_dom_file', 'w').AndReturn(mock_file)
+        open('/tftpboot/test_fake_dom_file.tmp', 'w').AndReturn(mock_file)
 
         # Check if the argument to file.write() represents the same
         # Python object as expected_json
@@ -115,13 +120,69 @@ class DomainReadWriteTestCase(test.TestCase):
         # because of ordering and whitespace
         mock_file.write(mox.Func(functools.partial(self.assertJSONEquals,
                                                    expected_json)))
+        mock_file.flush()
+        mock_file.fileno().AndReturn(42)
+        os.fsync(42)
         mock_file.close()
+        os.rename('/tftpboot/test_fake_dom_file.tmp',
+                  '/tftpboot/test_fake_dom_file')
+        utils.delete_if_exists('/tftpboot/test_fake_dom_file.journal')
 
         self.mox.ReplayAll()
 
         dom.write_domains('/tftpboot/test_fake_dom_file', fake_domains)
 
 
+class DomainJournalTestCase(test.TestCase):
+
+    def setUp(self):
+        super(DomainJournalTestCase, self).setUp()
+        self.flags(baremetal_driver='fake')
+
+    def _domain(self, name, status=power_state.RUNNING):
+        return dict(fake_domains[0], name=name, status=status)
+
+    def test_replay_journal(self):
+        with utils.tempdir() as tmpdir:
+            fname = os.path.join(tmpdir, 'dom_file')
+            dom.write_domains(fname,
+                              [self._domain('i-1'), self._domain('i-2')])
+            dom.append_domain_journal(fname, {'op': 'delete', 'name': 'i-1'})
+            dom.append_domain_journal(fname,
+                    {'op': 'put',
+                     'domain': self._domain('i-2', power_state.SHUTOFF)})
+            dom.append_domain_journal(fname,
+                    {'op': 'put', 'domain': self._domain('i-3')})
+
+            self.assertEqual(dom.read_domains(fname),
+                             [self._domain('i-2', power_state.SHUTOFF),
+                              self._domain('i-3')])
+
+    def test_torn_journal_record_is_ignored(self):
+        with utils.tempdir() as tmpdir:
+            fname = os.path.join(tmpdir, 'dom_file')
+            dom.write_domains(fname, [self._domain('i-1')])
+            dom.append_domain_journal(fname,
+                    {'op': 'put', 'domain': self._domain('i-2')})
+            with open(fname + '.journal', 'a') as f:
+                f.write('{"op": "delete", "na')
+
+            self.assertEqual(dom.read_domains(fname),
+                             [self._domain('i-1'), self._domain('i-2')])
+
+    def test_write_domains_compacts_journal(self):
+        with utils.tempdir() as tmpdir:
+            fname = os.path.join(tmpdir, 'dom_file')
+            dom.write_domains(fname, [])
+            dom.append_domain_journal(fname,
+                    {'op': 'put', 'domain': self._domain('i-1')})
+            dom.write_domains(fname, dom.read_domains(fname))
+
+            self.assertFalse(os.path.exists(fname + '.journal'))
+            self.assertFalse(os.path.exists(fname + '.tmp'))
+            self.assertEqual(dom.read_domains(fname), [self._domain('i-1')])
+
+
 class BareMetalDomTestCase(test.TestCase):
 
     def setUp(self):
@@ -228,6 +289,53 @@ class BareMetalDomTestCase(test.TestCase):
         # Expected values
         self.assertEquals(bmdom.find_domain('instance-00000001'), domain)
 
+    def test_domain_indexes(self):
+        self.mox.StubOutWithMock(dom, 'read_domains')
+        self.mox.StubOutWithMock(dom, 'write_domains')
+        self.mox.StubOutWithMock(dom, 'append_domain_journal')
+
+        domains = [dict(fake_domains[0])]
+        dom.read_domains('/tftpboot/test_fake_dom_file').AndReturn(domains)
+        dom.write_domains('/tftpboot/test_fake_dom_file', domains)
+        dom.append_domain_journal('/tftpboot/test_fake_dom_file',
+                                  {'op': 'delete',
+                                   'name': 'instance-00000001'})
+
+        self.mox.ReplayAll()
+
+        bmdom = dom.BareMetalDom()
+        self.assertEqual(bmdom.find_domain_by_node(6), domains[0])
+        self.assertEqual(bmdom.get_domain_info('instance-00000001'),
+                         [1, 16777216, 16777216, 1, 100])
+
+        bmdom.destroy_domain('instance-00000001')
+        self.assertEqual(bmdom.find_domain('instance-00000001'), [])
+        self.assertEqual(bmdom.find_domain_by_node(6), [])
+        self.assertEqual(bmdom.list_domains(), [])
+
+    def test_change_domain_state_is_journaled(self):
+        self.flags(baremetal_dom_journal_max_records=2)
+        self.mox.StubOutWithMock(dom, 'read_domains')
+        self.mox.StubOutWithMock(dom, 'write_domains')
+        self.mox.StubOutWithMock(dom, 'append_domain_journal')
+
+        domains = [dict(fake_domains[0])]
+        dom.read_domains('/tftpboot/test_fake_dom_file').AndReturn(domains)
+        dom.write_domains('/tftpboot/test_fake_dom_file', domains)
+        dom.append_domain_journal('/tftpboot/test_fake_dom_file',
+                                  {'op': 'put', 'domain': domains[0]})
+        dom.append_domain_journal('/tftpboot/test_fake_dom_file',
+                                  {'op': 'put', 'domain': domains[0]})
+        dom.write_domains('/tftpboot/test_fake_dom_file', domains)
+
+        self.mox.ReplayAll()
+
+        bmdom = dom.BareMetalDom()
+        bmdom.change_domain_state('instance-00000001', power_state.SHUTOFF)
+        self.assertEqual(bmdom.journal_records, 1)
+        bmdom.change_domain_state('instance-00000001', power_state.RUNNING)
+        self.assertEqual(bmdom.journal_records, 0)
+
 
 class ProxyBareMetalTestCase(test.TestCase):
 
@@ -270,3 +378,130 @@ class ProxyBareMetalTestCase(test.TestCase):
         self.assertEquals(info['num_cpu'], 1)
         self.assertEquals(info['cpu_time'], 100)
         self.assertEquals(info['max_mem'], 16777216)
+
+    def test_wrapped_methods_raise_their_errors(self):
+        conn = proxy.get_connection(True)
+        self.assertRaises(exception.Invalid, conn.attach_volume,
+                          'instance-00000001', '/dev/sdb', '/dev/vdb')
+        self.assertRaises(exception.Invalid, conn.snapshot,
+                          {'name': 'instance-00000001'}, '123456')
+        self.assertRaises(NotImplementedError, conn.get_vnc_console,
+                          {'name': 'instance-00000001'})
+
+
+class HostStateTestCase(test.TestCase):
+
+    def setUp(self):
+        super(HostStateTestCase, self).setUp()
+        self.flags(baremetal_driver='fake')
+        self.conn = proxy.get_connection(True)
+        self.calls = []
+        self.listeners = []
+        self.vcpus_used = 0
+        stats = {'get_vcpu_total': 10,
+                 'get_cpu_info': 'TILEPro64',
+                 'get_local_gb_total': 917,
+                 'get_local_gb_used': 1,
+                 'get_memory_mb_total': 16218,
+                 'get_memory_mb_used': 476,
+                 'get_hypervisor_type': 'tilera_hv',
+                 'get_hypervisor_version': 1}
+        for name, value in stats.iteritems():
+            self.stubs.Set(self.conn, name,
+                           functools.partial(self._stat, name, value))
+        self.stubs.Set(self.conn, 'get_vcpu_used', self._vcpu_used)
+        self.stubs.Set(self.conn.baremetal_nodes, 'add_status_listener',
+                       self.listeners.append)
+
+    def _stat(self, name, value):
+        self.calls.append(name)
+        return value
+
+    def _vcpu_used(self):
+        return self._stat('get_vcpu_used', self.vcpus_used)
+
+    def test_stats_are_computed_once(self):
+        stats = self.conn.get_host_stats()
+        self.assertEqual(len(self.calls), 9)
+        self.assertEqual(stats['disk_available'], 916)
+        self.assertEqual(stats['host_memory_free'], 15742)
+        self.assertEqual(stats['vcpus_used'], 0)
+        self.assertEqual(
+            stats['instance_type_extra_specs']['hypervisor_type'],
+            'tilera_hv')
+
+        self.conn.get_host_stats(refresh=True)
+        self.assertEqual(len(self.calls), 9)
+
+    def test_node_change_updates_usage_stats(self):
+        self.conn.get_host_stats()
+        self.calls = []
+        self.vcpus_used = 1
+
+        for listener in self.listeners:
+            listener(6, power_state.NOSTATE, power_state.RUNNING)
+        self.assertEqual(self.conn.get_host_stats()['vcpus_used'], 1)
+        self.assertEqual(sorted(self.calls),
+                         ['get_local_gb_used', 'get_memory_mb_used',
+                          'get_vcpu_used'])
+
+        self.calls = []
+        self.conn.get_host_stats(refresh=True)
+        self.assertEqual(self.calls, [])
+
+    def test_destroy_updates_usage_stats(self):
+        class FakeDom(object):
+            def destroy_domain(self, name):
+                pass
+
+        self.stubs.Set(dom, 'BareMetalDom', FakeDom)
+        self.conn.get_host_stats()
+        self.calls = []
+        self.vcpus_used = 1
+
+        self.conn.destroy({'name': 'instance-00000001'}, None, cleanup=False)
+        self.assertEqual(self.conn.get_host_stats()['vcpus_used'], 1)
+        self.assertEqual(sorted(self.calls),
+                         ['get_local_gb_used', 'get_memory_mb_used',
+                          'get_vcpu_used'])
+
+
+class HostStateCapacityTestCase(test.TestCase):
+
+    def setUp(self):
+        super(HostStateCapacityTestCase, self).setUp()
+        self.flags(baremetal_driver='fake')
+        self.conn = proxy.get_connection(True)
+        nodes = []
+        for node_id in (6, 7):
+            nodes.append({'node_id': node_id,
+                          'status': power_state.NOSTATE,
+                          'vcpus': 10,
+                          'memory_mb': 16218,
+                          'local_gb': 917,
+                          'memory_mb_used': 476,
+                          'local_gb_used': 1})
+        self.inventory = inventory.NodeInventory(nodes)
+        self.stubs.Set(self.conn.baremetal_nodes, 'get_capacity',
+                       self.inventory.get_capacity)
+        self.stubs.Set(self.conn.baremetal_nodes, 'add_status_listener',
+                       self.inventory.add_listener)
+
+    def test_stats_follow_node_allocation(self):
+        stats = self.conn.get_host_stats()
+        self.assertEqual(stats['vcpus'], 20)
+        self.assertEqual(stats['vcpus_used'], 0)
+        self.assertEqual(stats['disk_total'], 1834)
+        self.assertEqual(stats['disk_used'], 2)
+        self.assertEqual(stats['host_memory_free'], 32436 - 952)
+
+        node = self.inventory.allocate()
+        stats = self.conn.get_host_stats()
+        self.assertEqual(stats['vcpus_used'], 10)
+        self.assertEqual(stats['disk_used'], 918)
+        self.assertEqual(stats['host_memory_free'], 32436 - 16694)
+
+        self.inventory.set_status(node['node_id'], power_state.NOSTATE)
+        stats = self.conn.get_host_stats()
+        self.assertEqual(stats['vcpus_used'], 0)
+        self.assertEqual(stats['disk_used'], 2)
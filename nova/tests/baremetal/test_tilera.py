@@ -18,7 +18,10 @@
 import __builtin__
 import StringIO
 
+from nova.compute import power_state
+from nova import exception
 from nova import test
+from nova.virt.baremetal import process
 from nova.virt.baremetal import tilera
 
 
@@ -82,3 +85,109 @@ class TileraBareMetalNodesTestCase(test.TestCase):
         self.mox.ReplayAll()
         nodes = tilera.BareMetalNodes()
         self.assertEqual(nodes.get_hw_info('vcpus'), 10)
+
+    def test_get_hw_info_by_node(self):
+        nodes = self._get_nodes()
+        self.assertEqual(nodes.get_hw_info('memory_mb', node_id=9), 16385)
+        self.assertEqual(nodes.get_hw_info('memory_mb', node_id=6), 16218)
+
+    def test_get_idle_node_and_free_node(self):
+        nodes = self._get_nodes()
+        node_id = nodes.get_idle_node()
+        self.assertEqual(node_id, 6)
+        self.assertEqual(nodes.get_capacity()['vcpus_used'], 10)
+
+        nodes.free_node(str(node_id))
+        self.assertEqual(nodes.get_capacity()['vcpus_used'], 0)
+        self.assertEqual(nodes.get_ip_by_id(6), '10.0.2.7')
+
+    def _get_nodes(self):
+        self.mox.StubOutWithMock(__builtin__, 'open')
+
+        open("/tftpboot/tilera_boards",
+             "r").AndReturn(StringIO.StringIO(self.board_info))
+
+        self.mox.ReplayAll()
+        nodes = tilera.BareMetalNodes()
+        self.mox.VerifyAll()
+        self.mox.UnsetStubs()
+        return nodes
+
+    def test_wait_for_activation_backs_off(self):
+        self.flags(tile_poll_interval=1, tile_poll_max_interval=4,
+                   tile_boot_timeout=1000)
+        nodes = self._get_nodes()
+        probes = [False, False, False, False, True]
+        sleeps = []
+        self.stubs.Set(nodes, 'is_reachable',
+                       lambda node_ip, mac_addr=None: probes.pop(0))
+        self.stubs.Set(nodes, 'sleep_mgr', sleeps.append)
+
+        self.assertTrue(nodes.wait_for_activation(6, '10.0.2.7'))
+        self.assertEqual(sleeps, [1, 2, 4, 4])
+
+    def test_wait_for_activation_times_out(self):
+        self.flags(tile_boot_timeout=0)
+        nodes = self._get_nodes()
+        sleeps = []
+        self.stubs.Set(nodes, 'is_reachable',
+                       lambda node_ip, mac_addr=None: False)
+        self.stubs.Set(nodes, 'sleep_mgr', sleeps.append)
+
+        self.assertFalse(nodes.wait_for_activation(6, '10.0.2.7'))
+        self.assertEqual(sleeps, [])
+
+    def test_activate_node_records_timings(self):
+        nodes = self._get_nodes()
+        self.stubs.Set(nodes, 'power_mgr', lambda node_id, mode: None)
+        self.stubs.Set(nodes, 'check_activated',
+                       lambda node_id, node_ip: True)
+        self.stubs.Set(nodes, 'configure_node', lambda *args: None)
+        self.stubs.Set(nodes, 'iptables_set', lambda *args: None)
+
+        state = nodes.activate_node(6, '10.0.2.7', 'instance-00000001',
+                                    '02:16:3e:01:4e:c9', '10.5.1.2', '')
+
+        self.assertEqual(state, power_state.RUNNING)
+        self.assertEqual(sorted(nodes.get_activation_timings(6).keys()),
+                         ['boot', 'configure', 'iptables', 'power_cycle',
+                          'total'])
+
+    def test_activate_nodes(self):
+        nodes = self._get_nodes()
+
+        def fake_activate_node(node_id, *args):
+            if node_id == 7:
+                raise exception.NovaException()
+            return power_state.RUNNING
+
+        self.stubs.Set(nodes, 'activate_node', fake_activate_node)
+        requests = [dict(node_id=node_id, node_ip='10.0.2.%d' % node_id,
+                         name='instance-%08x' % node_id,
+                         mac_address='02:16:3e:01:4e:c9',
+                         ip_address='10.5.1.%d' % node_id)
+                    for node_id in (6, 7, 8)]
+
+        self.assertEqual(nodes.activate_nodes(requests),
+                         {6: power_state.RUNNING,
+                          7: power_state.FAILED,
+                          8: power_state.RUNNING})
+
+    def test_configure_node_uses_one_monitor_session(self):
+        nodes = self._get_nodes()
+        commands = []
+
+        def fake_execute(*cmd, **kwargs):
+            commands.append(' '.join(cmd))
+            return '', ''
+
+        self.stubs.Set(process, 'execute', fake_execute)
+        nodes.configure_node('10.0.2.7', '02:16:3e:01:4e:c9', '10.5.1.2')
+
+        self.assertEqual(commands,
+                         ['/usr/local/TileraMDE/bin/tile-monitor --resume '
+                          '--net 10.0.2.7 '
+                          '--run - ifconfig xgbe0 hw ether 02:16:3e:01:4e:c9 '
+                          '- --wait '
+                          '--run - ifconfig xgbe0 10.5.1.2 - --wait '
+                          '--run - /usr/sbin/sshd - --wait --quit'])
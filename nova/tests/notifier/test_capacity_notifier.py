@@ -57,3 +57,17 @@ class CapacityNotifierTestCase(test.TestCase):
                        _verify_called)
         msg = self._make_msg("myhost", "delete.end")
         self.assertTrue(cn.notify(msg))
+
+    def test_create_end_releases_claims(self):
+        def _verify_called(host, context, free_ram_mb_delta,
+                           free_disk_gb_delta, work_delta, vm_delta,
+                           instance_uuid):
+            self.assertEquals(work_delta, -1)
+            self.assertEquals(vm_delta, 0)
+            self.assertEquals(instance_uuid, 'fake-uuid')
+
+        self.stubs.Set(nova.db.api, "compute_node_utilization_update",
+                       _verify_called)
+        msg = self._make_msg("myhost", "create.end")
+        msg['payload']['instance_id'] = 'fake-uuid'
+        self.assertTrue(cn.notify(msg))
@@ -16,6 +16,8 @@
 Fakes For Scheduler tests.
 """
 
+import datetime
+
 import mox
 
 from nova import db
@@ -23,6 +25,7 @@ from nova.compute import instance_types
 from nova.compute import vm_states
 from nova.scheduler import filter_scheduler
 from nova.scheduler import host_manager
+from nova import utils
 
 
 COMPUTE_NODES = [
@@ -102,6 +105,34 @@ class FakeHostState(host_manager.HostState):
             setattr(self, key, val)
 
 
+def mixed_host_states(num_hosts):
+    """Returns compute host states with mixed resources, some disabled,
+    down or in another availability zone."""
+    now = utils.utcnow()
+    host_states = {}
+    for i in xrange(num_hosts):
+        host = 'host%03d' % i
+        updated_at = now
+        if i % 7 == 3:
+            updated_at = now - datetime.timedelta(hours=1)
+        service = {'host': host,
+                   'disabled': i % 11 == 5,
+                   'updated_at': updated_at,
+                   'created_at': now,
+                   'availability_zone': 'nova' if i % 5 else 'other'}
+        capabilities = {'compute': {
+                'enabled': i % 13 != 7,
+                'instance_type_extra_specs': {'opt1': i % 2}}}
+        host_state = host_manager.HostState(host, 'compute',
+                capabilities=capabilities, service=service)
+        host_state.update_from_compute_node(
+                dict(local_gb=20 + i % 40,
+                     memory_mb=1024 + (i * 37) % 4096,
+                     vcpus=[0, 1, 2, 4][i % 4]))
+        host_states[host] = host_state
+    return host_states
+
+
 class FakeInstance(object):
     def __init__(self, context=None, params=None, type_name='m1.tiny'):
         """Create a test instance. Returns uuid"""
@@ -139,4 +170,5 @@ def mox_host_manager_db_calls(mock, context):
     mock.StubOutWithMock(db, 'instance_get_all')
 
     db.compute_node_get_all(mox.IgnoreArg()).AndReturn(COMPUTE_NODES)
-    db.instance_get_all(mox.IgnoreArg()).AndReturn(INSTANCES)
+    db.instance_get_all(mox.IgnoreArg(),
+            columns=host_manager.INSTANCE_USAGE_COLUMNS).AndReturn(INSTANCES)
@@ -19,7 +19,9 @@ Tests For Distributed Scheduler.
 import mox
 
 from nova import context
+from nova import db
 from nova import exception
+from nova.scheduler import driver
 from nova.scheduler import least_cost
 from nova.scheduler import host_manager
 from nova.scheduler import filter_scheduler
@@ -28,7 +30,7 @@ from nova.tests.scheduler import fakes
 from nova.tests.scheduler import test_scheduler
 
 
-def fake_filter_hosts(hosts, filter_properties):
+def fake_filter_hosts(hosts, filter_properties, **kwargs):
     return list(hosts)
 
 
@@ -164,6 +166,82 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
         for weighted_host in weighted_hosts:
             self.assertTrue(weighted_host.host_state is not None)
 
+    def _schedule_with_stats(self, num_instances):
+        self.flags(reserved_host_memory_mb=0,
+                   scheduler_default_filters=['RamFilter', 'ComputeFilter'])
+        fake_context = context.RequestContext('user', 'project',
+                is_admin=True)
+        request_spec = {'num_instances': num_instances,
+                        'instance_type': {'memory_mb': 1024, 'vcpus': 1},
+                        'instance_properties': {'root_gb': 1,
+                                                'ephemeral_gb': 0,
+                                                'memory_mb': 1024,
+                                                'vcpus': 1}}
+        sched = fakes.FakeFilterScheduler()
+        host_states = fakes.mixed_host_states(20)
+        self.stubs.Set(sched.host_manager, 'get_all_host_states',
+                       lambda context, topic: host_states)
+        weighted_hosts = sched._schedule(fake_context, 'compute',
+                                         request_spec)
+        return weighted_hosts, sched.get_scheduler_stats()
+
+    def test_schedule_records_stats(self):
+        self.flags(scheduler_stats=True)
+        weighted_hosts, stats = self._schedule_with_stats(2)
+        self.assertEqual(len(weighted_hosts), 2)
+
+        counters = stats['counters']
+        self.assertEqual(counters['requests'], 1)
+        self.assertEqual(counters['instances_requested'], 2)
+        self.assertEqual(counters['instances_placed'], 2)
+        # Each host is first given to the RamFilter, then to the
+        # ComputeFilter if it passed
+        self.assertTrue(counters['filter.RamFilter.hosts_in'] >= 20)
+        self.assertTrue(counters['filter.RamFilter.hosts_out'] <=
+                        counters['filter.RamFilter.hosts_in'])
+        self.assertEqual(counters['filter.ComputeFilter.hosts_in'],
+                         counters['filter.RamFilter.hosts_out'])
+
+        histograms = stats['histograms']
+        for name in ('total', 'get_all_host_states', 'filter.RamFilter',
+                     'filter.ComputeFilter',
+                     'cost.compute_fill_first_cost_fn'):
+            self.assertEqual(histograms['%s.seconds' % name]['count'], 1)
+        self.assertEqual(len(stats['traces']), 1)
+        self.assertEqual(stats['traces'][0]['hosts']['filter.RamFilter'],
+                         [counters['filter.RamFilter.hosts_in'],
+                          counters['filter.RamFilter.hosts_out']])
+
+    def test_schedule_records_failed_requests(self):
+        self.flags(scheduler_stats=True)
+        sched = fakes.FakeFilterScheduler()
+
+        def fake_get_all_host_states(context, topic):
+            raise exception.NovaException('boom')
+
+        self.stubs.Set(sched.host_manager, 'get_all_host_states',
+                       fake_get_all_host_states)
+        fake_context = context.RequestContext('user', 'project',
+                is_admin=True)
+        request_spec = {'num_instances': 2,
+                        'instance_type': {'memory_mb': 1024, 'vcpus': 1},
+                        'instance_properties': {'memory_mb': 1024}}
+        self.assertRaises(exception.NovaException, sched._schedule,
+                          fake_context, 'compute', request_spec)
+
+        stats = sched.get_scheduler_stats()
+        self.assertEqual(stats['counters']['requests'], 1)
+        self.assertEqual(stats['counters']['requests_failed'], 1)
+        self.assertEqual(stats['counters']['instances_placed'], 0)
+        self.assertEqual(stats['histograms']['total.seconds']['count'], 1)
+        self.assertTrue(stats['traces'][0]['failed'])
+
+    def test_schedule_records_no_stats_by_default(self):
+        weighted_hosts, stats = self._schedule_with_stats(2)
+        self.assertEqual(len(weighted_hosts), 2)
+        self.assertEqual(stats, {'counters': {}, 'histograms': {},
+                                 'traces': []})
+
     def test_get_cost_functions(self):
         self.flags(reserved_host_memory_mb=128)
         fixture = fakes.FakeFilterScheduler()
@@ -175,3 +253,113 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
         hostinfo.update_from_compute_node(dict(memory_mb=1000,
                 local_gb=0, vcpus=1))
         self.assertEquals(1000 - 128, fn(hostinfo, {}))
+
+    def test_batch_placement_matches_sequential_placement(self):
+        self.flags(reserved_host_memory_mb=0,
+                   scheduler_default_filters=['AvailabilityZoneFilter',
+                                              'RamFilter',
+                                              'ComputeFilter'])
+        fake_context = context.RequestContext('user', 'project',
+                is_admin=True)
+        request_spec = {'num_instances': 30,
+                        'instance_type': {'memory_mb': 1024, 'vcpus': 1},
+                        'instance_properties': {'availability_zone': 'nova',
+                                                'root_gb': 1,
+                                                'ephemeral_gb': 0,
+                                                'memory_mb': 1024,
+                                                'vcpus': 1}}
+
+        results = []
+        for batch in (False, True):
+            self.flags(scheduler_batch_placement=batch)
+            sched = fakes.FakeFilterScheduler()
+            host_states = fakes.mixed_host_states(100)
+            self.stubs.Set(sched.host_manager, 'get_all_host_states',
+                           lambda context, topic: host_states)
+            weighted_hosts = sched._schedule(fake_context, 'compute',
+                                             request_spec)
+            results.append([(w.weight, w.host_state.host)
+                            for w in weighted_hosts])
+        self.assertEqual(len(results[0]), 30)
+        self.assertEqual(results[1], results[0])
+
+    def test_schedule_run_instance_batch(self):
+        self.flags(scheduler_batch_placement=True)
+        fake_context = context.RequestContext('user', 'project')
+        request_spec = {'num_instances': 2,
+                        'instance_properties': {'project_id': 1}}
+        weighted_hosts = [
+                least_cost.WeightedHost(1, host_manager.HostState('host1',
+                                                                  'compute')),
+                least_cost.WeightedHost(2, host_manager.HostState('host2',
+                                                                  'compute'))]
+
+        def _is_placed(hosts):
+            def _check(base_options_list):
+                return ([(options['host'], options['launch_index'])
+                         for options in base_options_list] ==
+                        zip(hosts, range(len(hosts))))
+            return _check
+
+        self.mox.StubOutWithMock(self.driver, '_schedule')
+        self.mox.StubOutWithMock(self.driver, 'create_instance_db_entries')
+        self.mox.StubOutWithMock(driver, 'cast_to_compute_host')
+
+        self.driver._schedule(mox.IgnoreArg(), 'compute',
+                              request_spec).AndReturn(weighted_hosts)
+        self.driver.create_instance_db_entries(mox.IgnoreArg(),
+                request_spec, mox.Func(_is_placed(['host1', 'host2']))
+                ).AndReturn([{'id': 1, 'uuid': 'fake-uuid1'},
+                             {'id': 2, 'uuid': 'fake-uuid2'}])
+        driver.cast_to_compute_host(mox.IgnoreArg(), 'host1',
+                'run_instance', update_db=False, instance_uuid='fake-uuid1')
+        driver.cast_to_compute_host(mox.IgnoreArg(), 'host2',
+                'run_instance', update_db=False, instance_uuid='fake-uuid2')
+        self.mox.ReplayAll()
+
+        instances = self.driver.schedule_run_instance(fake_context,
+                                                      request_spec)
+        self.assertEqual([instance['id'] for instance in instances], [1, 2])
+
+    def test_schedule_run_instance_records_resource_claims(self):
+        self.flags(scheduler_batch_placement=True,
+                   scheduler_resource_claims=True)
+        fake_context = context.RequestContext('user', 'project')
+        usage = {'memory_mb': 512, 'root_gb': 1, 'ephemeral_gb': 0,
+                 'vcpus': 1}
+        request_spec = {'num_instances': 2,
+                        'instance_properties': dict(usage, project_id=1)}
+        weighted_hosts = [
+                least_cost.WeightedHost(1, host_manager.HostState('host1',
+                                                                  'compute')),
+                least_cost.WeightedHost(2, host_manager.HostState('host2',
+                                                                  'compute'))]
+
+        self.mox.StubOutWithMock(self.driver, '_schedule')
+        self.mox.StubOutWithMock(self.driver, 'create_instance_db_entries')
+        self.mox.StubOutWithMock(db, 'resource_claims_create')
+        self.mox.StubOutWithMock(driver, 'cast_to_compute_host')
+
+        self.driver._schedule(mox.IgnoreArg(), 'compute',
+                              request_spec).AndReturn(weighted_hosts)
+        self.driver.create_instance_db_entries(mox.IgnoreArg(),
+                request_spec, mox.IgnoreArg()).AndReturn(
+                        [{'id': 1, 'uuid': 'fake-uuid1'},
+                         {'id': 2, 'uuid': 'fake-uuid2'}])
+        db.resource_claims_create(mox.IgnoreArg(),
+                [dict(usage, host='host1', instance_uuid='fake-uuid1',
+                      expires_at=mox.IgnoreArg()),
+                 dict(usage, host='host2', instance_uuid='fake-uuid2',
+                      expires_at=mox.IgnoreArg())]).AndReturn(
+                        [{'id': 7, 'created_at': None},
+                         {'id': 8, 'created_at': None}])
+        driver.cast_to_compute_host(mox.IgnoreArg(), 'host1',
+                'run_instance', update_db=False, instance_uuid='fake-uuid1')
+        driver.cast_to_compute_host(mox.IgnoreArg(), 'host2',
+                'run_instance', update_db=False, instance_uuid='fake-uuid2')
+        self.mox.ReplayAll()
+
+        self.driver.schedule_run_instance(fake_context, request_spec)
+        # The next look at the claims does not consume them again
+        self.assertEqual(sorted(self.driver.host_manager.seen_claims),
+                         [7, 8])
@@ -21,6 +21,7 @@ from nova import context
 from nova import exception
 from nova import flags
 from nova.scheduler import filters
+from nova.scheduler.filters import json_filter
 from nova import test
 from nova.tests.scheduler import fakes
 from nova import utils
@@ -512,6 +513,38 @@ class HostFiltersTestCase(test.TestCase):
         filter_properties = {'query': json.dumps(raw)}
         self.assertFalse(filt_cls.host_passes(host, filter_properties))
 
+    def test_json_filter_scheduler_hints_query(self):
+        filt_cls = self.class_map['JsonFilter']()
+        raw = ['and',
+                  ['>=', '$free_ram_mb', 1024],
+                  ['=', '$capabilities.enabled', True],
+                  ['or', ['=', 1, 2], ['in', '$service.host', 'h1', 'h2']]]
+        filter_properties = {'scheduler_hints': {'query': json.dumps(raw)}}
+        host = fakes.FakeHostState('host1', 'compute',
+                {'free_ram_mb': 1024,
+                 'capabilities': {'enabled': True},
+                 'service': {'host': 'h2'}})
+        self.assertTrue(filt_cls.host_passes(host, filter_properties))
+        host.service = {'host': 'h3'}
+        self.assertFalse(filt_cls.host_passes(host, filter_properties))
+        host.service = {'host': 'h1'}
+        host.capabilities = {'enabled': False}
+        self.assertFalse(filt_cls.host_passes(host, filter_properties))
+
+    def test_json_filter_compiled_queries_are_cached(self):
+        self.flags(scheduler_json_filter_cache_size=2)
+        queries = [json.dumps(['=', '$free_ram_mb', i]) for i in xrange(3)]
+        compiled = json_filter.get_compiled_query(queries[0])
+        self.assertTrue(json_filter.get_compiled_query(queries[0]) is
+                        compiled)
+        json_filter.get_compiled_query(queries[1])
+        json_filter.get_compiled_query(queries[0])
+        json_filter.get_compiled_query(queries[2])
+        self.assertEqual(json_filter._compiled_queries.keys()[-2:],
+                         [queries[0], queries[2]])
+        self.assertTrue(json_filter.get_compiled_query(queries[0]) is
+                        compiled)
+
     def test_json_filter_unknown_operator_raises(self):
         filt_cls = self.class_map['JsonFilter']()
         raw = ['!=', 1, 2]
@@ -18,14 +18,20 @@ Tests For HostManager
 
 import datetime
 
+import mox
+
 from nova import db
 from nova import exception
+from nova import flags
 from nova.scheduler import host_manager
 from nova import test
 from nova.tests.scheduler import fakes
 from nova import utils
 
 
+FLAGS = flags.FLAGS
+
+
 class ComputeFilterClass1(object):
     def host_passes(self, *args, **kwargs):
         pass
@@ -43,6 +49,10 @@ class HostManagerTestCase(test.TestCase):
         super(HostManagerTestCase, self).setUp()
         self.host_manager = host_manager.HostManager()
 
+    def tearDown(self):
+        utils.clear_time_override()
+        super(HostManagerTestCase, self).tearDown()
+
     def test_choose_host_filters_not_found(self):
         self.flags(scheduler_default_filters='ComputeFilterClass3')
         self.host_manager.filter_classes = [ComputeFilterClass1,
@@ -176,10 +186,13 @@ class HostManagerTestCase(test.TestCase):
         self.assertEqual(service_states, expected)
 
     def test_get_service_capabilities(self):
+        self.flags(periodic_interval=5)
+        utils.set_time_override(datetime.datetime.fromtimestamp(3020))
+
         host1_compute_capabs = dict(free_memory=1000, host_memory=5678,
-                timestamp=datetime.datetime.fromtimestamp(3000))
+                timestamp=datetime.datetime.fromtimestamp(3010))
         host1_volume_capabs = dict(free_disk=4321,
-                timestamp=datetime.datetime.fromtimestamp(3005))
+                timestamp=datetime.datetime.fromtimestamp(3000))
         host2_compute_capabs = dict(free_memory=8756,
                 timestamp=datetime.datetime.fromtimestamp(3010))
         host2_volume_capabs = dict(free_disk=8756,
@@ -198,43 +211,47 @@ class HostManagerTestCase(test.TestCase):
                                     'volume': host3_volume_capabs}}
         self.host_manager.service_states = service_states
 
-        info = {'called': 0}
-
         # This tests with 1 volume disabled (host2), and 1 volume node
         # as stale (host1)
-        def _fake_host_service_caps_stale(host, service):
-            info['called'] += 1
-            if host == 'host1':
-                if service == 'compute':
-                    return False
-                elif service == 'volume':
-                    return True
-            elif host == 'host2':
-                # Shouldn't get here for 'volume' because the service
-                # is disabled
-                self.assertEqual(service, 'compute')
-                return False
-            self.assertEqual(host, 'host3')
-            return False
-
-        self.stubs.Set(self.host_manager, 'host_service_caps_stale',
-                _fake_host_service_caps_stale)
-
-        self.mox.StubOutWithMock(self.host_manager,
-                'delete_expired_host_services')
-        self.host_manager.delete_expired_host_services({'host1': ['volume']})
-
-        self.mox.ReplayAll()
         result = self.host_manager.get_service_capabilities()
 
-        self.assertEqual(info['called'], 5)
-
         # only 1 volume node active == 'host3', so min/max is 2000
         expected = {'volume_free_disk': (2000, 2000),
                     'compute_host_memory': (4000, 5678),
                     'compute_free_memory': (1000, 8756)}
 
         self.assertDictMatch(result, expected)
+        self.assertEqual(service_states['host1'],
+                         {'compute': host1_compute_capabs})
+
+    def test_get_service_capabilities_follows_updates(self):
+        self.flags(periodic_interval=5)
+        utils.set_time_override(datetime.datetime.fromtimestamp(3000))
+        self.host_manager.update_service_capabilities('compute', 'host1',
+                dict(free_memory=1000))
+        self.host_manager.update_service_capabilities('compute', 'host2',
+                dict(free_memory=2000))
+        self.assertDictMatch(self.host_manager.get_service_capabilities(),
+                             {'compute_free_memory': (1000, 2000)})
+
+        # A new report replaces the values of the previous one
+        utils.advance_time_seconds(10)
+        self.host_manager.update_service_capabilities('compute', 'host2',
+                dict(free_memory=500))
+        self.assertDictMatch(self.host_manager.get_service_capabilities(),
+                             {'compute_free_memory': (500, 1000)})
+
+        # Disabled services are left out
+        self.host_manager.update_service_capabilities('compute', 'host2',
+                dict(free_memory=3000, enabled=False))
+        self.assertDictMatch(self.host_manager.get_service_capabilities(),
+                             {'compute_free_memory': (1000, 1000)})
+
+        # host1 expires, its service is dropped along with its values
+        utils.advance_time_seconds(10)
+        self.assertDictMatch(self.host_manager.get_service_capabilities(),
+                             {})
+        self.assertEqual(self.host_manager.service_states.keys(), ['host2'])
 
     def test_get_all_host_states(self):
         self.flags(reserved_host_memory_mb=512,
@@ -250,7 +267,9 @@ class HostManagerTestCase(test.TestCase):
         db.compute_node_get_all(context).AndReturn(fakes.COMPUTE_NODES)
         # Invalid service
         host_manager.LOG.warn("No service for compute ID 5")
-        db.instance_get_all(context).AndReturn(fakes.INSTANCES)
+        db.instance_get_all(context,
+                columns=host_manager.INSTANCE_USAGE_COLUMNS).AndReturn(
+                        fakes.INSTANCES)
 
         self.mox.ReplayAll()
         host_states = self.host_manager.get_all_host_states(context, topic)
@@ -275,6 +294,230 @@ class HostManagerTestCase(test.TestCase):
         # 8191GB
         self.assertEqual(host_states['host4'].free_disk_mb, 8387584)
 
+    def _build_host_states(self, context, instances=fakes.INSTANCES,
+                           claims=None):
+        self.mox.StubOutWithMock(db, 'compute_node_get_all')
+        self.mox.StubOutWithMock(db, 'instance_get_all')
+        db.compute_node_get_all(context).AndReturn(fakes.COMPUTE_NODES)
+        db.instance_get_all(context,
+                columns=host_manager.INSTANCE_USAGE_COLUMNS).AndReturn(
+                        instances)
+        if claims is not None:
+            self.mox.StubOutWithMock(db, 'resource_claim_get_all')
+            db.resource_claim_get_all(context).AndReturn(claims)
+        self.mox.ReplayAll()
+        host_states = self.host_manager.get_all_host_states(context,
+                                                            'compute')
+        self.mox.VerifyAll()
+        self.mox.UnsetStubs()
+        self.mox.ResetAll()
+        return host_states
+
+    def test_get_all_host_states_is_cached(self):
+        self.flags(reserved_host_memory_mb=0)
+        context = 'fake_context'
+        host_states = self._build_host_states(context)
+
+        self.mox.ReplayAll()
+        self.assertEqual(self.host_manager.get_all_host_states(context,
+                                                               'compute'),
+                         host_states)
+
+        self.host_manager.update_instance_usage('host4', 'create',
+                dict(root_gb=1, ephemeral_gb=0, memory_mb=1024, vcpus=2))
+        self.assertEqual(host_states['host4'].free_ram_mb, 7168)
+        self.assertEqual(host_states['host4'].vcpus_used, 2)
+        self.host_manager.update_instance_usage('host3', 'delete',
+                fakes.INSTANCES[3])
+        self.assertEqual(host_states['host3'].free_ram_mb, 4096)
+        self.assertEqual(host_states['host3'].vcpus_used, 0)
+        # Events for unknown hosts are ignored
+        self.host_manager.update_instance_usage('host5', 'delete',
+                fakes.INSTANCES[5])
+
+        self.host_manager.update_service_capabilities('compute', 'host1',
+                dict(enabled=False))
+        self.assertEqual(host_states['host1'].capabilities['enabled'],
+                         False)
+
+    def test_get_all_host_states_refreshes_services(self):
+        context = 'fake_context'
+        utils.set_time_override(datetime.datetime(2012, 5, 1, 0, 0, 0))
+        host_states = self._build_host_states(context)
+
+        utils.advance_time_seconds(FLAGS.scheduler_service_refresh_interval)
+        services = [dict(host='host1', topic='compute', disabled=True),
+                    dict(host='host1', topic='volume', disabled=False),
+                    dict(host='host6', topic='compute', disabled=False)]
+        host6 = dict(services[2],
+                     compute_node=[dict(local_gb=16, memory_mb=2048,
+                                        vcpus=4)])
+        self.mox.StubOutWithMock(db, 'service_get_all')
+        self.mox.StubOutWithMock(db, 'service_get_all_compute_by_host')
+        self.mox.StubOutWithMock(db, 'instance_get_all_by_host')
+        db.service_get_all(context).AndReturn(services)
+        db.service_get_all_compute_by_host(context, 'host6').AndReturn(
+                [host6])
+        db.instance_get_all_by_host(context, 'host6',
+                columns=host_manager.INSTANCE_USAGE_COLUMNS).AndReturn(
+                [fakes.INSTANCES[0]])
+        self.mox.ReplayAll()
+        host_states = self.host_manager.get_all_host_states(context,
+                                                            'compute')
+
+        self.assertEqual(sorted(host_states), ['host1', 'host6'])
+        self.assertEqual(host_states['host1'].service['disabled'], True)
+        self.assertEqual(host_states['host6'].free_ram_mb,
+                         2048 - FLAGS.reserved_host_memory_mb - 512)
+
+    def test_get_all_host_states_after_compute_node_update(self):
+        context = 'fake_context'
+        utils.set_time_override(datetime.datetime(2012, 5, 1, 0, 0, 0))
+        self._build_host_states(context)
+
+        # host1 restarted as host6
+        self.host_manager.update_compute_node('host6')
+        services = [dict(host=host, topic='compute', disabled=False)
+                    for host in ('host2', 'host3', 'host4', 'host6')]
+        host6 = dict(services[3],
+                     compute_node=[dict(local_gb=16, memory_mb=2048,
+                                        vcpus=4)])
+        self.mox.StubOutWithMock(db, 'service_get_all')
+        self.mox.StubOutWithMock(db, 'service_get_all_compute_by_host')
+        self.mox.StubOutWithMock(db, 'instance_get_all_by_host')
+        db.service_get_all(context).AndReturn(services)
+        db.service_get_all_compute_by_host(context, 'host6').AndReturn(
+                [host6])
+        db.instance_get_all_by_host(context, 'host6',
+                columns=host_manager.INSTANCE_USAGE_COLUMNS).AndReturn([])
+        self.mox.ReplayAll()
+        host_states = self.host_manager.get_all_host_states(context,
+                                                            'compute')
+
+        self.assertEqual(sorted(host_states),
+                         ['host2', 'host3', 'host4', 'host6'])
+
+    def test_get_all_host_states_is_reconciled(self):
+        context = 'fake_context'
+        utils.set_time_override(datetime.datetime(2012, 5, 1, 0, 0, 0))
+        self._build_host_states(context)
+        self.host_manager.update_instance_usage('host4', 'create',
+                fakes.INSTANCES[0])
+
+        utils.advance_time_seconds(
+                FLAGS.scheduler_host_state_reconcile_interval)
+        host_states = self._build_host_states(context)
+        self.assertEqual(host_states['host4'].free_ram_mb,
+                         8192 - FLAGS.reserved_host_memory_mb)
+
+    @staticmethod
+    def _claim(usage, claim_id, host, instance_uuid, created_at,
+               deleted_at=None, ttl=300):
+        return dict(usage, id=claim_id, host=host,
+                    instance_uuid=instance_uuid, created_at=created_at,
+                    expires_at=created_at + datetime.timedelta(seconds=ttl),
+                    deleted=deleted_at is not None, deleted_at=deleted_at)
+
+    def test_get_all_host_states_applies_claims_of_other_schedulers(self):
+        self.flags(reserved_host_memory_mb=0, scheduler_resource_claims=True,
+                   scheduler_resource_claim_sync_overlap=60,
+                   scheduler_service_refresh_interval=600)
+        context = 'fake_context'
+        now = datetime.datetime(2012, 5, 1, 0, 0, 0)
+        utils.set_time_override(now)
+        instances = [dict(instance, uuid='fake-uuid%d' % idx)
+                     for idx, instance in enumerate(fakes.INSTANCES)]
+        host_states = self._build_host_states(context, instances=instances,
+                                              claims=[])
+        self.assertEqual(self.host_manager.claims_synced_at, now)
+
+        usage = dict(root_gb=1, ephemeral_gb=0, memory_mb=1024, vcpus=2)
+        minute = datetime.timedelta(seconds=60)
+        second = datetime.timedelta(seconds=1)
+        own_claim = self._claim(usage, 3, 'host4', 'fake-uuid11', now)
+        # Deleted as its instance was created before this scheduler looked
+        deleted_claim = self._claim(usage, 4, 'host3', 'fake-uuid12', now,
+                                    deleted_at=now + second)
+        unknown_host_claim = self._claim(usage, 5, 'host5', 'fake-uuid13',
+                                         now)
+        # Committed after the claims with greater ids were read
+        late_claim = self._claim(usage, 2, 'host4', 'fake-uuid14',
+                                 now - second)
+        self.mox.StubOutWithMock(db, 'resource_claims_create')
+        db.resource_claims_create(context,
+                [dict(usage, host='host4', instance_uuid='fake-uuid11',
+                      expires_at=mox.IgnoreArg())]).AndReturn([own_claim])
+        self.mox.StubOutWithMock(db, 'resource_claim_get_all')
+        db.resource_claim_get_all(context,
+                created_since=now - minute).AndReturn(
+                        [own_claim, deleted_claim, unknown_host_claim])
+        db.resource_claim_get_all(context,
+                created_since=now + 2 * second - minute).AndReturn(
+                        [late_claim, own_claim, deleted_claim,
+                         unknown_host_claim])
+        db.resource_claim_get_all(context,
+                created_since=now + 10 * second - minute).AndReturn([])
+        self.mox.ReplayAll()
+
+        # The own claim was consumed when the host was picked
+        host_states['host4'].consume_from_instance(usage)
+        self.host_manager.claim_resources(context,
+                [('host4', 'fake-uuid11')], usage)
+        utils.advance_time_seconds(2)
+        host_states = self.host_manager.get_all_host_states(context,
+                                                            'compute')
+        self.assertEqual(host_states['host4'].free_ram_mb, 7168)
+        self.assertEqual(host_states['host3'].free_ram_mb, 2048)
+        self.assertEqual(host_states['host3'].vcpus_used, 3)
+
+        utils.advance_time_seconds(8)
+        host_states = self.host_manager.get_all_host_states(context,
+                                                            'compute')
+        self.assertEqual(host_states['host4'].free_ram_mb, 6144)
+        self.assertEqual(host_states['host3'].free_ram_mb, 2048)
+        self.assertEqual(sorted(self.host_manager.seen_claims),
+                         [2, 3, 4, 5])
+
+        # The claims the next look will not read again are forgotten
+        utils.advance_time_seconds(70)
+        self.host_manager.get_all_host_states(context, 'compute')
+        self.assertEqual(self.host_manager.seen_claims, {})
+
+    def test_get_all_host_states_rebuild_applies_claims(self):
+        self.flags(reserved_host_memory_mb=0, scheduler_resource_claims=True,
+                   scheduler_resource_claim_sync_overlap=60)
+        context = 'fake_context'
+        now = datetime.datetime(2012, 5, 1, 0, 0, 0)
+        utils.set_time_override(now)
+        instances = [dict(instance, uuid='fake-uuid%d' % idx)
+                     for idx, instance in enumerate(fakes.INSTANCES)]
+        usage = dict(root_gb=1, ephemeral_gb=0, memory_mb=1024, vcpus=2)
+        second = datetime.timedelta(seconds=1)
+        # The instance of the first claim is counted on host3 already
+        claims = [self._claim(usage, 7, 'host3', 'fake-uuid3', now),
+                  self._claim(usage, 8, 'host4', 'fake-uuid13', now)]
+        host_states = self._build_host_states(context, instances=instances,
+                                              claims=claims)
+        self.assertEqual(host_states['host3'].free_ram_mb, 3072)
+        self.assertEqual(host_states['host4'].free_ram_mb, 7168)
+        self.assertEqual(sorted(self.host_manager.seen_claims), [7, 8])
+
+        # The instance of a claim deleted before the rebuild was counted
+        # by it, and an expired claim was dropped
+        self.mox.StubOutWithMock(db, 'resource_claim_get_all')
+        db.resource_claim_get_all(context,
+                created_since=mox.IgnoreArg()).AndReturn(
+                        claims +
+                        [self._claim(usage, 6, 'host4', 'fake-uuid6',
+                                     now - second, deleted_at=now),
+                         self._claim(usage, 5, 'host4', 'fake-uuid5',
+                                     now - 2 * second, ttl=1)])
+        self.mox.ReplayAll()
+        utils.advance_time_seconds(1)
+        host_states = self.host_manager.get_all_host_states(context,
+                                                            'compute')
+        self.assertEqual(host_states['host4'].free_ram_mb, 7168)
+
 
 class HostStateTestCase(test.TestCase):
     """Test case for HostState class"""
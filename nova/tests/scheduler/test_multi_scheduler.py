@@ -21,7 +21,9 @@ Tests For Multi Scheduler
 """
 
 from nova.scheduler import driver
+from nova.scheduler import manager
 from nova.scheduler import multi
+from nova.scheduler import sharded
 from nova.tests.scheduler import test_scheduler
 
 
@@ -125,3 +127,17 @@ class MultiDriverTestCase(test_scheduler.SchedulerTestCase):
         mgr.update_service_capabilities('foo_svc', 'foo_host', 'foo_caps')
         self.assertTrue(mgr.drivers['compute'].is_update_caps_called)
         self.assertTrue(mgr.drivers['volume'].is_update_caps_called)
+
+    def test_select_hosts_with_sharded_scheduler(self):
+        self.flags(compute_scheduler_driver='nova.scheduler.sharded.'
+                                            'ShardedScheduler',
+                   scheduler_driver='nova.scheduler.multi.MultiScheduler')
+        self.mox.StubOutWithMock(sharded.ShardedScheduler, 'select_hosts')
+        sharded.ShardedScheduler.select_hosts('fake_context',
+                {'num_instances': 1}, {}).AndReturn([[1.0, 'host1']])
+        self.mox.ReplayAll()
+
+        sched = manager.SchedulerManager()
+        self.assertEqual(sched.select_hosts('fake_context',
+                                            {'num_instances': 1}, {}),
+                         [[1.0, 'host1']])
@@ -21,6 +21,7 @@ Tests For Scheduler
 
 import datetime
 import json
+import os
 
 from nova.compute import api as compute_api
 from nova.compute import power_state
@@ -88,6 +89,31 @@ class SchedulerManagerTestCase(test.TestCase):
         result = self.manager.get_service_capabilities(self.context)
         self.assertEqual(result, expected)
 
+    def test_get_scheduler_stats(self):
+        expected = 'fake_stats'
+
+        self.mox.StubOutWithMock(self.manager.driver, 'get_scheduler_stats')
+        self.manager.driver.get_scheduler_stats().AndReturn(expected)
+
+        self.mox.ReplayAll()
+        result = self.manager.get_scheduler_stats(self.context)
+        self.assertEqual(result, expected)
+
+    def test_dump_scheduler_stats(self):
+        expected = {'counters': {'requests': 1}}
+        self.stubs.Set(self.manager.driver, 'get_scheduler_stats',
+                       lambda: expected)
+        with utils.tempdir() as tmpdir:
+            path = os.path.join(tmpdir, 'stats.json')
+            self.flags(scheduler_stats_file=path)
+            self.manager._dump_scheduler_stats(self.context)
+            self.assertFalse(os.path.exists(path))
+
+            self.flags(scheduler_stats=True)
+            self.manager._dump_scheduler_stats(self.context)
+            with open(path) as f:
+                self.assertEqual(json.load(f), expected)
+
     def test_update_service_capabilities(self):
         service_name = 'fake_service'
         host = 'fake_host'
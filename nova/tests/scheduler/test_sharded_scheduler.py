@@ -0,0 +1,184 @@
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Tests For the Sharded Scheduler.
+"""
+
+from nova.compute import api as compute_api
+from nova import context
+from nova import db
+from nova import rpc
+from nova.scheduler import hash_ring
+from nova.scheduler import manager
+from nova import test
+from nova.tests.scheduler import fakes
+
+
+SHARDS = ['shard1', 'shard2', 'shard3']
+
+COMPUTE_NODES = [dict(id=i, local_gb=1024, memory_mb=1024 + i * 128,
+                      vcpus=4, service=dict(host='host%02d' % i,
+                                            disabled=False))
+                 for i in xrange(40)]
+
+
+class HashRingTestCase(test.TestCase):
+    """Test case for HashRing."""
+
+    def test_get_node(self):
+        ring = hash_ring.HashRing(SHARDS)
+        nodes = [ring.get_node('host%03d' % i) for i in xrange(300)]
+        for shard in SHARDS:
+            self.assertTrue(nodes.count(shard) > 50)
+        self.assertEqual(hash_ring.HashRing([]).get_node('host'), None)
+
+    def test_adding_a_node_moves_only_its_keys(self):
+        ring = hash_ring.HashRing(SHARDS)
+        new_ring = hash_ring.HashRing(SHARDS + ['shard4'])
+        keys = ['host%03d' % i for i in xrange(300)]
+        moved = [key for key in keys
+                 if ring.get_node(key) != new_ring.get_node(key)]
+        for key in moved:
+            self.assertEqual(new_ring.get_node(key), 'shard4')
+        self.assertTrue(len(moved) < len(keys) / 2)
+
+
+class ShardedSchedulerTestCase(test.TestCase):
+    """Test case for the Sharded Scheduler, with a scheduler per shard
+    listening on the fake RPC backend."""
+
+    def setUp(self):
+        super(ShardedSchedulerTestCase, self).setUp()
+        self.flags(scheduler_driver='nova.scheduler.sharded.ShardedScheduler',
+                   scheduler_shards=SHARDS,
+                   reserved_host_memory_mb=0,
+                   scheduler_default_filters=['RamFilter'])
+        self.stubs.Set(compute_api, 'API', fakes.FakeComputeAPI)
+        self.stubs.Set(db, 'compute_node_get_all',
+                       lambda context: COMPUTE_NODES)
+        self.stubs.Set(db, 'instance_get_all',
+                       lambda context, columns=None: [])
+        self.context = context.get_admin_context()
+
+        self.conn = rpc.create_connection()
+        self.managers = {}
+        for shard in SHARDS:
+            scheduler = manager.SchedulerManager(host=shard)
+            self.conn.create_consumer(
+                    db.queue_get_for(self.context, 'scheduler', shard),
+                    scheduler)
+            self.managers[shard] = scheduler
+        self.driver = self.managers['shard1'].driver
+
+    def tearDown(self):
+        self.conn.close()
+        super(ShardedSchedulerTestCase, self).tearDown()
+
+    def _request_spec(self, num_instances):
+        return {'num_instances': num_instances,
+                'instance_type': {'memory_mb': 512, 'vcpus': 1},
+                'instance_properties': {'memory_mb': 512,
+                                        'root_gb': 1,
+                                        'ephemeral_gb': 0,
+                                        'vcpus': 1}}
+
+    def _host_states(self, shard):
+        host_manager = self.managers[shard].driver.host_manager
+        return host_manager.get_all_host_states(self.context, 'compute')
+
+    def _free_ram_mb(self):
+        free_ram_mb = 0
+        for shard in SHARDS:
+            for host_state in self._host_states(shard).itervalues():
+                free_ram_mb += host_state.free_ram_mb
+        return free_ram_mb
+
+    def test_hosts_are_partitioned(self):
+        hosts = []
+        for shard in SHARDS:
+            shard_hosts = self._host_states(shard).keys()
+            self.assertTrue(shard_hosts)
+            hosts.extend(shard_hosts)
+        self.assertEqual(sorted(hosts),
+                         sorted('host%02d' % i for i in xrange(40)))
+
+    def test_schedule_merges_shards(self):
+        free_ram_mb = self._free_ram_mb()
+        weighted_hosts = self.driver._schedule(self.context, 'compute',
+                                               self._request_spec(10),
+                                               filter_properties={})
+
+        # The same hosts as a FilterScheduler with every host
+        self.flags(scheduler_shards=[])
+        sched = fakes.FakeFilterScheduler()
+        expected = sched._schedule(self.context, 'compute',
+                                   self._request_spec(10),
+                                   filter_properties={})
+        self.assertEqual([w.weight for w in weighted_hosts],
+                         [w.weight for w in expected])
+
+        # Only the picked hosts are still consumed
+        self.assertEqual(self._free_ram_mb(), free_ram_mb - 10 * 512)
+
+    def test_schedule_asks_shard_fanout_shards(self):
+        self.flags(scheduler_shard_fanout=1)
+        weighted_hosts = self.driver._schedule(self.context, 'compute',
+                                               self._request_spec(3),
+                                               filter_properties={})
+        self.assertEqual(len(weighted_hosts), 3)
+        owners = set(self.driver.host_manager.hash_ring.get_node(
+                         w.host_state.host) for w in weighted_hosts)
+        self.assertEqual(len(owners), 1)
+
+    def test_schedule_forced_hosts_asks_their_shards(self):
+        called = []
+        for shard in SHARDS:
+            def _fake_select_hosts(ctxt, request_spec, filter_properties,
+                                   shard=shard):
+                called.append(shard)
+                return []
+            self.stubs.Set(self.managers[shard].driver, 'select_hosts',
+                           _fake_select_hosts)
+        host = 'host07'
+        owner = self.driver.host_manager.hash_ring.get_node(host)
+        self.driver._schedule(self.context, 'compute',
+                              self._request_spec(1),
+                              filter_properties={'force_hosts': [host]})
+        self.assertEqual(called, [owner])
+
+    def test_schedule_skips_failing_shard(self):
+        def _fake_select_hosts(ctxt, request_spec, filter_properties):
+            raise test.TestingException()
+
+        self.stubs.Set(self.managers['shard2'].driver, 'select_hosts',
+                       _fake_select_hosts)
+        weighted_hosts = self.driver._schedule(self.context, 'compute',
+                                               self._request_spec(5),
+                                               filter_properties={})
+        self.assertEqual(len(weighted_hosts), 5)
+        shard2_hosts = self._host_states('shard2')
+        for weighted_host in weighted_hosts:
+            self.assertFalse(weighted_host.host_state.host in shard2_hosts)
+
+    def test_update_service_capabilities_keeps_own_hosts(self):
+        for shard in SHARDS:
+            self.managers[shard].update_service_capabilities(self.context,
+                    service_name='compute', host='host07',
+                    capabilities={'free_memory': 1})
+        owner = self.driver.host_manager.hash_ring.get_node('host07')
+        for shard in SHARDS:
+            service_states = self.managers[shard].driver.host_manager.\
+                    service_states
+            self.assertEqual('host07' in service_states, shard == owner)
@@ -0,0 +1,132 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Tests For Simple Scheduler.
+"""
+
+import datetime
+
+from nova import context
+from nova import db
+from nova import exception
+from nova.scheduler import driver
+from nova.scheduler import simple
+from nova.tests.scheduler import test_scheduler
+from nova import utils
+
+
+class SimpleSchedulerTestCase(test_scheduler.SchedulerTestCase):
+    """Test case for Simple Scheduler."""
+
+    driver_cls = simple.SimpleScheduler
+
+    def setUp(self):
+        super(SimpleSchedulerTestCase, self).setUp()
+        self.admin_context = context.get_admin_context()
+        down = utils.utcnow() - datetime.timedelta(hours=1)
+        # host1 has 4 cores in use, host2 none; host3 is disabled and
+        # host4 is down
+        for host, disabled, created_at in (('host1', False, None),
+                                           ('host2', False, None),
+                                           ('host3', True, None),
+                                           ('host4', False, down)):
+            values = dict(host=host, binary='nova-compute', topic='compute',
+                          availability_zone='nova', disabled=disabled)
+            if created_at:
+                values['created_at'] = created_at
+            db.service_create(self.admin_context, values)
+        db.instance_create(self.admin_context, dict(host='host1', vcpus=4))
+
+    def _stub_create_and_cast(self):
+        self.casts = []
+
+        def _fake_create_instance_db_entry(context, request_spec):
+            uuid = 'fake-uuid%d' % len(self.casts)
+            request_spec['instance_properties']['uuid'] = uuid
+            return {'id': len(self.casts), 'uuid': uuid}
+
+        def _fake_cast_to_compute_host(context, host, method, **kwargs):
+            self.casts.append((host, kwargs['instance_uuid']))
+
+        self.stubs.Set(self.driver, 'create_instance_db_entry',
+                       _fake_create_instance_db_entry)
+        self.stubs.Set(driver, 'cast_to_compute_host',
+                       _fake_cast_to_compute_host)
+
+    def _request_spec(self, num_instances, vcpus=2, **kwargs):
+        instance_properties = dict(image_ref='fake-image', vcpus=vcpus,
+                                   **kwargs)
+        return {'num_instances': num_instances,
+                'instance_properties': instance_properties}
+
+    def test_schedule_run_instance_counts_placed_cores(self):
+        self._stub_create_and_cast()
+        calls = []
+        service_get_all_compute_up_sorted = (
+                db.service_get_all_compute_up_sorted)
+
+        def _fake_service_get_all_compute_up_sorted(context, **kwargs):
+            calls.append(kwargs)
+            return service_get_all_compute_up_sorted(context, **kwargs)
+
+        self.stubs.Set(db, 'service_get_all_compute_up_sorted',
+                       _fake_service_get_all_compute_up_sorted)
+        instances = self.driver.schedule_run_instance(self.context,
+                self._request_spec(3, vcpus=3))
+
+        self.assertEqual(self.casts, [('host2', 'fake-uuid0'),
+                                      ('host2', 'fake-uuid1'),
+                                      ('host1', 'fake-uuid2')])
+        self.assertEqual([instance['id'] for instance in instances],
+                         [0, 1, 2])
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(calls[0]['limit'], 3)
+
+    def test_schedule_run_instance_isolated_hosts(self):
+        self._stub_create_and_cast()
+        self.flags(isolated_images=['fake-image'], isolated_hosts=['host1'])
+        self.driver.schedule_run_instance(self.context,
+                                          self._request_spec(2))
+        self.assertEqual([host for host, _uuid in self.casts],
+                         ['host1', 'host1'])
+
+        self.flags(isolated_images=[], isolated_hosts=['host2'])
+        self.casts = []
+        self.driver.schedule_run_instance(self.context,
+                                          self._request_spec(1))
+        self.assertEqual([host for host, _uuid in self.casts], ['host1'])
+
+    def test_schedule_run_instance_availability_zone(self):
+        self._stub_create_and_cast()
+        self.assertRaises(exception.NoValidHost,
+                          self.driver.schedule_run_instance, self.context,
+                          self._request_spec(1, availability_zone='zone2'))
+        self.assertEqual(self.casts, [])
+
+    def test_schedule_run_instance_not_enough_cores(self):
+        self._stub_create_and_cast()
+        self.flags(max_cores=6)
+        self.assertRaises(exception.NoValidHost,
+                          self.driver.schedule_run_instance, self.context,
+                          self._request_spec(5))
+        # Nothing is created when the instances do not all fit
+        self.assertEqual(self.casts, [])
+
+        self.driver.schedule_run_instance(self.context,
+                                          self._request_spec(4))
+        self.assertEqual([host for host, _uuid in self.casts],
+                         ['host2', 'host2', 'host2', 'host1'])
@@ -0,0 +1,109 @@
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Tests For the vectorized filtering and weighing engine.
+"""
+
+from nova import context
+from nova import flags
+from nova.scheduler import vectorized
+from nova import test
+from nova.tests.scheduler import fakes
+
+flags.DECLARE('cpu_allocation_ratio', 'nova.scheduler.filters.core_filter')
+
+
+class VectorizedEngineTestCase(test.TestCase):
+    """Test case for the vectorized engine."""
+
+    def setUp(self):
+        super(VectorizedEngineTestCase, self).setUp()
+        self.context = context.get_admin_context()
+        self.flags(reserved_host_memory_mb=0, cpu_allocation_ratio=1.0,
+                   scheduler_default_filters=['AvailabilityZoneFilter',
+                                              'RamFilter',
+                                              'CoreFilter',
+                                              'ComputeFilter'])
+
+    def _schedule(self, vectorized_engine, request_spec,
+                  filter_properties=None, num_hosts=200):
+        self.flags(scheduler_vectorized_engine=vectorized_engine)
+        sched = fakes.FakeFilterScheduler()
+        host_states = fakes.mixed_host_states(num_hosts)
+        self.stubs.Set(sched.host_manager, 'get_all_host_states',
+                       lambda context, topic: host_states)
+        weighted_hosts = sched._schedule(self.context, 'compute',
+                request_spec, filter_properties=filter_properties or {})
+        return ([(w.weight, w.host_state.host) for w in weighted_hosts],
+                host_states)
+
+    def _assert_same_hosts(self, request_spec, filter_properties=None):
+        expected, expected_states = self._schedule(False, request_spec,
+                                                   filter_properties)
+        result, host_states = self._schedule(True, request_spec,
+                                             filter_properties)
+        self.assertTrue(expected)
+        self.assertEqual(result, expected)
+        for host, host_state in host_states.iteritems():
+            self.assertEqual(host_state.free_ram_mb,
+                             expected_states[host].free_ram_mb)
+            self.assertEqual(host_state.vcpus_used,
+                             expected_states[host].vcpus_used)
+
+    def _request_spec(self, num_instances, memory_mb=512, vcpus=1, **kwargs):
+        instance_type = dict(memory_mb=memory_mb, root_gb=1,
+                             ephemeral_gb=0, vcpus=vcpus, **kwargs)
+        return {'num_instances': num_instances,
+                'instance_type': instance_type,
+                'instance_properties': {'project_id': 1,
+                                        'availability_zone': 'nova',
+                                        'memory_mb': memory_mb,
+                                        'root_gb': 1,
+                                        'ephemeral_gb': 0,
+                                        'vcpus': vcpus}}
+
+    @test.skip_if(vectorized.numpy is None, "Test requires numpy")
+    def test_same_hosts_as_filter_hosts(self):
+        self._assert_same_hosts(self._request_spec(1))
+        self._assert_same_hosts(self._request_spec(40, memory_mb=2048,
+                                                   vcpus=2))
+
+    @test.skip_if(vectorized.numpy is None, "Test requires numpy")
+    def test_same_hosts_with_spread_first_and_noop(self):
+        self.flags(least_cost_functions=[
+                       'nova.scheduler.least_cost.noop_cost_fn',
+                       'nova.scheduler.least_cost.compute_fill_first_cost_fn'],
+                   compute_fill_first_cost_fn_weight=1.0)
+        self._assert_same_hosts(self._request_spec(25, memory_mb=1024))
+
+    @test.skip_if(vectorized.numpy is None, "Test requires numpy")
+    def test_same_hosts_with_ignore_and_force_hosts(self):
+        self._assert_same_hosts(self._request_spec(10),
+                {'ignore_hosts': ['host001', 'host002', 'host006']})
+        self._assert_same_hosts(self._request_spec(3),
+                {'force_hosts': ['host005', 'host010']})
+
+    @test.skip_if(vectorized.numpy is None, "Test requires numpy")
+    def test_same_hosts_with_extra_specs(self):
+        request_spec = self._request_spec(10, extra_specs={'opt1': 1})
+        self._assert_same_hosts(request_spec)
+        result, _host_states = self._schedule(True, request_spec)
+        for _weight, host in result:
+            self.assertEqual(int(host[4:]) % 2, 1)
+
+    @test.skip_if(vectorized.numpy is None, "Test requires numpy")
+    def test_same_hosts_with_stats(self):
+        self.flags(scheduler_stats=True)
+        self._assert_same_hosts(self._request_spec(5))
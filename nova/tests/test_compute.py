@@ -306,6 +306,21 @@ class ComputeTestCase(BaseTestCase):
         self._assert_state({'vm_state': vm_states.ERROR,
                             'task_state': task_states.SCHEDULING})
 
+    def test_compute_node_update_is_cast_once(self):
+        casts = []
+        self.stubs.Set(self.compute.driver, 'update_available_resource',
+                       lambda context, host: None)
+        self.stubs.Set(compute_manager.scheduler_api, 'update_compute_node',
+                       lambda context, host: casts.append(host))
+        admin_context = context.get_admin_context()
+        self.compute.update_available_resource(admin_context)
+        self.assertEqual(casts, [self.compute.host])
+
+        # The periodic task does not make the schedulers reload the host
+        self.compute.periodic_tasks(admin_context)
+        self.compute.update_available_resource(admin_context)
+        self.assertEqual(casts, [self.compute.host])
+
     def test_run_instance_setup_block_device_mapping_fail(self):
         """ block device mapping failure test.
 
@@ -1792,6 +1807,33 @@ class ComputeAPITestCase(BaseTestCase):
             finally:
                 db.instance_destroy(self.context, ref[0]['id'])
 
+    def test_create_db_entries_for_new_instances(self):
+        group = self._create_group()
+        base_options_list = [{'display_name': 'Hello, Server!'},
+                             {'display_name': None}]
+        for base_options in base_options_list:
+            base_options.update(user_id=self.user_id,
+                                project_id=self.project_id)
+        instances = self.compute_api.create_db_entries_for_new_instances(
+                self.context, instance_types.get_default_instance_type(),
+                self.fake_image, base_options_list, 'testgroup', [])
+        try:
+            self.assertEqual(instances[0]['hostname'], 'hello-server')
+            self.assertEqual(instances[1]['display_name'],
+                             'Server %s' % instances[1]['id'])
+            self.assertEqual(instances[1]['hostname'],
+                             'server-%s' % instances[1]['id'])
+            for instance in instances:
+                self.assertEqual(instance['vm_state'], vm_states.BUILDING)
+                self.assertEqual(instance['task_state'],
+                                 task_states.SCHEDULING)
+                self.assertEqual(len(db.security_group_get_by_instance(
+                                 self.context, instance['id'])), 1)
+        finally:
+            for instance in instances:
+                db.instance_destroy(self.context, instance['id'])
+            db.security_group_destroy(self.context, group['id'])
+
     def test_destroy_instance_disassociates_security_groups(self):
         """Make sure destroying disassociates security groups"""
         group = self._create_group()
@@ -2534,6 +2576,23 @@ class ComputeAPITestCase(BaseTestCase):
         instance = self.compute_api.get(c, exp_instance['id'])
         self.assertEquals(expected, instance)
 
+    def test_get_all_reads_primary_by_default(self):
+        c = context.get_admin_context()
+        calls = []
+
+        def fake_instance_get_all_by_filters(context, filters, sort_key,
+                                             sort_dir, limit=None,
+                                             marker=None, use_slave=False):
+            calls.append(use_slave)
+            return []
+
+        self.stubs.Set(db, 'instance_get_all_by_filters',
+                       fake_instance_get_all_by_filters)
+
+        self.compute_api.get_all(c)
+        self.compute_api.get_all(c, use_slave=True)
+        self.assertEqual(calls, [False, True])
+
     def test_get_all_by_name_regexp(self):
         """Test searching instances by name (display_name)"""
         c = context.get_admin_context()
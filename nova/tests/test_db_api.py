@@ -19,10 +19,22 @@
 """Unit tests for the DB API"""
 
 import datetime
+import os
+import shutil
+import tempfile
+import time
+
+import eventlet
+from sqlalchemy.dialects import mysql
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.pool import QueuePool
 
 from nova import test
 from nova import context
 from nova import db
+from nova.db.sqlalchemy import api as sqlalchemy_api
+from nova.db.sqlalchemy import models
+from nova.db.sqlalchemy import session
 from nova import exception
 from nova import flags
 from nova import utils
@@ -65,6 +77,338 @@ class DbApiTestCase(test.TestCase):
         result = db.instance_get_all_by_filters(self.context, {})
         self.assertTrue(2, len(result))
 
+    def test_instance_get_all_by_filters_regexp_and_metadata(self):
+        for name, metadata in (('web_1', {'role': 'web'}),
+                               ('web-2', {'role': 'web', 'tier': '1'}),
+                               ('Web3', {'role': 'db'}),
+                               ('db1', {})):
+            db.instance_create(self.context, {'display_name': name,
+                                              'metadata': metadata,
+                                              'project_id': self.project_id})
+
+        def _names(filters):
+            return sorted(inst['display_name'] for inst in
+                          db.instance_get_all_by_filters(self.context,
+                                  filters, 'created_at', 'desc'))
+
+        self.assertEqual(_names({'display_name': 'web'}), ['web-2', 'web_1'])
+        self.assertEqual(_names({'display_name': 'web_'}), ['web_1'])
+        self.assertEqual(_names({'display_name': '[wW]eb\\d'}), ['Web3'])
+        self.assertEqual(_names({'display_name': 'eb'}), [])
+        self.assertEqual(_names({'metadata': {'role': 'web'}}),
+                         ['web-2', 'web_1'])
+        self.assertEqual(_names({'metadata': [{'role': 'web'},
+                                              {'tier': '1'}]}), ['web-2'])
+        self.assertEqual(_names({'metadata': [{'role': 'web',
+                                               'tier': '1'}]}), [])
+        self.assertEqual(_names({'display_name': 'w',
+                                 'metadata': {'role': 'db'}}), [])
+
+    def test_regexp_filter_clause(self):
+        def _sql(pattern, dialect_name, dialect):
+            clause = sqlalchemy_api._regexp_filter_clause(
+                    models.Instance.display_name, pattern, dialect_name)
+            return clause is not None and str(clause.compile(
+                    dialect=dialect))
+
+        self.assertTrue('LIKE' in _sql('web', 'mysql', mysql.dialect()))
+        self.assertTrue('REGEXP' in _sql('web.*', 'mysql', mysql.dialect()))
+        self.assertTrue('~' in _sql('web.*', 'postgresql',
+                                    postgresql.dialect()))
+        self.assertFalse(_sql('web.*', 'sqlite', None))
+        # Empty values must not match an empty prefix
+        self.assertTrue('!=' in _sql('', 'mysql', mysql.dialect()))
+        self.assertTrue('REGEXP' in _sql('[wW]eb(-|_)?[0-9]{1,2}$',
+                                         'mysql', mysql.dialect()))
+        for pattern in ('web\\d+', '(?i)web', 'web.*?', 'web[\\w]',
+                        '(?P<n>web)', 'web\\'):
+            self.assertFalse(_sql(pattern, 'mysql', mysql.dialect()))
+            self.assertFalse(_sql(pattern, 'postgresql',
+                                  postgresql.dialect()))
+
+    def test_instance_get_all_by_filters_paginated(self):
+        created_at = datetime.datetime(2012, 1, 1)
+        uuids = []
+        for i in xrange(5):
+            # Two instances per created_at, the order is then by id
+            instance = db.instance_create(self.context, {
+                    'display_name': 'server-%d' % (i % 2),
+                    'project_id': self.project_id,
+                    'created_at': created_at +
+                                  datetime.timedelta(seconds=i / 2)})
+            uuids.append(instance['uuid'])
+
+        def _pages(filters, sort_dir, limit):
+            pages = []
+            marker = None
+            while True:
+                page = [inst['uuid'] for inst in
+                        db.instance_get_all_by_filters(self.context,
+                                filters, 'created_at', sort_dir,
+                                limit=limit, marker=marker)]
+                pages.append(page)
+                if len(page) < limit:
+                    return pages
+                marker = page[-1]
+
+        self.assertEqual(_pages({}, 'asc', 2),
+                         [uuids[0:2], uuids[2:4], uuids[4:]])
+        self.assertEqual(_pages({}, 'desc', 3),
+                         [uuids[:1:-1], uuids[1::-1]])
+        self.assertEqual(_pages({'display_name': 'server-[0]'}, 'asc', 2),
+                         [uuids[0:3:2], uuids[4:]])
+        self.assertEqual(db.instance_get_all_by_filters(self.context, {},
+                                'created_at', 'asc', limit=0), [])
+        self.assertRaises(exception.MarkerNotFound,
+                          db.instance_get_all_by_filters, self.context, {},
+                          'created_at', 'asc', marker='unknown')
+
+    def test_instance_type_get_all_paginated(self):
+        flavorids = [inst_type['flavorid'] for inst_type in
+                     db.instance_type_get_all(self.context)]
+        pages = []
+        marker = None
+        while True:
+            page = db.instance_type_get_all(self.context, limit=2,
+                                            marker=marker)
+            if not page:
+                break
+            pages.append([inst_type['flavorid'] for inst_type in page])
+            marker = page[-1]['flavorid']
+        self.assertEqual(sum(pages, []), flavorids)
+        self.assertTrue(all(len(page) <= 2 for page in pages))
+        self.assertRaises(exception.MarkerNotFound,
+                          db.instance_type_get_all, self.context,
+                          marker='unknown')
+
+    def test_instance_get_all_by_host_columns(self):
+        ctxt = context.get_admin_context()
+        instance = db.instance_create(ctxt, {'host': 'host1',
+                                             'vm_state': 'active',
+                                             'metadata': {'role': 'web'}})
+        db.instance_create(ctxt, {'host': 'host2'})
+        deleted = db.instance_create(ctxt, {'host': 'host1'})
+        db.instance_destroy(ctxt, deleted['id'])
+
+        rows = db.instance_get_all_by_host(ctxt, 'host1',
+                                           columns=['id', 'uuid', 'vm_state'])
+        self.assertEqual(len(rows), 1)
+        row = rows[0]
+        self.assertEqual(row['uuid'], instance['uuid'])
+        self.assertEqual(row.vm_state, 'active')
+        self.assertEqual(row['name'], instance['name'])
+        self.assertEqual(dict(row), {'id': instance['id'],
+                                     'uuid': instance['uuid'],
+                                     'vm_state': 'active'})
+        self.assertEqual(row.get('host'), None)
+        self.assertRaises(AttributeError, lambda: row['metadata'])
+
+        rows = db.instance_get_all(ctxt, columns=['host'])
+        self.assertEqual(sorted(row['host'] for row in rows),
+                         ['host1', 'host2'])
+
+    def test_instance_get_all_columns_read_the_name_template_fields(self):
+        ctxt = context.get_admin_context()
+        db.instance_create(ctxt, {'host': 'host1', 'hostname': 'web'})
+
+        self.flags(instance_name_template='%(hostname)s-%(id)d')
+        rows = db.instance_get_all_by_host(ctxt, 'host1', columns=['uuid'])
+        self.assertEqual(rows[0]['name'], 'web-%d' % rows[0]['id'])
+
+        # Whole instances are read for other attributes than columns
+        self.flags(instance_name_template='%(metadata)s')
+        instances = db.instance_get_all(ctxt, columns=['uuid'])
+        self.assertEqual(instances[0]['metadata'], [])
+
+    def test_reads_from_slave(self):
+        ctxt = context.get_admin_context()
+        replicated = db.instance_create(ctxt, {'host': 'host1'})
+
+        # The replica is a copy of the database taken now
+        slave_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, slave_dir)
+        slave_db = os.path.join(slave_dir, 'slave.sqlite')
+        shutil.copyfile(os.path.join(FLAGS.state_path, FLAGS.sqlite_db),
+                        slave_db)
+        self.flags(sql_slave_connections=['sqlite:///%s' % slave_db])
+        self.addCleanup(session._SLAVE_MAKERS.clear)
+        self.addCleanup(session._SLAVE_ENGINES.clear)
+
+        not_replicated = db.instance_create(ctxt, {'host': 'host1'})
+
+        def _uuids(instances):
+            return sorted(instance['uuid'] for instance in instances)
+
+        self.assertEqual(_uuids(db.instance_get_all_by_filters(ctxt, {},
+                                        use_slave=True)),
+                         [replicated['uuid']])
+        self.assertEqual(_uuids(db.instance_get_all_by_filters(ctxt, {})),
+                         sorted([replicated['uuid'],
+                                 not_replicated['uuid']]))
+        begin = replicated['created_at'] - datetime.timedelta(seconds=1)
+        self.assertEqual(_uuids(db.instance_get_active_by_window_joined(
+                                        ctxt, begin)),
+                         [replicated['uuid']])
+        # Everything else reads the primary database
+        self.assertEqual(db.instance_get_by_uuid(ctxt,
+                                not_replicated['uuid'])['id'],
+                         not_replicated['id'])
+        self.assertEqual(len(db.instance_get_all_by_host(ctxt, 'host1')), 2)
+
+    def test_pool_stats(self):
+        url = str(session.get_engine().url)
+        checkouts = session.get_pool_stats()[url]['checkouts']
+        db.instance_create(self.context, {})
+        stats = session.get_pool_stats()[url]
+        self.assertTrue(stats['checkouts'] > checkouts)
+        self.assertEqual(stats['in_use'], 0)
+        self.assertTrue(stats['max_in_use'] >= 1)
+
+    def test_pool_wait_leaves_out_connecting(self):
+        clock = [0.0]
+
+        class FakeTime(object):
+            @staticmethod
+            def time():
+                return clock[0]
+
+        class FakeConnection(object):
+            def rollback(self):
+                pass
+
+            def close(self):
+                pass
+
+        def creator():
+            clock[0] += 5
+            return FakeConnection()
+
+        self.stubs.Set(session, 'time', FakeTime)
+        metrics = session.PoolMetrics()
+        pool = session._metered_pool_class(QueuePool, metrics)(
+                creator, pool_size=1, max_overflow=0)
+
+        pool.connect().close()
+        self.assertEqual(metrics.wait_seconds, 0.0)
+
+        queue_get = pool._pool.get
+
+        def slow_get(*args, **kwargs):
+            clock[0] += 2
+            return queue_get(*args, **kwargs)
+
+        self.stubs.Set(pool._pool, 'get', slow_get)
+        pool.connect().close()
+        self.assertEqual(metrics.wait_seconds, 2.0)
+        self.assertEqual(metrics.max_wait_seconds, 2.0)
+
+    def test_mysql_ping_on_idle_connections(self):
+        pings = []
+
+        class FakeCursor(object):
+            def execute(self, sql):
+                pings.append(sql)
+
+        class FakeConnection(object):
+            def cursor(self):
+                return FakeCursor()
+
+        class FakeConnectionRecord(object):
+            info = {}
+
+        dbapi_con = FakeConnection()
+        con_record = FakeConnectionRecord()
+        listener = session.MySQLPingListener()
+        self.flags(sql_ping_idle_time=30)
+
+        listener.connect(dbapi_con, con_record)
+        listener.checkout(dbapi_con, con_record, None)
+        listener.checkin(dbapi_con, con_record)
+        listener.checkout(dbapi_con, con_record, None)
+        self.assertEqual(pings, [])
+
+        con_record.info['checked_in_at'] = time.time() - 60
+        listener.checkout(dbapi_con, con_record, None)
+        self.assertEqual(pings, ['select 1'])
+
+        self.flags(sql_ping_idle_time=0)
+        listener.checkin(dbapi_con, con_record)
+        listener.checkout(dbapi_con, con_record, None)
+        self.assertEqual(pings, ['select 1', 'select 1'])
+
+    def test_db_use_tpool(self):
+        get_ident = eventlet.patcher.original('thread').get_ident
+        idents = []
+        instance_get_by_uuid = sqlalchemy_api.instance_get_by_uuid
+
+        def fake_instance_get_by_uuid(context, uuid):
+            idents.append(get_ident())
+            return instance_get_by_uuid(context, uuid)
+
+        self.stubs.Set(sqlalchemy_api, 'instance_get_by_uuid',
+                       fake_instance_get_by_uuid)
+        self.flags(db_use_tpool=True)
+
+        ctxt = context.get_admin_context()
+        instance = db.instance_create(ctxt, {'host': 'host1'})
+        self.assertEqual(db.instance_get_by_uuid(ctxt,
+                                                 instance['uuid'])['host'],
+                         'host1')
+        self.assertEqual(len(idents), 1)
+        self.assertNotEqual(idents[0], get_ident())
+
+    def test_instance_create_bulk(self):
+        group = db.security_group_create(self.context,
+                                         {'name': 'bulk',
+                                          'project_id': self.project_id})
+        values_list = [{'host': 'host1', 'launch_index': i,
+                        'project_id': self.project_id}
+                       for i in xrange(3)]
+        instances = db.instance_create_bulk(self.context, values_list,
+                                            [group['id']])
+        self.assertEqual([inst['launch_index'] for inst in instances],
+                         [0, 1, 2])
+        self.assertEqual(len(set(inst['uuid'] for inst in instances)), 3)
+        for inst in instances:
+            inst = db.instance_get_by_uuid(self.context, inst['uuid'])
+            self.assertEqual(inst['host'], 'host1')
+            self.assertEqual([sg['id'] for sg in inst['security_groups']],
+                             [group['id']])
+            info_cache = db.instance_info_cache_get(self.context,
+                                                    inst['uuid'])
+            self.assertEqual(info_cache['instance_id'], inst['uuid'])
+
+    def test_service_get_all_compute_up_sorted(self):
+        ctxt = context.get_admin_context()
+        down = utils.utcnow() - datetime.timedelta(hours=1)
+        for host, zone, disabled, created_at in (
+                ('host1', 'zone1', False, None),
+                ('host2', 'zone1', False, None),
+                ('host3', 'zone2', False, None),
+                ('host4', 'zone1', True, None),
+                ('host5', 'zone1', False, down)):
+            values = dict(host=host, binary='nova-compute', topic='compute',
+                          availability_zone=zone, disabled=disabled)
+            if created_at:
+                values['created_at'] = created_at
+            db.service_create(ctxt, values)
+        for host, vcpus in (('host1', 4), ('host1', 2), ('host2', 1),
+                            ('host4', 1), ('host5', 1)):
+            db.instance_create(ctxt, dict(host=host, vcpus=vcpus))
+
+        def _hosts(**kwargs):
+            return [(service['host'], cores) for service, cores in
+                    db.service_get_all_compute_up_sorted(ctxt, **kwargs)]
+
+        self.assertEqual(_hosts(), [('host3', 0), ('host2', 1),
+                                    ('host1', 6)])
+        self.assertEqual(_hosts(zone='zone1'), [('host2', 1), ('host1', 6)])
+        self.assertEqual(_hosts(limit=2), [('host3', 0), ('host2', 1)])
+        self.assertEqual(_hosts(hosts=['host1', 'host4']), [('host1', 6)])
+        self.assertEqual(_hosts(hosts=[]), [])
+        self.assertEqual(_hosts(exclude_hosts=['host3']),
+                         [('host2', 1), ('host1', 6)])
+
     def test_instance_get_all_by_filters_deleted(self):
         args1 = {'reservation_id': 'a', 'image_ref': 1, 'host': 'host1'}
         inst1 = db.instance_create(self.context, args1)
@@ -778,6 +1122,60 @@ class CapacityTestCase(test.TestCase):
         self.assertEquals(x.current_workload, 2)
         self.assertEquals(x.running_vms, 5)
 
+    def _claim_values(self, host, instance_uuid, ttl=60):
+        return dict(host=host, instance_uuid=instance_uuid, memory_mb=512,
+                    root_gb=10, ephemeral_gb=0, vcpus=1,
+                    expires_at=utils.utcnow() +
+                               datetime.timedelta(seconds=ttl))
+
+    def test_resource_claims(self):
+        claims = db.resource_claims_create(self.ctxt,
+                [self._claim_values('host1', 'fake-uuid1'),
+                 self._claim_values('host2', 'fake-uuid2'),
+                 self._claim_values('host1', 'fake-uuid3', ttl=-1)])
+        ids = [claim['id'] for claim in claims]
+
+        self.assertEqual([claim['id'] for claim
+                          in db.resource_claim_get_all(self.ctxt)],
+                         ids[:2])
+        created_at = claims[0]['created_at']
+        self.assertEqual([claim['id'] for claim
+                          in db.resource_claim_get_all(self.ctxt,
+                                  created_since=created_at)],
+                         ids)
+        self.assertEqual(db.resource_claim_get_all(self.ctxt,
+                created_since=created_at + datetime.timedelta(seconds=1)),
+                         [])
+
+        db.resource_claims_destroy_by_instance(self.ctxt, 'fake-uuid1')
+        self.assertEqual([claim['id'] for claim
+                          in db.resource_claim_get_all(self.ctxt)],
+                         ids[1:2])
+        # The claims created since are read even once deleted
+        self.assertEqual([claim['id'] for claim
+                          in db.resource_claim_get_all(self.ctxt,
+                                  created_since=created_at)],
+                         ids)
+
+        db.resource_claims_destroy_expired(self.ctxt)
+        self.assertEqual([claim['id'] for claim
+                          in db.resource_claim_get_all(self.ctxt)],
+                         ids[1:2])
+
+    def test_compute_node_utilization_update_releases_claims(self):
+        self._create_helper('host1')
+        claims = db.resource_claims_create(self.ctxt,
+                [self._claim_values('host1', 'fake-uuid1'),
+                 self._claim_values('host2', 'fake-uuid1'),
+                 self._claim_values('host1', 'fake-uuid2')])
+
+        x = db.compute_node_utilization_update(self.ctxt, 'host1',
+                work_delta=-1, instance_uuid='fake-uuid1')
+        self.assertEquals(x.current_workload, -1)
+        self.assertEqual([claim['id'] for claim
+                          in db.resource_claim_get_all(self.ctxt)],
+                         [claims[1]['id'], claims[2]['id']])
+
 
 class TestIpAllocation(test.TestCase):
 
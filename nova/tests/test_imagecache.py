@@ -119,7 +119,7 @@ class ImageCacheManagerTestCase(test.TestCase):
 
     def test_list_running_instances(self):
         self.stubs.Set(db, 'instance_get_all',
-                       lambda x: [{'image_ref': '1',
+                       lambda x, columns=None: [{'image_ref': '1',
                                    'host': FLAGS.host,
                                    'name': 'inst-1',
                                    'uuid': '123'},
@@ -610,7 +610,7 @@ class ImageCacheManagerTestCase(test.TestCase):
 
         # Fake the database call which lists running instances
         self.stubs.Set(db, 'instance_get_all',
-                       lambda x: [{'image_ref': '1',
+                       lambda x, columns=None: [{'image_ref': '1',
                                    'host': FLAGS.host,
                                    'name': 'instance-1',
                                    'uuid': '123'},
@@ -24,6 +24,7 @@ import sys
 import nova.auth.manager
 from nova import context
 from nova import db
+from nova.scheduler import api as scheduler_api
 from nova import test
 from nova.tests.db import fakes as db_fakes
 
@@ -237,6 +238,20 @@ class NetworkCommandsTestCase(test.TestCase):
                                dis_host=True)
 
 
+class ServiceCommandsTestCase(test.TestCase):
+
+    def test_scheduler_stats(self):
+        stats = {'counters': {'requests': 2, 'requests_failed': 1},
+                 'histograms': {}, 'traces': []}
+        self.stubs.Set(scheduler_api, 'get_scheduler_stats',
+                       lambda context: stats)
+        output = StringIO.StringIO()
+        sys.stdout = output
+        nova_manage.ServiceCommands().scheduler_stats()
+        sys.stdout = sys.__stdout__
+        self.assertEqual(json.loads(output.getvalue()), stats)
+
+
 class ExportAuthTestCase(test.TestCase):
 
     def test_export_with_noauth(self):
@@ -418,6 +418,34 @@ class GenericUtilsTestCase(test.TestCase):
             self.assertEqual(fake_execute.uid, os.getuid())
 
 
+class OrderedDictTestCase(test.TestCase):
+    def test_keeps_insertion_order(self):
+        d = utils.OrderedDict([('c', 1), ('a', 2)])
+        d['b'] = 3
+        d['c'] = 4
+        self.assertEqual(d.keys(), ['c', 'a', 'b'])
+        self.assertEqual(d.values(), [4, 2, 3])
+        self.assertEqual(d.items(), [('c', 4), ('a', 2), ('b', 3)])
+        self.assertEqual(list(reversed(d)), ['b', 'a', 'c'])
+        self.assertEqual(d, {'a': 2, 'b': 3, 'c': 4})
+
+    def test_deletions(self):
+        d = utils.OrderedDict((key, None) for key in 'abcd')
+        del d['b']
+        self.assertEqual(d.pop('c'), None)
+        self.assertEqual(d.pop('c', 5), 5)
+        self.assertRaises(KeyError, d.pop, 'c')
+        self.assertEqual(d.setdefault('b', 6), 6)
+        self.assertEqual(d.keys(), ['a', 'd', 'b'])
+        self.assertEqual(d.popitem(), ('b', 6))
+        self.assertEqual(d.popitem(last=False), ('a', None))
+        self.assertEqual(d.copy().keys(), ['d'])
+        d.clear()
+        self.assertRaises(KeyError, d.popitem)
+        d['e'] = 7
+        self.assertEqual(d.items(), [('e', 7)])
+
+
 class IsUUIDLikeTestCase(test.TestCase):
     def assertUUIDLike(self, val, expected):
         result = utils.is_uuid_like(val)
@@ -1129,6 +1129,107 @@ def subset_dict(dict_, keys):
     return subset
 
 
+class OrderedDict(dict):
+    """Dictionary remembering the order its keys were first inserted in.
+
+    Local subset of collections.OrderedDict for compatibility with
+    python 2.6; lookups, insertions and deletions are O(1).
+    """
+
+    def __init__(self, items=()):
+        super(OrderedDict, self).__init__()
+        # Circular doubly linked list of [prev, next, key] links
+        self._root = root = []
+        root[:] = [root, root, None]
+        self._links = {}
+        self.update(items)
+
+    def __setitem__(self, key, value):
+        if key not in self._links:
+            root = self._root
+            last = root[0]
+            last[1] = root[0] = self._links[key] = [last, root, key]
+        super(OrderedDict, self).__setitem__(key, value)
+
+    def __delitem__(self, key):
+        super(OrderedDict, self).__delitem__(key)
+        prev_link, next_link, _key = self._links.pop(key)
+        prev_link[1] = next_link
+        next_link[0] = prev_link
+
+    def __iter__(self):
+        root = self._root
+        link = root[1]
+        while link is not root:
+            yield link[2]
+            link = link[1]
+
+    def __reversed__(self):
+        root = self._root
+        link = root[0]
+        while link is not root:
+            yield link[2]
+            link = link[0]
+
+    def __repr__(self):
+        return '%s(%r)' % (self.__class__.__name__, self.items())
+
+    def clear(self):
+        super(OrderedDict, self).clear()
+        self._root[:] = [self._root, self._root, None]
+        self._links.clear()
+
+    def update(self, items=(), **kwargs):
+        if hasattr(items, 'keys'):
+            items = [(key, items[key]) for key in items.keys()]
+        for key, value in itertools.chain(items, kwargs.iteritems()):
+            self[key] = value
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def pop(self, key, *default):
+        if key not in self:
+            if default:
+                return default[0]
+            raise KeyError(key)
+        value = self[key]
+        del self[key]
+        return value
+
+    def popitem(self, last=True):
+        """Removes and returns the last (key, value) pair, or the first
+        one if last is False."""
+        if not self:
+            raise KeyError('dictionary is empty')
+        key = (reversed(self) if last else iter(self)).next()
+        return key, self.pop(key)
+
+    def copy(self):
+        return self.__class__(self)
+
+    iterkeys = __iter__
+
+    def keys(self):
+        return list(self)
+
+    def itervalues(self):
+        for key in self:
+            yield self[key]
+
+    def values(self):
+        return list(self.itervalues())
+
+    def iteritems(self):
+        for key in self:
+            yield key, self[key]
+
+    def items(self):
+        return list(self.iteritems())
+
+
 def check_isinstance(obj, cls):
     """Checks that obj is of type cls, and lets PyLint infer types."""
     if isinstance(obj, cls):
@@ -0,0 +1,180 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2011 University of Southern California
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Bounded console logs for bare-metal nodes.
+
+The console output of a node is appended to a ring log: a file holding a
+fixed size header with the number of bytes ever written, followed by at
+most baremetal_console_log_max_kb of data which wraps around. The last
+baremetal_console_tail_kb of output is also kept in memory, so reading
+the tail of a console is served without touching the file and reading
+more of it costs at most two reads of the requested size.
+"""
+
+import os
+
+from nova import flags
+from nova import log as logging
+from nova.openstack.common import cfg
+
+console_opts = [
+    cfg.IntOpt('baremetal_console_log_max_kb',
+               default=1024,
+               help='Size of the on-disk console ring log of each node'),
+    cfg.IntOpt('baremetal_console_tail_kb',
+               default=64,
+               help='Amount of the latest console output of each node '
+                    'kept in memory'),
+    ]
+
+FLAGS = flags.FLAGS
+FLAGS.register_opts(console_opts)
+
+LOG = logging.getLogger(__name__)
+
+HEADER_SIZE = 32
+
+# Bytes of logged output looked up in a new console dump by update()
+MARKER_SIZE = 256
+
+_console_logs = {}
+
+
+def get_console_log(path):
+    """
+    Returns the ConsoleLog kept at path, opening it on first use.
+    """
+    console_log = _console_logs.get(path)
+    if console_log is None:
+        console_log = _console_logs[path] = ConsoleLog(path)
+    return console_log
+
+
+def forget_console_log(path):
+    """
+    Drops the in-memory state of the ConsoleLog kept at path.
+    """
+    _console_logs.pop(path, None)
+
+
+class ConsoleLog(object):
+    """A console ring log with an in-memory tail."""
+
+    def __init__(self, path, max_bytes=None, tail_bytes=None):
+        self.path = path
+        if max_bytes is None:
+            max_bytes = FLAGS.baremetal_console_log_max_kb * 1024
+        if tail_bytes is None:
+            tail_bytes = FLAGS.baremetal_console_tail_kb * 1024
+        self.max_bytes = max_bytes
+        self.tail_bytes = min(tail_bytes, max_bytes)
+        self.written = self._read_header()
+        self._tail = self._read_ring(self.tail_bytes)
+
+    def __len__(self):
+        """Returns the number of bytes currently retained."""
+        return min(self.written, self.max_bytes)
+
+    def _read_header(self):
+        if not os.path.exists(self.path):
+            return 0
+        f = open(self.path, 'rb')
+        try:
+            header = f.read(HEADER_SIZE)
+        finally:
+            f.close()
+        try:
+            return int(header)
+        except ValueError:
+            LOG.warn(_("Ignoring console log %s with a bad header"),
+                     self.path)
+            return 0
+
+    def _read_ring(self, nbytes):
+        """Reads the last nbytes of the retained output."""
+        nbytes = max(0, min(nbytes, len(self)))
+        if not nbytes:
+            return ''
+        end = self.written % self.max_bytes
+        start = (end - nbytes) % self.max_bytes
+        f = open(self.path, 'rb')
+        try:
+            f.seek(HEADER_SIZE + start)
+            if start < end:
+                return f.read(nbytes)
+            data = f.read(self.max_bytes - start)
+            f.seek(HEADER_SIZE)
+            return data + f.read(end)
+        finally:
+            f.close()
+
+    def append(self, data):
+        """
+        Appends console output, overwriting the oldest output once the
+        ring log is full.
+        """
+        if not data:
+            return
+        written = self.written + len(data)
+        # NOTE: only the last max_bytes of data can survive
+        data = data[-self.max_bytes:]
+        start = (written - len(data)) % self.max_bytes
+        mode = 'r+b' if os.path.exists(self.path) else 'w+b'
+        f = open(self.path, mode)
+        try:
+            f.seek(HEADER_SIZE + start)
+            first = self.max_bytes - start
+            f.write(data[:first])
+            if len(data) > first:
+                f.seek(HEADER_SIZE)
+                f.write(data[first:])
+            f.seek(0)
+            f.write('%0*d\n' % (HEADER_SIZE - 1, written))
+        finally:
+            f.close()
+        self.written = written
+        self._tail = (self._tail + data)[-self.tail_bytes:]
+
+    def update(self, dump):
+        """
+        Appends what is new in dump, a complete copy of a bounded console
+        buffer such as the output of dmesg.
+
+        The new output is what follows the latest occurrence of the last
+        bytes logged; if they are not found, the buffer has wrapped or the
+        node rebooted and the whole dump is appended.
+        """
+        marker = self._tail[-MARKER_SIZE:]
+        if marker:
+            idx = dump.rfind(marker)
+            if idx >= 0:
+                dump = dump[idx + len(marker):]
+        self.append(dump)
+
+    def tail(self, nbytes):
+        """
+        Returns the last nbytes of output retained.
+
+        Requests within the in-memory tail do not read the ring log.
+        """
+        if nbytes <= len(self._tail):
+            return self._tail[len(self._tail) - nbytes:]
+        return self._read_ring(nbytes)
+
+    def read(self):
+        """Returns all of the output retained."""
+        return self.tail(len(self))
@@ -14,37 +14,107 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import os
+
 from nova.compute import power_state
 from nova import exception
 from nova import flags
 from nova import log as logging
 #from nova.openstack.common import jsonutils
+from nova.openstack.common import cfg
 from nova import utils
 from nova.virt.baremetal import nodes
 
+baremetal_dom_opts = [
+    cfg.IntOpt('baremetal_dom_journal_max_records',
+               default=100,
+               help='Number of domain changes appended to the domain '
+                    'journal before the domain file is compacted'),
+    ]
+
 FLAGS = flags.FLAGS
+FLAGS.register_opts(baremetal_dom_opts)
 
 LOG = logging.getLogger(__name__)
 
 
+def _journal_file(fname):
+    return fname + '.journal'
+
+
+def _replay_journal(fname, domains):
+    """
+    Applies the records of the domain journal to domains.
+
+    A 'put' record adds or replaces a domain by name and a 'delete' record
+    removes it, so replaying a journal more than once is harmless. A torn
+    last record, left by a crash in the middle of an append, is ignored.
+    """
+    journal = _journal_file(fname)
+    if not os.path.exists(journal):
+        return domains
+    by_name = utils.OrderedDict((d['name'], d) for d in domains)
+    f = open(journal, 'r')
+    try:
+        for line in f:
+            try:
+                record = utils.loads(line)
+            except ValueError:
+                LOG.debug(_("Ignoring torn domain journal record"))
+                break
+            if record['op'] == 'put':
+                by_name[record['domain']['name']] = record['domain']
+            elif record['op'] == 'delete':
+                by_name.pop(record['name'], None)
+    finally:
+        f.close()
+    return by_name.values()
+
+
 def read_domains(fname):
+    """
+    Reads the domain file and replays its journal on top of it.
+    """
     try:
         f = open(fname, 'r')
         json = f.read()
         f.close()
         #domains = jsonutils.loads(json)
         domains = utils.loads(json)
-        return domains
+        return _replay_journal(fname, domains)
     except IOError:
         raise exception.NotFound()
 
 
 def write_domains(fname, domains):
+    """
+    Atomically replaces the domain file and discards its journal.
+    """
     #json = jsonutils.dumps(domains)
     json = utils.dumps(domains)
-    f = open(fname, 'w')
-    f.write(json)
-    f.close()
+    tmp_fname = fname + '.tmp'
+    f = open(tmp_fname, 'w')
+    try:
+        f.write(json)
+        f.flush()
+        os.fsync(f.fileno())
+    finally:
+        f.close()
+    os.rename(tmp_fname, fname)
+    utils.delete_if_exists(_journal_file(fname))
+
+
+def append_domain_journal(fname, record):
+    """
+    Appends a single change record to the journal of the domain file.
+    """
+    f = open(_journal_file(fname), 'a')
+    try:
+        f.write(utils.dumps(record) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+    finally:
+        f.close()
 
 
 class BareMetalDom(object):
@@ -80,6 +150,9 @@ class BareMetalDom(object):
 
         self.fake_dom_file = fake_dom_file
         self.domains = []
+        self.domains_by_name = {}
+        self.domains_by_node = {}
+        self.journal_records = 0
         self.fake_dom_nums = 0
         self.baremetal_nodes = nodes.get_baremetal_nodes()
 
@@ -91,6 +164,7 @@ class BareMetalDom(object):
         """
         try:
             self.domains = read_domains(self.fake_dom_file)
+            self._index_domains()
         except IOError:
             dom = []
             LOG.debug(_("No domains exist."))
@@ -104,7 +178,7 @@ class BareMetalDom(object):
                 continue
             elif dom['status'] != power_state.RUNNING:
                 LOG.debug(_("Not running domain: remove"))
-                self.domains.remove(dom)
+                self._remove_domain(dom)
                 continue
             res = self.baremetal_nodes.set_status(dom['node_id'],
                                     dom['status'])
@@ -112,7 +186,7 @@ class BareMetalDom(object):
                 self.fake_dom_nums = self.fake_dom_nums + 1
             else:
                 LOG.debug(_("domain running on an unknown node: discarded"))
-                self.domains.remove(dom)
+                self._remove_domain(dom)
                 continue
 
         LOG.debug(self.domains)
@@ -160,10 +234,10 @@ class BareMetalDom(object):
         try:
             self.baremetal_nodes.deactivate_node(fd['node_id'])
 
-            self.domains.remove(fd)
+            self._remove_domain(fd)
             msg = _("Domains: %s")
             LOG.debug(msg % (self.domains))
-            self.store_domain()
+            self.journal_domain({'op': 'delete', 'name': name})
             msg = _("After storing domains: %s")
             LOG.debug(msg % (self.domains))
         except Exception:
@@ -195,7 +269,7 @@ class BareMetalDom(object):
                     'kernel_id': xml_dict['kernel_id'],
                     'ramdisk_id': xml_dict['ramdisk_id'],
                      'status': power_state.BUILDING}
-        self.domains.append(new_dom)
+        self._add_domain(new_dom)
         msg = _("Created new domain: %s")
         LOG.debug(msg % (new_dom))
         self.change_domain_state(new_dom['name'], power_state.BUILDING)
@@ -209,7 +283,8 @@ class BareMetalDom(object):
                 new_dom['ip_address'], new_dom['user_data'])
             self.change_domain_state(new_dom['name'], state)
         except Exception:
-            self.domains.remove(new_dom)
+            self._remove_domain(new_dom)
+            self.journal_domain({'op': 'delete', 'name': new_dom['name']})
             self.baremetal_nodes.free_node(node_id)
             LOG.debug(_("Failed to boot Bare-metal node %s"), node_id)
         return state
@@ -222,10 +297,9 @@ class BareMetalDom(object):
         if l == []:
             msg = _("No such domain exists")
             raise exception.NotFound(msg)
-        i = self.domains.index(l)
-        self.domains[i]['status'] = state
+        l['status'] = state
         LOG.debug(_("change_domain_state: to new state %s"), str(state))
-        self.store_domain()
+        self.journal_domain({'op': 'put', 'domain': l})
 
     def store_domain(self):
         """
@@ -234,23 +308,58 @@ class BareMetalDom(object):
         msg = _("Stored fake domains to the file: %s")
         LOG.debug(msg % (self.domains))
         write_domains(self.fake_dom_file, self.domains)
+        self.journal_records = 0
+
+    def journal_domain(self, record):
+        """
+        Appends a domain change to the journal of the domain file.
+
+        The domain file is compacted once the journal holds
+        baremetal_dom_journal_max_records records.
+        """
+        append_domain_journal(self.fake_dom_file, record)
+        self.journal_records += 1
+        if self.journal_records >= FLAGS.baremetal_dom_journal_max_records:
+            self.store_domain()
 
     def find_domain(self, name):
         """
         Finds domain by the given name and returns the domain.
         """
-        for item in self.domains:
-            if item['name'] == name:
-                return item
+        domain = self.domains_by_name.get(name)
+        if domain is not None:
+            return domain
         LOG.debug(_("domain does not exist"))
         return []
 
+    def find_domain_by_node(self, node_id):
+        """
+        Finds the domain running on the given node and returns the domain.
+        """
+        return self.domains_by_node.get(node_id, [])
+
+    def _index_domains(self):
+        """
+        Rebuilds the name and node_id indexes from the domains list.
+        """
+        self.domains_by_name = dict((d['name'], d) for d in self.domains)
+        self.domains_by_node = dict((d['node_id'], d) for d in self.domains)
+
+    def _add_domain(self, domain):
+        self.domains.append(domain)
+        self.domains_by_name[domain['name']] = domain
+        self.domains_by_node[domain['node_id']] = domain
+
+    def _remove_domain(self, domain):
+        self.domains.remove(domain)
+        self.domains_by_name.pop(domain['name'], None)
+        if self.domains_by_node.get(domain['node_id']) is domain:
+            del self.domains_by_node[domain['node_id']]
+
     def list_domains(self):
         """
         Returns the instance name from domains list.
         """
-        if self.domains == []:
-            return []
         return [x['name'] for x in self.domains]
 
     def get_domain_info(self, instance_name):
@@ -15,6 +15,11 @@
 #    under the License.
 #
 
+from eventlet import greenthread
+
+from nova.compute import power_state
+from nova.virt.baremetal import inventory
+
 
 def get_baremetal_nodes():
     return BareMetalNodes()
@@ -29,7 +34,7 @@ class BareMetalNodes(object):
     for virtualization.
     """
 
-    def get_hw_info(self, field):
+    def get_hw_info(self, field, node_id=None):
         """
         Returns hardware information of bare-metal node by the given field.
 
@@ -38,6 +43,22 @@ class BareMetalNodes(object):
         """
         return "fake"
 
+    def get_capacity(self):
+        """
+        Returns the aggregate vcpus, memory_mb and local_gb of all nodes,
+        total and used.
+        """
+        return {'vcpus': 0, 'vcpus_used': 0,
+                'memory_mb': 0, 'memory_mb_used': 0,
+                'local_gb': 0, 'local_gb_used': 0}
+
+    def add_status_listener(self, listener):
+        """
+        Calls listener(node_id, old_status, new_status) whenever a node
+        is allocated, freed or otherwise changes status.
+        """
+        pass
+
     def set_status(self, node_id, status):
         """
         Sets status of the given node by the given status.
@@ -100,6 +121,18 @@ class BareMetalNodes(object):
         """
         pass
 
+    def is_reachable(self, node_ip, mac_addr=None):
+        """
+        Probes the given node once, without waiting.
+        """
+        return True
+
+    def wait_for_activation(self, node_id, node_ip):
+        """
+        Polls the given node until it is reachable.
+        """
+        return True
+
     def check_activated(self, node_id, node_ip):
         """
         Checks whether the given node is activated or not.
@@ -127,16 +160,37 @@ class BareMetalNodes(object):
         """
         pass
 
+    def configure_node(self, node_ip, mac_address, ip_address):
+        """
+        Sets network configuration and runs sshd in one tile-monitor session.
+        """
+        pass
+
     def activate_node(self, node_id, node_ip, name, mac_address,
-                      ip_address):
+                      ip_address, user_data=None):
         """
         Activates the given node using ID, IP, and MAC address.
         """
         pass
 
-    def get_console_output(self, console_log):
+    def activate_nodes(self, requests):
+        """
+        Activates several nodes at once on greenthreads.
+        """
+        return {}
+
+    def get_activation_timings(self, node_id):
+        """
+        Returns the per-stage timings (in seconds) of the last activation.
+        """
+        return {}
+
+    def get_console_output(self, console_log, node_id):
         """
         Gets console output of the given node.
+
+        The output not seen yet is appended to the console ring log kept
+        at console_log.
         """
         pass
 
@@ -155,3 +209,81 @@ class BareMetalNodes(object):
         This should be done after ssh key is injected.
         """
         pass
+
+
+class SimulatedBareMetalNodes(BareMetalNodes):
+    """
+    Fake nodes kept in a NodeInventory, for benchmarks.
+
+    Power operations take power_latency seconds and a node takes
+    boot_latency more seconds to boot once powered on.
+    """
+
+    def __init__(self, num_nodes, power_latency=0, boot_latency=0):
+        self.power_latency = power_latency
+        self.boot_latency = boot_latency
+        self.inventory = inventory.NodeInventory()
+        for node_id in xrange(num_nodes):
+            self.inventory.add({'node_id': node_id,
+                                'ip_addr': '10.%d.%d.%d' % (
+                                        node_id >> 16,
+                                        (node_id >> 8) & 0xff,
+                                        node_id & 0xff),
+                                'mac_addr': '02:16:3e:%02x:%02x:%02x' % (
+                                        node_id >> 16,
+                                        (node_id >> 8) & 0xff,
+                                        node_id & 0xff),
+                                'status': power_state.NOSTATE,
+                                'vcpus': 1,
+                                'memory_mb': 16218,
+                                'local_gb': 917,
+                                'memory_mb_used': 476,
+                                'local_gb_used': 1,
+                                'hypervisor_type': 'fake',
+                                'hypervisor_version': 1,
+                                'cpu_info': 'fake'})
+
+    def get_hw_info(self, field, node_id=None):
+        if node_id is None:
+            node = self.inventory.first()
+        else:
+            node = self.inventory.get(node_id)
+        if node is not None:
+            return node.get(field)
+
+    def get_capacity(self):
+        return self.inventory.get_capacity()
+
+    def add_status_listener(self, listener):
+        self.inventory.add_listener(listener)
+
+    def set_status(self, node_id, status):
+        return self.inventory.set_status(node_id, status)
+
+    def get_idle_node(self):
+        return self.inventory.allocate(power_state.RUNNING)['node_id']
+
+    def get_ip_by_id(self, id):
+        node = self.inventory.get(id)
+        if node is not None:
+            return node['ip_addr']
+
+    def free_node(self, node_id):
+        self.inventory.set_status(int(node_id), power_state.NOSTATE)
+
+    def power_mgr(self, node_id, mode):
+        self.sleep_mgr(self.power_latency)
+
+    def sleep_mgr(self, time_in_seconds):
+        greenthread.sleep(time_in_seconds)
+
+    def deactivate_node(self, node_id):
+        self.set_status(node_id, power_state.NOSTATE)
+        self.power_mgr(node_id, 2)
+
+    def activate_node(self, node_id, node_ip, name, mac_address,
+                      ip_address, user_data=None):
+        self.power_mgr(node_id, 3)
+        self.sleep_mgr(self.boot_latency)
+        self.set_status(node_id, power_state.RUNNING)
+        return power_state.RUNNING
@@ -0,0 +1,216 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2011 University of Southern California
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Shared base image cache for bare-metal nodes.
+
+Every image is downloaded once into NOVA-INST-DIR/_base under a name
+derived from its image id, and per-node root images are cloned from that
+base. With the default 'reflink' clone method the clone shares its blocks
+with the base on filesystems that support it (btrfs, XFS with reflink) and
+falls back to a sparse copy elsewhere. Bases are reference counted by
+their users; unreferenced bases are evicted, least recently used first,
+once the cache grows beyond baremetal_image_cache_size_mb. Bases being
+downloaded are never evicted.
+
+The references of an instance are also listed in the base_images file of
+its directory, so that they are rebuilt when nova-compute restarts and
+the bases of running nodes are never evicted.
+"""
+
+import os
+
+from eventlet import greenthread
+
+from nova import flags
+from nova import log as logging
+from nova.openstack.common import cfg
+from nova import utils
+from nova.virt.libvirt import utils as libvirt_utils
+
+image_cache_opts = [
+    cfg.StrOpt('baremetal_image_clone_method',
+               default='reflink',
+               help='How per-node images are created from a cached base '
+                    'image: reflink, copy or cow (qcow2 backing file)'),
+    cfg.IntOpt('baremetal_image_cache_size_mb',
+               default=0,
+               help='Size above which unreferenced base images are evicted, '
+                    '0 for no limit'),
+    cfg.ListOpt('baremetal_prefetch_images',
+                default=[],
+                help='Image ids fetched into the base image cache in the '
+                     'background when nova-compute starts'),
+    ]
+
+FLAGS = flags.FLAGS
+FLAGS.register_opts(image_cache_opts)
+
+LOG = logging.getLogger(__name__)
+
+REFS_FILE = 'base_images'
+
+_image_cache = None
+
+
+def get_image_cache():
+    global _image_cache
+    if _image_cache is None:
+        _image_cache = BaseImageCache()
+    return _image_cache
+
+
+class BaseImageCache(object):
+    """Downloads each base image once and clones it per node."""
+
+    def __init__(self, base_dir=None, instances_path=None):
+        self.instances_path = instances_path or FLAGS.instances_path
+        self.base_dir = base_dir or os.path.join(self.instances_path,
+                                                 '_base')
+        # fname -> set of users (instance names) of the base image
+        self.refs = {}
+        # fname -> number of fetches downloading or waiting for the base
+        self.fetching = {}
+        self._load_refs()
+
+    def _refs_path(self, user):
+        return os.path.join(self.instances_path, user, REFS_FILE)
+
+    def _load_refs(self):
+        """
+        Rebuilds the references from the instance directories.
+        """
+        if not os.path.isdir(self.instances_path):
+            return
+        for user in os.listdir(self.instances_path):
+            path = self._refs_path(user)
+            if not os.path.isfile(path):
+                continue
+            with open(path) as f:
+                for fname in f.read().split():
+                    self.refs.setdefault(fname, set()).add(user)
+
+    def base_path(self, fname):
+        return os.path.join(self.base_dir, fname)
+
+    def fetch(self, fname, fn, *args, **kwargs):
+        """
+        Returns the path of the base image fname, downloading it first
+        with fn(target=path, ...) if it is not cached yet.
+
+        Concurrent requests for the same image wait for a single download.
+        """
+        base = self.base_path(fname)
+        if not os.path.exists(base):
+            libvirt_utils.ensure_tree(self.base_dir)
+
+            @utils.synchronized(fname)
+            def call_if_not_exists(base, fn, *args, **kwargs):
+                if not os.path.exists(base):
+                    fn(target=base, *args, **kwargs)
+
+            self.fetching[fname] = self.fetching.get(fname, 0) + 1
+            try:
+                call_if_not_exists(base, fn, *args, **kwargs)
+            finally:
+                self.fetching[fname] -= 1
+                if not self.fetching[fname]:
+                    del self.fetching[fname]
+        else:
+            # NOTE: the modification time orders bases for eviction
+            os.utime(base, None)
+        return base
+
+    def prefetch(self, fname, fn, *args, **kwargs):
+        """
+        Fetches the base image fname in a background greenthread.
+        """
+        def _prefetch():
+            try:
+                self.fetch(fname, fn, *args, **kwargs)
+            except Exception:
+                LOG.exception(_("Failed to prefetch base image %s"), fname)
+
+        greenthread.spawn_n(_prefetch)
+
+    def clone(self, base, target, method=None):
+        """
+        Creates target from the base image with the given clone method.
+        """
+        method = method or FLAGS.baremetal_image_clone_method
+        if method == 'reflink':
+            utils.execute('cp', '--reflink=auto', '--sparse=always',
+                          base, target)
+        elif method == 'cow':
+            libvirt_utils.create_cow_image(base, target)
+        else:
+            libvirt_utils.copy_image(base, target)
+
+    def acquire(self, fname, user):
+        """
+        Records that user (an instance name) is using the base image fname,
+        in the directory of the instance too, which is created if needed.
+        """
+        users = self.refs.setdefault(fname, set())
+        if user in users:
+            return
+        users.add(user)
+        path = self._refs_path(user)
+        libvirt_utils.ensure_tree(os.path.dirname(path))
+        with open(path, 'a') as f:
+            f.write(fname + '\n')
+
+    def release(self, user):
+        """
+        Drops every reference held by user and evicts if needed.
+        """
+        for fname in self.refs.keys():
+            self.refs[fname].discard(user)
+            if not self.refs[fname]:
+                del self.refs[fname]
+        utils.delete_if_exists(self._refs_path(user))
+        self.evict()
+
+    def evict(self, max_size_mb=None):
+        """
+        Removes unreferenced base images, least recently used first, until
+        the cache is no larger than max_size_mb.
+
+        Returns the names of the removed base images.
+        """
+        if max_size_mb is None:
+            max_size_mb = FLAGS.baremetal_image_cache_size_mb
+        if not max_size_mb or not os.path.isdir(self.base_dir):
+            return []
+
+        bases = []
+        total = 0
+        for fname in os.listdir(self.base_dir):
+            stat = os.stat(self.base_path(fname))
+            total += stat.st_size
+            if fname not in self.refs and fname not in self.fetching:
+                bases.append((stat.st_mtime, fname, stat.st_size))
+
+        removed = []
+        limit = max_size_mb * 1024 * 1024
+        for _mtime, fname, size in sorted(bases):
+            if total <= limit:
+                break
+            LOG.info(_("Evicting base image %s"), fname)
+            utils.delete_if_exists(self.base_path(fname))
+            total -= size
+            removed.append(fname)
+        return removed
@@ -0,0 +1,167 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2011 University of Southern California
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Indexed inventory of bare-metal nodes.
+
+Nodes are kept in a dict keyed by node_id and in one ordered free list per
+power state, so that allocation, status changes and lookups are O(1).
+The aggregate capacity of the inventory is adjusted as nodes change state
+instead of being recomputed from the whole node list, and listeners are
+told about every status change.
+"""
+
+import collections
+
+from nova.compute import power_state
+from nova import exception
+from nova import utils
+
+
+class NodeInventory(object):
+    """
+    Bare-metal nodes indexed by node_id and by power state.
+
+    A node is idle while its status is NOSTATE. An allocated node counts
+    all of its vcpus, memory and disk as used; an idle node only counts
+    the memory_mb_used and local_gb_used it was registered with.
+    """
+
+    def __init__(self, nodes=None):
+        self._nodes = utils.OrderedDict()
+        self._by_status = collections.defaultdict(utils.OrderedDict)
+        self._capacity = {'vcpus': 0,
+                          'vcpus_used': 0,
+                          'memory_mb': 0,
+                          'memory_mb_used': 0,
+                          'local_gb': 0,
+                          'local_gb_used': 0}
+        self._listeners = []
+        for node in nodes or []:
+            self.add(node)
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def __iter__(self):
+        return self._nodes.itervalues()
+
+    def __contains__(self, node_id):
+        return node_id in self._nodes
+
+    @staticmethod
+    def _usage(node):
+        """
+        Returns the (vcpus, memory_mb, local_gb) used by the given node.
+        """
+        if node['status'] == power_state.NOSTATE:
+            return (0, node.get('memory_mb_used', 0),
+                    node.get('local_gb_used', 0))
+        return node['vcpus'], node['memory_mb'], node['local_gb']
+
+    def _account(self, node, sign):
+        vcpus, memory_mb, local_gb = self._usage(node)
+        self._capacity['vcpus_used'] += sign * vcpus
+        self._capacity['memory_mb_used'] += sign * memory_mb
+        self._capacity['local_gb_used'] += sign * local_gb
+
+    def add(self, node):
+        """
+        Registers a node dict; node_id must not already be registered.
+        """
+        node_id = node['node_id']
+        if node_id in self._nodes:
+            raise exception.Duplicate(_("Node %s is already registered")
+                                      % node_id)
+        self._nodes[node_id] = node
+        self._by_status[node['status']][node_id] = node
+        self._capacity['vcpus'] += node['vcpus']
+        self._capacity['memory_mb'] += node['memory_mb']
+        self._capacity['local_gb'] += node['local_gb']
+        self._account(node, 1)
+
+    def get(self, node_id):
+        """
+        Returns the node dict for node_id or None if it is unknown.
+        """
+        return self._nodes.get(node_id)
+
+    def first(self):
+        """
+        Returns the first registered node or None if there is none.
+        """
+        for node in self._nodes.itervalues():
+            return node
+
+    def set_status(self, node_id, status):
+        """
+        Moves the given node to the free list of the given status.
+
+        Returns False if the node is unknown.
+        """
+        node = self._nodes.get(node_id)
+        if node is None:
+            return False
+        old_status = node['status']
+        if old_status == status:
+            return True
+        del self._by_status[old_status][node_id]
+        self._account(node, -1)
+        node['status'] = status
+        self._by_status[status][node_id] = node
+        self._account(node, 1)
+        for listener in self._listeners:
+            listener(node_id, old_status, status)
+        return True
+
+    def add_listener(self, listener):
+        """
+        Calls listener(node_id, old_status, new_status) whenever a node
+        changes status.
+        """
+        self._listeners.append(listener)
+
+    def allocate(self, status=power_state.RUNNING):
+        """
+        Takes the oldest idle node, moves it to status and returns it.
+        """
+        idle = self._by_status[power_state.NOSTATE]
+        if not idle:
+            raise exception.NotFound(_("No free nodes available"))
+        node_id = next(idle.iterkeys())
+        self.set_status(node_id, status)
+        return self._nodes[node_id]
+
+    def count(self, status):
+        """
+        Returns the number of nodes in the given status.
+        """
+        return len(self._by_status[status])
+
+    def node_ids(self, status):
+        """
+        Returns the ids of the nodes in the given status, oldest first.
+        """
+        return self._by_status[status].keys()
+
+    def get_capacity(self):
+        """
+        Returns a copy of the aggregate capacity of the inventory.
+
+        Keys are vcpus, memory_mb and local_gb plus their *_used
+        counterparts.
+        """
+        return dict(self._capacity)
@@ -0,0 +1,249 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2011 University of Southern California
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Power drivers for bare-metal nodes.
+
+PDUPowerDriver maps each node to a (PDU, outlet) pair and queues power
+operations per PDU. Operations queued within baremetal_pdu_batch_window
+seconds of each other are coalesced and sent to each PDU in order, one
+batch at a time:
+
+    pdu_mgr <pdu address> <outlet> <mode>
+
+where mode is 1 (ON), 2 (OFF) or 3 (REBOOT). pdu_mgr is run for each
+outlet of a batch, unless baremetal_pdu_mgr_outlet_lists says it takes
+a comma separated list of outlets.
+"""
+
+import os
+import sys
+
+from eventlet import event
+from eventlet import greenthread
+
+from nova import flags
+from nova import log as logging
+from nova.openstack.common import cfg
+from nova import utils
+
+power_opts = [
+    cfg.StrOpt('baremetal_power_driver',
+               default='nova.virt.baremetal.power.PDUPowerDriver',
+               help='Power driver used to switch bare-metal nodes'),
+    cfg.StrOpt('baremetal_pdu_mgr',
+               default='/tftpboot/pdu_mgr',
+               help='Program switching the outlets of a PDU'),
+    cfg.StrOpt('baremetal_pdu_map',
+               default='/tftpboot/pdu_map',
+               help='File mapping each bare-metal node to a PDU address '
+                    'and outlet, one "node_id pdu_address outlet" per line'),
+    cfg.FloatOpt('baremetal_pdu_batch_window',
+                 default=0.05,
+                 help='Seconds power operations are queued for before the '
+                      'operations of each PDU are sent in one batch'),
+    cfg.BoolOpt('baremetal_pdu_mgr_outlet_lists',
+                default=False,
+                help='Whether baremetal_pdu_mgr switches a comma separated '
+                     'list of outlets at once'),
+    ]
+
+FLAGS = flags.FLAGS
+FLAGS.register_opts(power_opts)
+
+LOG = logging.getLogger(__name__)
+
+POWER_ON = 1
+POWER_OFF = 2
+POWER_REBOOT = 3
+
+
+def get_power_driver():
+    return utils.import_object(FLAGS.baremetal_power_driver)
+
+
+def legacy_pdu_outlet(node_id):
+    """
+    Returns the (PDU, outlet) of a node of ISI's testbed.
+
+    This is used for nodes that are not listed in baremetal_pdu_map.
+    """
+    if node_id < 5:
+        return "10.0.100.1", node_id + 5
+    return "10.0.100.2", node_id
+
+
+def read_pdu_map(fname):
+    """
+    Reads a node_id -> (pdu address, outlet) map from the given file.
+
+    Blank lines and lines starting with '#' are skipped.
+    """
+    pdu_map = {}
+    if not os.path.exists(fname):
+        return pdu_map
+    f = open(fname, 'r')
+    try:
+        for line in f:
+            fields = line.split()
+            if not fields or fields[0].startswith('#'):
+                continue
+            pdu_map[int(fields[0])] = (fields[1], int(fields[2]))
+    finally:
+        f.close()
+    return pdu_map
+
+
+def coalesce(ops):
+    """
+    Groups queued (outlet, mode, ...) operations of one PDU into batches.
+
+    Returns a list of (mode, ops) batches. Operations on the same outlet
+    stay in the order they were queued; otherwise operations with the
+    same mode are merged into a single batch, in the order the first of
+    them was queued.
+    """
+    layer_of_outlet = {}
+    layers = []
+    for op in ops:
+        outlet, mode = op[0], op[1]
+        layer = layer_of_outlet.get(outlet, -1) + 1
+        layer_of_outlet[outlet] = layer
+        if layer == len(layers):
+            layers.append(utils.OrderedDict())
+        layers[layer].setdefault(mode, []).append(op)
+
+    batches = []
+    for layer in layers:
+        batches.extend(layer.items())
+    return batches
+
+
+class PowerDriver(object):
+    """Base class for bare-metal power drivers."""
+
+    def power(self, node_id, mode):
+        """
+        Changes power state of the given node.
+
+        According to the mode (1-ON, 2-OFF, 3-REBOOT), power state can be
+        changed.
+        """
+        raise NotImplementedError()
+
+
+class PDUPowerDriver(PowerDriver):
+    """Switches nodes through their PDU outlets, batching per PDU."""
+
+    def __init__(self, pdu_map=None):
+        if pdu_map is None:
+            pdu_map = read_pdu_map(FLAGS.baremetal_pdu_map)
+        self.pdu_map = pdu_map
+        self._queues = {}
+
+    def get_outlet(self, node_id):
+        """
+        Returns the (PDU address, outlet) the given node is plugged into.
+        """
+        try:
+            return self.pdu_map[node_id]
+        except KeyError:
+            return legacy_pdu_outlet(node_id)
+
+    def power(self, node_id, mode):
+        """
+        Queues a power operation and waits until its batch is sent.
+        """
+        self.power_many([node_id], mode)
+
+    def power_many(self, node_ids, mode):
+        """
+        Queues the same power operation for several nodes and waits
+        until all of them are sent.
+        """
+        done = [self._enqueue(node_id, mode) for node_id in node_ids]
+        for ev in done:
+            ev.wait()
+
+    def _enqueue(self, node_id, mode):
+        pdu, outlet = self.get_outlet(node_id)
+        done = event.Event()
+        queue = self._queues.get(pdu)
+        if queue is None:
+            queue = self._queues[pdu] = []
+            greenthread.spawn_after(FLAGS.baremetal_pdu_batch_window,
+                                    self._flush, pdu)
+        queue.append((outlet, mode, done))
+        return done
+
+    def _flush(self, pdu):
+        # NOTE: the queue of the PDU is kept while its batches are sent,
+        # so that the operations queued meanwhile are sent afterwards by
+        # this greenthread rather than by a concurrent one.
+        while self._queues[pdu]:
+            ops = self._queues[pdu]
+            self._queues[pdu] = []
+            self._send(pdu, ops)
+        del self._queues[pdu]
+
+    def _send(self, pdu, ops):
+        for mode, batch in coalesce(ops):
+            outlets = [outlet for outlet, _mode, _done in batch]
+            try:
+                self._switch(pdu, outlets, mode)
+            except Exception:
+                exc_info = sys.exc_info()
+                LOG.exception(_("Failed to switch outlets %(outlets)s of "
+                                "PDU %(pdu)s"), locals())
+                for _outlet, _mode, done in batch:
+                    done.send_exception(*exc_info)
+            else:
+                for _outlet, _mode, done in batch:
+                    done.send(True)
+
+    def _switch(self, pdu, outlets, mode):
+        """
+        Sends one batch of outlets with the same mode to a PDU.
+        """
+        if FLAGS.baremetal_pdu_mgr_outlet_lists:
+            utils.execute(FLAGS.baremetal_pdu_mgr, pdu,
+                          ','.join(str(outlet) for outlet in outlets),
+                          str(mode))
+            return
+        for outlet in outlets:
+            utils.execute(FLAGS.baremetal_pdu_mgr, pdu, str(outlet),
+                          str(mode))
+
+
+class FakePDUPowerDriver(PDUPowerDriver):
+    """
+    Stands in for real PDUs in tests and benchmarks.
+
+    Every batch takes latency seconds and is recorded in invocations;
+    outlet_modes keeps the last mode sent to each (PDU, outlet).
+    """
+
+    def __init__(self, pdu_map=None, latency=0):
+        super(FakePDUPowerDriver, self).__init__(pdu_map or {})
+        self.latency = latency
+        self.invocations = []
+        self.outlet_modes = {}
+
+    def _switch(self, pdu, outlets, mode):
+        greenthread.sleep(self.latency)
+        self.invocations.append((pdu, tuple(outlets), mode))
+        for outlet in outlets:
+            self.outlet_modes[(pdu, outlet)] = mode
@@ -0,0 +1,154 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2011 University of Southern California
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Green-friendly child processes for the bare-metal drivers.
+
+Output is read through eventlet's green pipes into memory, so a running
+command never blocks the hub. Every child is reaped, including when it
+times out or is cancelled, so no zombie processes are left behind.
+"""
+
+import errno
+
+from eventlet import greenthread
+from eventlet.green import subprocess
+from eventlet import timeout as eventlet_timeout
+
+from nova import exception
+from nova import log as logging
+
+LOG = logging.getLogger(__name__)
+
+
+class Process(object):
+    """
+    A child process running in the background.
+
+    The process is started right away; wait() returns its (stdout, stderr)
+    or raises ProcessExecutionError if it failed, timed out or was
+    cancelled.
+    """
+
+    def __init__(self, cmd, process_input=None, timeout=None,
+                 check_exit_code=True):
+        self.cmd = [str(part) for part in cmd]
+        self.timeout = timeout
+        self.check_exit_code = check_exit_code
+        self.cancelled = False
+        self.timed_out = False
+        LOG.debug(_('Running cmd (subprocess): %s'), ' '.join(self.cmd))
+        _PIPE = subprocess.PIPE  # pylint: disable=E1101
+        self._obj = subprocess.Popen(self.cmd,
+                                     stdin=_PIPE,
+                                     stdout=_PIPE,
+                                     stderr=_PIPE,
+                                     close_fds=True)
+        self._thread = greenthread.spawn(self._communicate, process_input)
+
+    def _communicate(self, process_input):
+        # NOTE: Popen.communicate() blocks the hub in select.poll(), the
+        # pipes are read by greenthreads of their own instead.
+        timer = eventlet_timeout.Timeout(self.timeout)
+        readers = [greenthread.spawn(pipe.read)
+                   for pipe in (self._obj.stdout, self._obj.stderr)]
+        try:
+            self._write_input(process_input)
+            output = tuple(reader.wait() for reader in readers)
+            self._obj.wait()
+            return output
+        except eventlet_timeout.Timeout as t:
+            if t is not timer:
+                raise
+            self.timed_out = True
+            self._kill()
+            self._obj.wait()
+            return '', ''
+        finally:
+            timer.cancel()
+            for reader in readers:
+                reader.kill()
+
+    def _write_input(self, process_input):
+        try:
+            if process_input:
+                self._obj.stdin.write(process_input)
+            self._obj.stdin.close()
+        except IOError as e:
+            # NOTE: the child exited without reading all of its input
+            if e.errno != errno.EPIPE:
+                raise
+
+    def _kill(self):
+        try:
+            self._obj.kill()
+        except OSError:
+            # NOTE: the child already exited
+            pass
+
+    def cancel(self):
+        """
+        Kills the child process; wait() will raise ProcessExecutionError.
+
+        The child is reaped by the greenthread collecting its output.
+        """
+        self.cancelled = True
+        self._kill()
+
+    def running(self):
+        return self._obj.poll() is None
+
+    def wait(self):
+        """
+        Waits for the child to exit and returns its (stdout, stderr).
+        """
+        stdout, stderr = self._thread.wait()
+        cmd = ' '.join(self.cmd)
+        if self.timed_out:
+            raise exception.ProcessExecutionError(
+                    cmd=cmd, stdout=stdout, stderr=stderr,
+                    description=_('Timed out after %s seconds')
+                                % self.timeout)
+        if self.cancelled:
+            raise exception.ProcessExecutionError(
+                    cmd=cmd, stdout=stdout, stderr=stderr,
+                    description=_('Cancelled'))
+        returncode = self._obj.returncode
+        if returncode and self.check_exit_code:
+            LOG.debug(_('Result was %s') % returncode)
+            raise exception.ProcessExecutionError(exit_code=returncode,
+                                                  stdout=stdout,
+                                                  stderr=stderr,
+                                                  cmd=cmd)
+        return stdout, stderr
+
+
+def spawn(*cmd, **kwargs):
+    """
+    Starts cmd in the background and returns its Process.
+
+    :param process_input:   Sent to the standard input of the process.
+    :param timeout:         Seconds after which the process is killed.
+    :param check_exit_code: Whether a non-zero exit code is an error.
+    """
+    return Process(cmd, **kwargs)
+
+
+def execute(*cmd, **kwargs):
+    """
+    Runs cmd and returns its (stdout, stderr); see spawn for kwargs.
+    """
+    return spawn(*cmd, **kwargs).wait()
@@ -44,7 +44,9 @@ from nova import log as logging
 #from nova import notifications
 from nova.openstack.common import cfg
 from nova import utils
+from nova.virt.baremetal import console
 from nova.virt.baremetal import dom
+from nova.virt.baremetal import image_cache
 from nova.virt.baremetal import nodes
 from nova.virt.disk import api as disk
 from nova.virt import driver
@@ -90,6 +92,7 @@ class ProxyConnection(driver.ComputeDriver):
         # mode, so the read_only parameter is ignored
         super(ProxyConnection, self).__init__()
         self.baremetal_nodes = nodes.get_baremetal_nodes()
+        self.image_cache = image_cache.get_image_cache()
         self._wrapped_conn = None
         self._host_state = None
 
@@ -100,7 +103,14 @@ class ProxyConnection(driver.ComputeDriver):
         return self._host_state
 
     def init_host(self, host):
-        pass
+        context = nova_context.get_admin_context()
+        for image_id in FLAGS.baremetal_prefetch_images:
+            self.image_cache.prefetch(hashlib.sha1(image_id).hexdigest(),
+                                      libvirt_utils.fetch_image,
+                                      context=context,
+                                      image_id=image_id,
+                                      user_id=None,
+                                      project_id=None)
 
     def _get_connection(self):
         self._wrapped_conn = dom.BareMetalDom()
@@ -139,12 +149,22 @@ class ProxyConnection(driver.ComputeDriver):
                           {"name": instance["name"], "ex": ex},
                           instance=instance)
                 break
+        self._usage_changed()
 
         if cleanup:
             self._cleanup(instance)
 
         return True
 
+    def _usage_changed(self):
+        """Updates the host stats depending on node usage.
+
+        Nodes drivers may not report allocations to the status
+        listeners, so domain creation and destruction does it as well.
+        """
+        if self._host_state:
+            self._host_state.update_usage()
+
     def _cleanup(self, instance):
         target = os.path.join(FLAGS.instances_path, instance['name'])
         instance_name = instance['name']
@@ -154,20 +174,22 @@ class ProxyConnection(driver.ComputeDriver):
             disk.destroy_container(self.container)
         if os.path.exists(target):
             shutil.rmtree(target)
+        console.forget_console_log(os.path.join(target, 'console.log'))
+        self.image_cache.release(instance_name)
 
-    @exception.wrap_exception
+    @exception.wrap_exception()
     def attach_volume(self, instance_name, device_path, mountpoint):
         raise exception.Invalid("attach_volume not supported for baremetal.")
 
-    @exception.wrap_exception
+    @exception.wrap_exception()
     def detach_volume(self, instance_name, mountpoint):
         raise exception.Invalid("detach_volume not supported for baremetal.")
 
-    @exception.wrap_exception
+    @exception.wrap_exception()
     def snapshot(self, instance, image_id):
         raise exception.Invalid("snapshot not supported for baremetal.")
 
-    @exception.wrap_exception
+    @exception.wrap_exception()
     def reboot(self, instance):
         timer = utils.LoopingCall(f=None)
 
@@ -184,7 +206,7 @@ class ProxyConnection(driver.ComputeDriver):
         timer.f = _wait_for_reboot
         return timer.start(interval=0.5)
 
-    @exception.wrap_exception
+    @exception.wrap_exception()
     def rescue(self, context, instance, network_info):
         """Loads a VM using rescue images.
 
@@ -217,7 +239,7 @@ class ProxyConnection(driver.ComputeDriver):
         timer.f = _wait_for_rescue
         return timer.start(interval=0.5)
 
-    @exception.wrap_exception
+    @exception.wrap_exception()
     def unrescue(self, instance, network_info):
         """Reboot the VM which is being rescued back into primary images.
 
@@ -283,39 +305,42 @@ class ProxyConnection(driver.ComputeDriver):
                          'power_state': power_state.FAILED})
                 #notifications.send_update(context, old_ref, new_ref)
 
+            self._usage_changed()
             timer.stop()
         timer.f = _wait_for_boot
 
         return timer.start(interval=0.5)
 
-    def get_console_output(self, instance):
+    def _capture_console(self, instance):
         console_log = os.path.join(FLAGS.instances_path, instance['name'],
                                    'console.log')
 
-        libvirt_utils.chown(console_log, os.getuid())
+        if os.path.exists(console_log):
+            libvirt_utils.chown(console_log, os.getuid())
 
         fd = self._conn.find_domain(instance['name'])
 
         self.baremetal_nodes.get_console_output(console_log, fd['node_id'])
 
-        fpath = console_log
+        return console.get_console_log(console_log)
 
-        return libvirt_utils.load_file(fpath)
+    def get_console_output(self, instance):
+        return self._capture_console(instance).read()
 
-    @exception.wrap_exception
+    @exception.wrap_exception()
     def get_ajax_console(self, instance):
         raise NotImplementedError()
 
-    @exception.wrap_exception
+    @exception.wrap_exception()
     def get_vnc_console(self, instance):
         raise NotImplementedError()
 
-    @staticmethod
-    def _cache_image(fn, target, fname, cow=False, *args, **kwargs):
+    def _cache_image(self, fn, target, fname, cow=False, user=None,
+                     *args, **kwargs):
         """Wrapper for a method that creates an image that caches the image.
 
-        This wrapper will save the image into a common store and create a
-        copy for use by the hypervisor.
+        This wrapper will save the image into the shared base image cache
+        and clone it for use by the node.
 
         The underlying method should specify a kwarg of target representing
         where the image will be saved.
@@ -323,25 +348,15 @@ class ProxyConnection(driver.ComputeDriver):
         fname is used as the filename of the base image.  The filename needs
         to be unique to a given image.
 
-        If cow is True, it will make a CoW image instead of a copy.
+        If cow is True, it will make a CoW image instead of a clone. If user
+        is given, it holds a reference on the base image until the user's
+        instance is cleaned up.
         """
+        if user is not None:
+            self.image_cache.acquire(fname, user)
         if not os.path.exists(target):
-            base_dir = os.path.join(FLAGS.instances_path, '_base')
-            if not os.path.exists(base_dir):
-                libvirt_utils.ensure_tree(base_dir)
-            base = os.path.join(base_dir, fname)
-
-            @utils.synchronized(fname)
-            def call_if_not_exists(base, fn, *args, **kwargs):
-                if not os.path.exists(base):
-                    fn(target=base, *args, **kwargs)
-
-            call_if_not_exists(base, fn, *args, **kwargs)
-
-            if cow:
-                libvirt_utils.create_cow_image(base, target)
-            else:
-                libvirt_utils.copy_image(base, target)
+            base = self.image_cache.fetch(fname, fn, *args, **kwargs)
+            self.image_cache.clone(base, target, 'cow' if cow else None)
 
     def _create_image(self, context, inst, xml, suffix='',
                       disk_images=None, network_info=None,
@@ -381,6 +396,7 @@ class ProxyConnection(driver.ComputeDriver):
                               target=basepath('kernel'),
                               fname=fname,
                               cow=False,
+                              user=inst['name'],
                               image_id=disk_images['kernel_id'],
                               user_id=inst['user_id'],
                               project_id=inst['project_id'])
@@ -391,26 +407,21 @@ class ProxyConnection(driver.ComputeDriver):
                                   target=basepath('ramdisk'),
                                   fname=fname,
                                   cow=False,
+                                  user=inst['name'],
                                   image_id=disk_images['ramdisk_id'],
                                   user_id=inst['user_id'],
                                   project_id=inst['project_id'])
 
+        # NOTE: root images are not resized for bare-metal nodes, so the
+        #       base image is shared by every flavor booting the image.
         root_fname = hashlib.sha1(str(disk_images['image_id'])).hexdigest()
-        size = inst['root_gb'] * 1024 * 1024 * 1024
-
-        inst_type_id = inst['instance_type_id']
-        inst_type = instance_types.get_instance_type(inst_type_id)
-        if inst_type['name'] == 'm1.tiny' or suffix == '.rescue':
-            size = None
-            root_fname += "_sm"
-        else:
-            root_fname += "_%d" % inst['root_gb']
 
         self._cache_image(fn=libvirt_utils.fetch_image,
                           context=context,
                           target=basepath('root'),
                           fname=root_fname,
                           cow=False,  # FLAGS.use_cow_images,
+                          user=inst['name'],
                           image_id=disk_images['image_id'],
                           user_id=inst['user_id'],
                           project_id=inst['project_id'])
@@ -573,7 +584,7 @@ class ProxyConnection(driver.ComputeDriver):
         raise NotImplementedError()
 
     def get_vcpu_total(self):
-        """Get vcpu number of physical computer.
+        """Get vcpu number of the bare-metal nodes.
 
         :returns: the number of cpu core.
 
@@ -581,7 +592,7 @@ class ProxyConnection(driver.ComputeDriver):
 
         # On certain platforms, this will raise a NotImplementedError.
         try:
-            return self.baremetal_nodes.get_hw_info('vcpus')
+            return self.baremetal_nodes.get_capacity()['vcpus']
         except NotImplementedError:
             LOG.warn(_("Cannot get the number of cpu, because this "
                        "function is not implemented for this platform. "
@@ -589,50 +600,44 @@ class ProxyConnection(driver.ComputeDriver):
             return False
 
     def get_memory_mb_total(self):
-        """Get the total memory size(MB) of physical computer.
+        """Get the total memory size(MB) of the bare-metal nodes.
 
         :returns: the total amount of memory(MB).
 
         """
-        return self.baremetal_nodes.get_hw_info('memory_mb')
+        return self.baremetal_nodes.get_capacity()['memory_mb']
 
     def get_local_gb_total(self):
-        """Get the total hdd size(GB) of physical computer.
+        """Get the total hdd size(GB) of the bare-metal nodes.
 
-        :returns:
-            The total amount of HDD(GB).
-            Note that this value shows a partition where
-            NOVA-INST-DIR/instances mounts.
+        :returns: The total amount of HDD(GB).
 
         """
-        return self.baremetal_nodes.get_hw_info('local_gb')
+        return self.baremetal_nodes.get_capacity()['local_gb']
 
     def get_vcpu_used(self):
-        """ Get vcpu usage number of physical computer.
+        """ Get vcpu usage number of the bare-metal nodes.
 
         :returns: The total number of vcpu that currently used.
 
         """
-        return len(self._conn.list_domains())
+        return self.baremetal_nodes.get_capacity()['vcpus_used']
 
     def get_memory_mb_used(self):
-        """Get the free memory size(MB) of physical computer.
+        """Get the used memory size(MB) of the bare-metal nodes.
 
         :returns: the total usage of memory(MB).
 
         """
-        return self.baremetal_nodes.get_hw_info('memory_mb_used')
+        return self.baremetal_nodes.get_capacity()['memory_mb_used']
 
     def get_local_gb_used(self):
-        """Get the free hdd size(GB) of physical computer.
+        """Get the used hdd size(GB) of the bare-metal nodes.
 
-        :returns:
-           The total usage of HDD(GB).
-           Note that this value shows a partition where
-           NOVA-INST-DIR/instances mounts.
+        :returns: The total usage of HDD(GB).
 
         """
-        return self.baremetal_nodes.get_hw_info('local_gb_used')
+        return self.baremetal_nodes.get_capacity()['local_gb_used']
 
     def get_hypervisor_type(self):
         """Get hypervisor type.
@@ -699,22 +704,18 @@ class ProxyConnection(driver.ComputeDriver):
         except exception.NotFound:
             raise exception.ComputeServiceUnavailable(host=host)
 
-        # Updating host information
-        total_ram_mb = self.get_memory_mb_total()
-        free_ram_mb = self.get_memory_mb_used()
-        total_disk_gb = self.get_local_gb_total()
-        used_disk_gb = self.get_local_gb_used()
-
-        # Updating host information
-        dic = {'vcpus': self.get_vcpu_total(),
-               'memory_mb': total_ram_mb,
-               'local_gb': total_disk_gb,
-               'vcpus_used': self.get_vcpu_used(),
-               'memory_mb_used': total_ram_mb - free_ram_mb,
-               'local_gb_used': used_disk_gb,
-               'hypervisor_type': self.get_hypervisor_type(),
-               'hypervisor_version': self.get_hypervisor_version(),
-               'cpu_info': self.get_cpu_info(),
+        # NOTE: only the stats invalidated since the last update are
+        #       recomputed
+        stats = self.HostState.get_host_stats(refresh=True)
+        dic = {'vcpus': stats['vcpus'],
+               'memory_mb': stats['host_memory_total'],
+               'local_gb': stats['disk_total'],
+               'vcpus_used': stats['vcpus_used'],
+               'memory_mb_used': stats['host_memory_free'],
+               'local_gb_used': stats['disk_used'],
+               'hypervisor_type': stats['hypervisor_type'],
+               'hypervisor_version': stats['hypervisor_version'],
+               'cpu_info': stats['cpu_info'],
                'service_id': service_ref['id']}
 
         compute_node_ref = service_ref['compute_node']
@@ -755,22 +756,63 @@ class ProxyConnection(driver.ComputeDriver):
 
 
 class HostState(object):
-    """Manages information about the XenServer host this compute
+    """Manages information about the bare-metal host this compute
     node is running on.
+
+    The stats are kept as a snapshot. Allocating or freeing a node, and
+    spawning or destroying an instance, updates the stats depending on
+    node usage from the capacity of the nodes right away; update_status()
+    only recomputes the stats invalidated since the last update.
     """
 
+    # Stats which change when nodes are allocated or freed
+    USAGE_STATS = ('vcpus_used', 'disk_used', 'host_memory_used')
+
     def __init__(self, connection):
         super(HostState, self).__init__()
         self.connection = connection
         self._stats = {}
+        # Stats not reported as is, only used to derive others
+        self._hidden = {}
+        self._getters = {
+            'vcpus': connection.get_vcpu_total,
+            'vcpus_used': connection.get_vcpu_used,
+            'cpu_info': connection.get_cpu_info,
+            'disk_total': connection.get_local_gb_total,
+            'disk_used': connection.get_local_gb_used,
+            'host_memory_total': connection.get_memory_mb_total,
+            'host_memory_used': connection.get_memory_mb_used,
+            'hypervisor_type': connection.get_hypervisor_type,
+            'hypervisor_version': connection.get_hypervisor_version,
+            }
+        self._dirty = set(self._getters)
         self.extra_specs = {}
         for pair in FLAGS.instance_type_extra_specs:
             keyval = pair.split(':', 1)
             keyval[0] = keyval[0].strip()
             keyval[1] = keyval[1].strip()
             self.extra_specs[keyval[0]] = keyval[1]
+        connection.baremetal_nodes.add_status_listener(self.node_changed)
         self.update_status()
 
+    def node_changed(self, node_id, old_status, new_status):
+        """Updates the usage stats when a node changes status."""
+        self.update_usage()
+
+    def update_usage(self):
+        """Recomputes the stats depending on node usage, and those
+        invalidated since the last update."""
+        self.invalidate(self.USAGE_STATS)
+        self.update_status()
+
+    def invalidate(self, names=None):
+        """Marks the given stats, or all of them, to be recomputed by
+        the next update.
+        """
+        if names is None:
+            names = self._getters
+        self._dirty.update(names)
+
     def get_host_stats(self, refresh=False):
         """Return the current state of the host. If 'refresh' is
         True, run the update first.
@@ -782,30 +824,23 @@ class HostState(object):
     def update_status(self):
         """
         We can get host status information.
+
+        Only the stats invalidated since the last update are recomputed.
         """
-        LOG.debug(_("Updating host stats"))
-        data = {}
-        data["vcpus"] = self.connection.get_vcpu_total()
-        data["vcpus_used"] = self.connection.get_vcpu_used()
-        data["cpu_info"] = self.connection.get_cpu_info()
-        #data["cpu_arch"] = FLAGS.cpu_arch
-        #data["cpu_arch"] = self.extra_specs['cpu_arch']
-        self.extra_specs["hypervisor_type"] = \
-                          self.connection.get_hypervisor_type()
+        if not self._dirty:
+            return
+        LOG.debug(_("Updating host stats %s"), sorted(self._dirty))
+        dirty, self._dirty = self._dirty, set()
+        data = self._stats
+        for name in dirty:
+            value = self._getters[name]()
+            if name == 'host_memory_used':
+                self._hidden[name] = value
+            else:
+                data[name] = value
+        self.extra_specs["hypervisor_type"] = data["hypervisor_type"]
         self.extra_specs["baremetal_driver"] = FLAGS.baremetal_driver
-        data.update({"instance_type_extra_specs": self.extra_specs})
-        #data["xpus"] = FLAGS.xpus
-        #data["xpu_arch"] = FLAGS.xpu_arch
-        #data["xpu_info"] = FLAGS.xpu_info
-        #data["net_arch"] = FLAGS.net_arch
-        #data["net_info"] = FLAGS.net_info
-        #data["net_mbps"] = FLAGS.net_mbps
-        data["disk_total"] = self.connection.get_local_gb_total()
-        data["disk_used"] = self.connection.get_local_gb_used()
+        data["instance_type_extra_specs"] = self.extra_specs
         data["disk_available"] = data["disk_total"] - data["disk_used"]
-        data["host_memory_total"] = self.connection.get_memory_mb_total()
         data["host_memory_free"] = (data["host_memory_total"] -
-                                    self.connection.get_memory_mb_used())
-        data["hypervisor_type"] = self.connection.get_hypervisor_type()
-        data["hypervisor_version"] = self.connection.get_hypervisor_version()
-        self._stats = data
+                                    self._hidden["host_memory_used"])
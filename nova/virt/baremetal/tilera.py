@@ -22,23 +22,47 @@ is provided here as an example of how to implement a backend.
 """
 
 import base64
-import os
-import subprocess
 import time
 
+from eventlet import greenpool
+from eventlet import greenthread
+from eventlet import semaphore
+
 from nova.compute import power_state
 from nova import exception
 from nova import flags
 from nova import log as logging
 from nova.openstack.common import cfg
 from nova import utils
+from nova.virt.baremetal import console
+from nova.virt.baremetal import inventory
+from nova.virt.baremetal import power
+from nova.virt.baremetal import process
 
 FLAGS = flags.FLAGS
 
 tilera_opts = [
     cfg.StrOpt('tile_monitor',
                default='/usr/local/TileraMDE/bin/tile-monitor',
-               help='Tilera command line program for Bare-metal driver')
+               help='Tilera command line program for Bare-metal driver'),
+    cfg.IntOpt('tile_boot_timeout',
+               default=300,
+               help='Seconds to wait for a power cycled Tilera board to '
+                    'become reachable before giving up'),
+    cfg.FloatOpt('tile_poll_interval',
+                 default=1.0,
+                 help='Initial interval in seconds between readiness probes '
+                      'of a booting Tilera board'),
+    cfg.FloatOpt('tile_poll_max_interval',
+                 default=10.0,
+                 help='Upper bound in seconds on the backoff between '
+                      'readiness probes of a booting Tilera board'),
+    cfg.IntOpt('tile_monitor_timeout',
+               default=60,
+               help='Seconds after which a tile-monitor session is killed'),
+    cfg.IntOpt('tile_activation_concurrency',
+               default=8,
+               help='Maximum number of Tilera boards activated at once'),
     ]
 
 FLAGS.register_opts(tilera_opts)
@@ -115,32 +139,41 @@ class BareMetalNodes(object):
                     'cpu_info': l[self.CPU_INFO]}
             self.nodes.append(l_d)
         fp.close()
+        self.inventory = inventory.NodeInventory(self.nodes)
+        self.power_driver = power.get_power_driver()
+
+        self.activation_timings = {}
+        self._activation_slots = semaphore.Semaphore(
+                FLAGS.tile_activation_concurrency)
 
-    def get_hw_info(self, field):
+    def get_hw_info(self, field, node_id=None):
         """
         Returns hardware information of bare-metal node by the given field.
 
         Given field can be vcpus, memory_mb, local_gb, memory_mb_used,
         local_gb_used, hypervisor_type, hypervisor_version, and cpu_info.
+        If node_id is not given, the first node of the inventory is used.
+        """
+        if node_id is None:
+            node = self.inventory.first()
+        else:
+            node = self.inventory.get(node_id)
+        if node is not None:
+            return node.get(field)
+
+    def get_capacity(self):
+        """
+        Returns the aggregate vcpus, memory_mb and local_gb of all nodes,
+        total and used.
         """
-        for node in self.nodes:
-            if node['node_id'] == 9:
-                if field == 'vcpus':
-                    return node['vcpus']
-                elif field == 'memory_mb':
-                    return node['memory_mb']
-                elif field == 'local_gb':
-                    return node['local_gb']
-                elif field == 'memory_mb_used':
-                    return node['memory_mb_used']
-                elif field == 'local_gb_used':
-                    return node['local_gb_used']
-                elif field == 'hypervisor_type':
-                    return node['hypervisor_type']
-                elif field == 'hypervisor_version':
-                    return node['hypervisor_version']
-                elif field == 'cpu_info':
-                    return node['cpu_info']
+        return self.inventory.get_capacity()
+
+    def add_status_listener(self, listener):
+        """
+        Calls listener(node_id, old_status, new_status) whenever a node
+        is allocated, freed or otherwise changes status.
+        """
+        self.inventory.add_listener(listener)
 
     def set_status(self, node_id, status):
         """
@@ -148,11 +181,7 @@ class BareMetalNodes(object):
 
         Returns 1 if the node is in the nodes list.
         """
-        for node in self.nodes:
-            if node['node_id'] == node_id:
-                node['status'] = status
-                return True
-        return False
+        return self.inventory.set_status(node_id, status)
 
     def get_status(self):
         """
@@ -164,46 +193,32 @@ class BareMetalNodes(object):
         """
         Gets an idle node, sets the status as 1 (RUNNING) and Returns node ID.
         """
-        for item in self.nodes:
-            if item['status'] == 0:
-                item['status'] = 1      # make status RUNNING
-                return item['node_id']
-        raise exception.NotFound("No free nodes available")
+        return self.inventory.allocate(power_state.RUNNING)['node_id']
 
     def get_ip_by_id(self, id):
         """
         Returns default IP address of the given node.
         """
-        for item in self.nodes:
-            if item['node_id'] == id:
-                return item['ip_addr']
+        node = self.inventory.get(id)
+        if node is not None:
+            return node['ip_addr']
 
     def free_node(self, node_id):
         """
         Sets/frees status of the given node as 0 (IDLE).
         """
         LOG.debug(_("free_node...."))
-        for item in self.nodes:
-            if item['node_id'] == str(node_id):
-                item['status'] = 0  # make status IDLE
+        self.inventory.set_status(int(node_id), power_state.NOSTATE)
 
     def power_mgr(self, node_id, mode):
         """
         Changes power state of the given node.
 
         According to the mode (1-ON, 2-OFF, 3-REBOOT), power state can be
-        changed. /tftpboot/pdu_mgr script handles power management of
+        changed. The baremetal_power_driver handles power management of
         PDU (Power Distribution Unit).
         """
-        if node_id < 5:
-            pdu_num = 1
-            pdu_outlet_num = node_id + 5
-        else:
-            pdu_num = 2
-            pdu_outlet_num = node_id
-        path1 = "10.0.100." + str(pdu_num)
-        utils.execute('/tftpboot/pdu_mgr', path1, str(pdu_outlet_num),
-                      str(mode), '>>', 'pdu_output')
+        self.power_driver.power(node_id, mode)
 
     def deactivate_node(self, node_id):
         """
@@ -216,10 +231,8 @@ class BareMetalNodes(object):
         LOG.debug(_("deactivate_node is called for "
                     "node_id = %(id)s node_ip = %(ip)s"),
                   {'id': str(node_id), 'ip': node_ip})
-        for item in self.nodes:
-            if item['node_id'] == node_id:
-                LOG.debug(_("status of node is set to 0"))
-                item['status'] = 0
+        if self.inventory.set_status(node_id, power_state.NOSTATE):
+            LOG.debug(_("status of node is set to 0"))
         self.power_mgr(node_id, 2)
         self.sleep_mgr(5)
         path = "/tftpboot/fs_" + str(node_id)
@@ -237,15 +250,26 @@ class BareMetalNodes(object):
 
         User can access the bare-metal node using ssh.
         """
-        cmd = (FLAGS.tile_monitor +
-               " --resume --net " + node_ip + " --run - " +
-               "ifconfig xgbe0 hw ether " + mac_address +
-               " - --wait --run - ifconfig xgbe0 " + ip_address +
-               " - --wait --quit")
-        LOG.debug(_(cmd))
-        subprocess.Popen(cmd, shell=True)
-        #utils.execute(cmd, shell=True)
-        self.sleep_mgr(5)
+        self.run_monitor(node_ip,
+                         self._network_commands(mac_address, ip_address))
+
+    def _network_commands(self, mac_address, ip_address):
+        return [['ifconfig', 'xgbe0', 'hw', 'ether', mac_address],
+                ['ifconfig', 'xgbe0', ip_address]]
+
+    def run_monitor(self, node_ip, commands):
+        """
+        Runs the given commands on the node in a single tile-monitor session.
+
+        Each command is a list of arguments; the commands run one after
+        the other. Returns the (stdout, stderr) of the session, which is
+        killed after tile_monitor_timeout seconds.
+        """
+        cmd = [FLAGS.tile_monitor, '--resume', '--net', node_ip]
+        for command in commands:
+            cmd += ['--run', '-'] + command + ['-', '--wait']
+        cmd.append('--quit')
+        return process.execute(*cmd, timeout=FLAGS.tile_monitor_timeout)
 
     def iptables_set(self, node_ip, user_data):
         """
@@ -258,27 +282,62 @@ class BareMetalNodes(object):
             open_ip = base64.b64decode(user_data)
             utils.execute('/tftpboot/iptables_rule', node_ip, open_ip)
 
+    def _get_mac_by_id(self, node_id):
+        """
+        Returns the MAC address the given node boots with.
+        """
+        node = self.inventory.get(node_id)
+        if node is not None:
+            return node['mac_addr']
+
+    def is_reachable(self, node_ip, mac_addr=None):
+        """
+        Probes the given node once, without waiting.
+
+        The node is reachable when it answers a ping or, if ICMP is
+        filtered, when its MAC address shows up in the ARP table.
+        """
+        out, err = utils.trycmd('ping', '-c1', '-w1', node_ip,
+                                discard_warnings=True)
+        if not err and out.find("Unreachable") == -1:
+            return True
+        if mac_addr is None:
+            return False
+        out, err = utils.trycmd('arp', '-n', node_ip, discard_warnings=True)
+        return not err and mac_addr.lower() in out.lower()
+
+    def wait_for_activation(self, node_id, node_ip):
+        """
+        Polls the given node until it is reachable.
+
+        The interval between probes starts at tile_poll_interval and doubles
+        up to tile_poll_max_interval. Returns False if the node is still
+        unreachable after tile_boot_timeout seconds.
+        """
+        mac_addr = self._get_mac_by_id(node_id)
+        deadline = time.time() + FLAGS.tile_boot_timeout
+        interval = FLAGS.tile_poll_interval
+        while True:
+            if self.is_reachable(node_ip, mac_addr):
+                return True
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return False
+            self.sleep_mgr(min(interval, remaining))
+            interval = min(interval * 2, FLAGS.tile_poll_max_interval)
+
     def check_activated(self, node_id, node_ip):
         """
         Checks whether the given node is activated or not.
         """
         LOG.debug(_("Before ping to the bare-metal node"))
-        tile_output = "/tftpboot/tile_output_" + str(node_id)
-        grep_cmd = ("ping -c1 " + node_ip + " | grep Unreachable > " +
-                    tile_output)
-        subprocess.Popen(grep_cmd, shell=True)
-        self.sleep_mgr(5)
-
-        file = open(tile_output, "r")
-        out_msg = file.readline().find("Unreachable")
-        utils.execute('sudo', 'rm', tile_output)
-        if out_msg == -1:
+        if self.wait_for_activation(node_id, node_ip):
             LOG.debug(_("TILERA_BOARD_#%(node_id)s %(node_ip)s is ready"),
                       locals())
             return True
         else:
-            LOG.debug(_("TILERA_BOARD_#%(node_id)s %(node_ip)s is not ready,"
-                        " out_msg=%(out_msg)s"), locals())
+            LOG.debug(_("TILERA_BOARD_#%(node_id)s %(node_ip)s is not ready"),
+                      locals())
             self.power_mgr(node_id, 2)
             return False
 
@@ -295,52 +354,108 @@ class BareMetalNodes(object):
         """
         Sleeps until the node is activated.
         """
-        time.sleep(time_in_seconds)
+        greenthread.sleep(time_in_seconds)
 
     def ssh_set(self, node_ip):
         """
         Sets and Runs sshd in the node.
         """
-        cmd = (FLAGS.tile_monitor +
-               " --resume --net " + node_ip + " --run - " +
-               "/usr/sbin/sshd - --wait --quit")
-        LOG.debug(_(cmd))
-        subprocess.Popen(cmd, shell=True)
-        self.sleep_mgr(5)
+        self.run_monitor(node_ip, [['/usr/sbin/sshd']])
+
+    def configure_node(self, node_ip, mac_address, ip_address):
+        """
+        Sets network configuration and runs sshd in one tile-monitor session.
+        """
+        self.run_monitor(node_ip,
+                         self._network_commands(mac_address, ip_address) +
+                         [['/usr/sbin/sshd']])
 
     def activate_node(self, node_id, node_ip, name, mac_address,
                       ip_address, user_data):
         """
         Activates the given node using ID, IP, and MAC address.
+
+        At most tile_activation_concurrency nodes are activated at once.
+        The time spent in each stage is kept in activation_timings.
         """
         LOG.debug(_("activate_node"))
 
-        self.power_mgr(node_id, 2)
-        self.power_mgr(node_id, 3)
-        self.sleep_mgr(100)
+        with self._activation_slots:
+            timings = {}
+            self.activation_timings[node_id] = timings
+            start = time.time()
+            stage_start = [start]
 
-        try:
-            self.check_activated(node_id, node_ip)
-            self.network_set(node_ip, mac_address, ip_address)
-            self.ssh_set(node_ip)
-            self.iptables_set(node_ip, user_data)
-            return power_state.RUNNING
-        except Exception as ex:
-            self.deactivate_node(node_id)
-            raise exception.NovaException(_("Node is unknown error state."))
+            def _stage_done(stage):
+                now = time.time()
+                timings[stage] = now - stage_start[0]
+                stage_start[0] = now
+
+            self.power_mgr(node_id, 2)
+            self.power_mgr(node_id, 3)
+            _stage_done('power_cycle')
+
+            try:
+                if not self.check_activated(node_id, node_ip):
+                    raise exception.NovaException(
+                            _("Node %s did not boot in time") % node_id)
+                _stage_done('boot')
+                self.configure_node(node_ip, mac_address, ip_address)
+                _stage_done('configure')
+                self.iptables_set(node_ip, user_data)
+                _stage_done('iptables')
+                timings['total'] = time.time() - start
+                LOG.info(_("TILERA_BOARD_#%(node_id)s activated: "
+                           "%(timings)s"), locals())
+                return power_state.RUNNING
+            except Exception as ex:
+                timings['total'] = time.time() - start
+                LOG.debug(_("TILERA_BOARD_#%(node_id)s failed to activate: "
+                            "%(timings)s"), locals())
+                self.deactivate_node(node_id)
+                raise exception.NovaException(
+                        _("Node is unknown error state."))
+
+    def activate_nodes(self, requests):
+        """
+        Activates several nodes at once on greenthreads.
+
+        requests is a list of dicts holding the activate_node arguments.
+        Returns a dict mapping node_id to the resulting power state;
+        nodes that failed to activate are mapped to FAILED.
+        """
+        def _activate(req):
+            try:
+                return req['node_id'], self.activate_node(
+                        req['node_id'], req['node_ip'], req['name'],
+                        req['mac_address'], req['ip_address'],
+                        req.get('user_data', ''))
+            except Exception:
+                LOG.exception(_("Failed to activate node %s"),
+                              req['node_id'])
+                return req['node_id'], power_state.FAILED
+
+        pool = greenpool.GreenPool(FLAGS.tile_activation_concurrency)
+        return dict(pool.imap(_activate, requests))
+
+    def get_activation_timings(self, node_id):
+        """
+        Returns the per-stage timings (in seconds) of the last activation.
+        """
+        return self.activation_timings.get(node_id, {})
 
     def get_console_output(self, console_log, node_id):
         """
         Gets console output of the given node.
+
+        The output not seen yet is appended to the console ring log kept
+        at console_log.
         """
         node_ip = self.get_ip_by_id(node_id)
-        log_path = "/tftpboot/log_" + str(node_id)
-        kmsg_cmd = (FLAGS.tile_monitor +
-                    " --resume --net " + node_ip +
-                    " -- dmesg > " + log_path)
-        subprocess.Popen(kmsg_cmd, shell=True)
-        self.sleep_mgr(5)
-        utils.execute('cp', log_path, console_log)
+        out, _err = process.execute(FLAGS.tile_monitor, '--resume',
+                                    '--net', node_ip, '--', 'dmesg',
+                                    timeout=FLAGS.tile_monitor_timeout)
+        console.get_console_log(console_log).update(out)
 
     def get_image(self, bp):
         """
@@ -350,7 +465,8 @@ class BareMetalNodes(object):
         """
         path_fs = "/tftpboot/tilera_fs"
         path_root = bp + "/root"
-        utils.execute('cp', path_fs, path_root)
+        utils.execute('cp', '--reflink=auto', '--sparse=always',
+                      path_fs, path_root)
 
     def set_image(self, bpath, node_id):
         """
@@ -359,6 +475,8 @@ class BareMetalNodes(object):
         This should be done after ssh key is injected.
         /tftpboot/fs_x directory is a NFS of node#x.
         /tftpboot/root_x file is an file system image of node#x.
+        The image is moved rather than copied, so it costs no I/O when
+        the instance path and /tftpboot are on the same filesystem.
         """
         path1 = bpath + "/root"
         pathx = "/tftpboot/root_" + str(node_id)
@@ -146,7 +146,8 @@ class ImageCacheManager(object):
         self.image_popularity = {}
         self.instance_names = {}
 
-        instances = db.instance_get_all(context)
+        instances = db.instance_get_all(context,
+                columns=['id', 'uuid', 'host', 'image_ref'])
         for instance in instances:
             self.instance_names[instance['name']] = instance['uuid']
 
@@ -0,0 +1,310 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2011 University of Southern California
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""baremetal_benchmark.py - Time the bare-metal driver's hot paths.
+
+The benchmarks run ProxyConnection and BareMetalDom against the fake
+bare-metal nodes, so no hardware or /tftpboot is needed.
+
+    tools/baremetal_benchmark.py list --sizes 10,100,1000,5000
+    tools/baremetal_benchmark.py power --sizes 10,100,1000 --latency 0.5
+    tools/baremetal_benchmark.py provision --sizes 10,1000,10000 \\
+        --power-latency 0.01 --boot-latency 0.1 --concurrency 50
+
+The provision benchmark spawns an instance on every node of a simulated
+inventory, reboots and lists them, then destroys them all. The database
+and image preparation are replaced by no-ops, so only the driver is
+timed.
+"""
+
+import collections
+import gettext
+import optparse
+import os
+import sys
+import time
+
+from eventlet import greenpool
+
+POSSIBLE_TOPDIR = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                   os.pardir,
+                                   os.pardir))
+if os.path.exists(os.path.join(POSSIBLE_TOPDIR, 'nova', '__init__.py')):
+    sys.path.insert(0, POSSIBLE_TOPDIR)
+
+gettext.install('nova', unicode=1)
+
+from nova.compute import power_state
+from nova import flags
+from nova import utils
+from nova.virt.baremetal import dom
+from nova.virt.baremetal import fake
+from nova.virt.baremetal import power
+from nova.virt.baremetal import proxy
+
+FLAGS = flags.FLAGS
+flags.DECLARE('instances_path', 'nova.compute.manager')
+dummy = ["fakearg"]
+utils.default_flagfile(args=dummy)
+FLAGS(dummy)
+
+
+def _reset_dom(dom_file):
+    """Drops the BareMetalDom singleton and starts from an empty file."""
+    dom.BareMetalDom._instance = None
+    dom.BareMetalDom._is_init = False
+    dom.write_domains(dom_file, [])
+    return dom.BareMetalDom(fake_dom_file=dom_file)
+
+
+def _fake_domain(i):
+    return {'node_id': i,
+            'name': 'instance-%08x' % i,
+            'memory_kb': 16777216,
+            'vcpus': 1,
+            'mac_address': '02:16:3e:01:4e:c9',
+            'user_data': '',
+            'ip_address': '10.5.1.2',
+            'image_id': '1552326678',
+            'kernel_id': '1896115634',
+            'ramdisk_id': '',
+            'status': power_state.RUNNING}
+
+
+def bench_list(conn, dom_file, sizes, repeat):
+    """Times list_instances_detail for each number of domains."""
+    print "%10s %14s %16s" % ("domains", "call (ms)", "per domain (us)")
+    for size in sizes:
+        bmdom = _reset_dom(dom_file)
+        for i in xrange(size):
+            bmdom._add_domain(_fake_domain(i))
+        start = time.time()
+        for _i in xrange(repeat):
+            conn.list_instances_detail()
+        elapsed = (time.time() - start) / repeat
+        print "%10d %14.3f %16.3f" % (size, elapsed * 1000,
+                                      elapsed * 1000000 / size)
+
+
+def bench_power(sizes, latency, outlets_per_pdu):
+    """Times a mass reboot through the fake PDUs, one node per outlet."""
+    print "%10s %14s %14s %14s" % ("nodes", "invocations", "batched (s)",
+                                   "serial (s)")
+    for size in sizes:
+        pdu_map = dict((node_id, ('pdu%d' % (node_id // outlets_per_pdu),
+                                  node_id % outlets_per_pdu))
+                       for node_id in xrange(size))
+        driver = power.FakePDUPowerDriver(pdu_map, latency)
+        pool = greenpool.GreenPool(size)
+        start = time.time()
+        for node_id in xrange(size):
+            pool.spawn_n(driver.power, node_id, power.POWER_REBOOT)
+        pool.waitall()
+        elapsed = time.time() - start
+        print "%10d %14d %14.3f %14.3f" % (size, len(driver.invocations),
+                                           elapsed, size * latency)
+
+
+class Profile(object):
+    """Sums the time spent in wrapped functions per category."""
+
+    def __init__(self):
+        self.totals = collections.defaultdict(float)
+
+    def wrap(self, category, fn):
+        def inner(*args, **kwargs):
+            start = time.time()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.totals[category] += time.time() - start
+        return inner
+
+
+class _NoDB(object):
+    """Stands in for nova.db in the driver; instance updates are dropped."""
+
+    def instance_update(self, context, instance_id, values):
+        pass
+
+
+class BenchmarkConnection(proxy.ProxyConnection):
+    """ProxyConnection without image preparation."""
+
+    def to_xml_dict(self, instance, rescue=False, network_info=None):
+        return {'name': instance['name'],
+                'memory_kb': 16777216,
+                'vcpus': 1,
+                'mac_address': '02:16:3e:01:4e:c9',
+                'user_data': '',
+                'ip_address': '10.5.1.2',
+                'image_id': '1552326678',
+                'kernel_id': '1896115634',
+                'ramdisk_id': ''}
+
+    def _create_image(self, *args, **kwargs):
+        pass
+
+
+def percentile(samples, pct):
+    """Returns the pct-th percentile of the sorted samples."""
+    if not samples:
+        return 0
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100.0))]
+
+
+def _timed_ops(pool, fn, args_list):
+    """Runs fn over args_list on pool; returns (wall time, latencies)."""
+    latencies = []
+
+    def _run(args):
+        start = time.time()
+        result = fn(*args)
+        if hasattr(result, 'wait'):
+            result.wait()
+        latencies.append(time.time() - start)
+
+    start = time.time()
+    for args in args_list:
+        pool.spawn_n(_run, args)
+    pool.waitall()
+    return time.time() - start, sorted(latencies)
+
+
+# The domain file functions before they are wrapped by bench_provision
+_DOM_IO = dict((name, getattr(dom, name))
+               for name in ('read_domains', 'write_domains',
+                            'append_domain_journal'))
+
+
+def bench_provision(dom_file, sizes, concurrency, power_latency,
+                    boot_latency):
+    """
+    Times spawn, reboot, list_instances_detail and destroy over simulated
+    inventories of each size, and the time spent in domain file I/O and in
+    node scans. Neither yields to other greenthreads, so their totals are
+    comparable to the wall time.
+    """
+    proxy.db = _NoDB()
+    print "%8s %-8s %8s %10s %9s %9s %9s %9s" % (
+            "nodes", "op", "count", "ops/min", "p50 (ms)", "p90 (ms)",
+            "p99 (ms)", "max (ms)")
+    for size in sizes:
+        profile = Profile()
+        for name, fn in _DOM_IO.iteritems():
+            setattr(dom, name, profile.wrap('domain I/O', fn))
+        nodes = fake.SimulatedBareMetalNodes(size, power_latency,
+                                             boot_latency)
+        for name in ('get_idle_node', 'free_node', 'get_ip_by_id',
+                     'set_status'):
+            setattr(nodes, name, profile.wrap('node scans',
+                                              getattr(nodes, name)))
+
+        bmdom = _reset_dom(dom_file)
+        bmdom.baremetal_nodes = nodes
+        conn = BenchmarkConnection(False)
+        conn.baremetal_nodes = nodes
+        instances = [{'id': i, 'uuid': str(i), 'name': 'instance-%08x' % i}
+                     for i in xrange(size)]
+        pool = greenpool.GreenPool(concurrency)
+        context = None
+
+        results = [
+            ('spawn', _timed_ops(pool, conn.spawn,
+                                 [(context, instance, None, None)
+                                  for instance in instances])),
+            ('reboot', _timed_ops(pool, conn.reboot,
+                                  [(instance,) for instance in instances])),
+            ('list', _timed_ops(pool, conn.list_instances_detail,
+                                [()] * concurrency)),
+            ('destroy', _timed_ops(pool, conn.destroy,
+                                   [(instance, None)
+                                    for instance in instances])),
+            ]
+        total = 0
+        for op, (elapsed, latencies) in results:
+            total += elapsed
+            print "%8d %-8s %8d %10.0f %9.2f %9.2f %9.2f %9.2f" % (
+                    size, op, len(latencies),
+                    len(latencies) * 60 / max(elapsed, 1e-9),
+                    percentile(latencies, 50) * 1000,
+                    percentile(latencies, 90) * 1000,
+                    percentile(latencies, 99) * 1000,
+                    latencies[-1] * 1000 if latencies else 0)
+        print "%8d wall %.3fs; %s" % (
+                size, total,
+                ", ".join("%s %.3fs (%.1f%%)" % (
+                                category, profile.totals[category],
+                                profile.totals[category] * 100 / total)
+                          for category in ('domain I/O', 'node scans')))
+        if nodes.inventory.count(power_state.RUNNING) or bmdom.domains:
+            print "%8d WARNING: %d domains left behind" % (
+                    size, len(bmdom.domains))
+
+
+COMMANDS = {'list': "10,100,1000,5000",
+            'power': "10,100,1000,5000",
+            'provision': "10,100,1000,10000"}
+
+
+def parse_options():
+    parser = optparse.OptionParser("%prog [options] " +
+                                   "|".join(sorted(COMMANDS)))
+    parser.add_option("--sizes",
+                      help="comma separated numbers of domains or nodes")
+    parser.add_option("--repeat", type="int", default=10,
+                      help="number of timed calls per size")
+    parser.add_option("--latency", type="float", default=0.5,
+                      help="seconds each fake PDU invocation takes")
+    parser.add_option("--outlets-per-pdu", type="int", default=24,
+                      help="number of outlets of each fake PDU")
+    parser.add_option("--concurrency", type="int", default=10,
+                      help="number of concurrent provisioning operations")
+    parser.add_option("--power-latency", type="float", default=0,
+                      help="seconds each simulated power operation takes")
+    parser.add_option("--boot-latency", type="float", default=0,
+                      help="seconds a simulated node takes to boot")
+    options, args = parser.parse_args()
+    if len(args) != 1 or args[0] not in COMMANDS:
+        parser.print_usage()
+        sys.exit(1)
+    if options.sizes is None:
+        options.sizes = COMMANDS[args[0]]
+    return options, args
+
+
+def main():
+    options, args = parse_options()
+    sizes = [int(size) for size in options.sizes.split(",")]
+    if args[0] == "power":
+        bench_power(sizes, options.latency, options.outlets_per_pdu)
+        return
+
+    FLAGS.set_override('baremetal_driver', 'fake')
+    with utils.tempdir() as tmpdir:
+        dom_file = os.path.join(tmpdir, 'fake_dom_file')
+        if args[0] == "provision":
+            FLAGS.set_override('instances_path', tmpdir)
+            bench_provision(dom_file, sizes, options.concurrency,
+                            options.power_latency, options.boot_latency)
+            return
+        conn = proxy.get_connection(False)
+        bench_list(conn, dom_file, sizes, options.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2012 OpenStack, LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""db_columns_benchmark.py - Cost of the instance reads of periodic tasks.
+
+Creates instances spread over compute hosts in a sqlite database and
+times the instance reads of the periodic tasks, reading whole instances
+and only the columns each task uses:
+
+    sync_power_states   instance_get_all_by_host() of one compute node
+    host_states         instance_get_all() of the scheduler host states
+    image_cache         instance_get_all() of the libvirt image cache
+
+For each read it reports the time it took and the objects and memory
+held by the instances it returned.
+
+    tools/db_columns_benchmark.py --instances 2000 --hosts 20
+"""
+
+import gc
+import gettext
+import optparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+POSSIBLE_TOPDIR = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                   os.pardir,
+                                   os.pardir))
+if os.path.exists(os.path.join(POSSIBLE_TOPDIR, 'nova', '__init__.py')):
+    sys.path.insert(0, POSSIBLE_TOPDIR)
+
+gettext.install('nova', unicode=1)
+
+from nova import context
+from nova import db
+from nova.db import migration
+from nova import flags
+from nova.scheduler import host_manager
+from nova import utils
+
+FLAGS = flags.FLAGS
+dummy = ["fakearg"]
+utils.default_flagfile(args=dummy)
+FLAGS(dummy)
+
+READS = [
+    ('sync_power_states',
+     lambda ctxt, columns: db.instance_get_all_by_host(ctxt, 'host-0',
+                                                       columns=columns),
+     ['id', 'uuid', 'power_state', 'vm_state']),
+    ('host_states',
+     lambda ctxt, columns: db.instance_get_all(ctxt, columns=columns),
+     host_manager.INSTANCE_USAGE_COLUMNS),
+    ('image_cache',
+     lambda ctxt, columns: db.instance_get_all(ctxt, columns=columns),
+     ['id', 'uuid', 'host', 'image_ref']),
+    ]
+
+
+def create_instances(ctxt, num_instances, num_hosts):
+    migration.db_sync()
+    group = db.security_group_create(ctxt, {'name': 'default',
+                                            'project_id': 'bench-project'})
+    for i in xrange(num_instances):
+        instance = db.instance_create(ctxt, {
+                'host': 'host-%d' % (i % num_hosts),
+                'project_id': 'bench-project',
+                'image_ref': 'image-%d' % (i % 10),
+                'memory_mb': 2048,
+                'root_gb': 20,
+                'vcpus': 2,
+                'vm_state': 'active',
+                'metadata': {'role': 'web'}})
+        db.instance_add_security_group(ctxt, instance['uuid'], group['id'])
+
+
+def measure(read, ctxt, columns, repeat):
+    """Returns the seconds, new objects and bytes of one read."""
+    elapsed = 0
+    for _i in xrange(repeat):
+        start = time.time()
+        read(ctxt, columns)
+        elapsed += time.time() - start
+
+    gc.collect()
+    before = set(id(obj) for obj in gc.get_objects())
+    before.add(id(before))
+    instances = read(ctxt, columns)
+    gc.collect()
+    new_objects = [obj for obj in gc.get_objects()
+                   if id(obj) not in before]
+    num_bytes = sum(sys.getsizeof(obj) for obj in new_objects)
+    del instances
+    return elapsed / repeat, len(new_objects), num_bytes
+
+
+def bench(num_instances, num_hosts, repeat):
+    workdir = tempfile.mkdtemp(prefix='db-columns-bench-')
+    FLAGS.set_override('sql_connection',
+                       'sqlite:///%s' % os.path.join(workdir, 'bench.sqlite'))
+    try:
+        ctxt = context.get_admin_context()
+        create_instances(ctxt, num_instances, num_hosts)
+
+        print "%d instances on %d hosts" % (num_instances, num_hosts)
+        print "%-18s %-8s %10s %10s %10s" % ("read", "columns", "time (ms)",
+                                             "objects", "KB")
+        for name, read, columns in READS:
+            for label, read_columns in (('all', None), ('some', columns)):
+                seconds, num_objects, num_bytes = measure(read, ctxt,
+                                                          read_columns,
+                                                          repeat)
+                print "%-18s %-8s %10.1f %10d %10d" % (name, label,
+                                                       seconds * 1000,
+                                                       num_objects,
+                                                       num_bytes / 1024)
+    finally:
+        shutil.rmtree(workdir)
+
+
+def parse_options():
+    parser = optparse.OptionParser("%prog [options]")
+    parser.add_option("--instances", type="int", default=2000,
+                      help="number of instances")
+    parser.add_option("--hosts", type="int", default=20,
+                      help="number of compute hosts they are spread over")
+    parser.add_option("--repeat", type="int", default=3,
+                      help="number of timed reads of each kind")
+    options, args = parser.parse_args()
+    if args or options.hosts < 1 or options.repeat < 1:
+        parser.print_usage()
+        sys.exit(1)
+    return options
+
+
+def main():
+    options = parse_options()
+    bench(options.instances, options.hosts, options.repeat)
+
+
+if __name__ == "__main__":
+    main()
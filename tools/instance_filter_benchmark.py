@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2012 OpenStack, LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""instance_filter_benchmark.py - Count the instances loaded per search.
+
+Creates a project with many instances in a sqlite database and runs
+instance_get_all_by_filters() with the filters of GET /servers searches,
+reporting for each search the instances returned, the instance rows
+loaded from the database and the time it took. All the instances of the
+project used to be loaded for any name or metadata filter.
+
+    tools/instance_filter_benchmark.py --instances 5000
+
+Name prefixes and metadata are matched by the database; sqlite matches
+other regexps in Python, MySQL and PostgreSQL with their regexp operator.
+"""
+
+import gettext
+import optparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+POSSIBLE_TOPDIR = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                   os.pardir,
+                                   os.pardir))
+if os.path.exists(os.path.join(POSSIBLE_TOPDIR, 'nova', '__init__.py')):
+    sys.path.insert(0, POSSIBLE_TOPDIR)
+
+gettext.install('nova', unicode=1)
+
+from sqlalchemy import event
+
+from nova import context
+from nova import db
+from nova.db import migration
+from nova.db.sqlalchemy import models
+from nova import flags
+from nova import utils
+
+FLAGS = flags.FLAGS
+dummy = ["fakearg"]
+utils.default_flagfile(args=dummy)
+FLAGS(dummy)
+
+PROJECT_ID = 'bench-project'
+
+SEARCHES = [
+    ('name=server-00042', {'display_name': 'server-00042'}),
+    ('name=server-000', {'display_name': 'server-000'}),
+    ('name=server-0004[0-9]', {'display_name': 'server-0004[0-9]'}),
+    ('metadata role=db', {'metadata': {'role': 'db'}}),
+    ('name=server-001 + role=web', {'display_name': 'server-001',
+                                    'metadata': {'role': 'web'}}),
+    ]
+
+
+class LoadCounter(object):
+    """Counts the instances loaded from the database."""
+
+    def __init__(self):
+        self.count = 0
+        event.listen(models.Instance, 'load', self._load)
+
+    def _load(self, *_args):
+        self.count += 1
+
+
+def create_instances(ctxt, num_instances):
+    migration.db_sync()
+    roles = ['web', 'web', 'web', 'app', 'db']
+    for i in xrange(num_instances):
+        db.instance_create(ctxt, {'display_name': 'server-%05d' % i,
+                                  'project_id': PROJECT_ID,
+                                  'metadata': {'role': roles[i % len(roles)]},
+                                  'vm_state': 'active'})
+
+
+def bench(num_instances, repeat):
+    workdir = tempfile.mkdtemp(prefix='instance-filter-bench-')
+    FLAGS.set_override('sql_connection',
+                       'sqlite:///%s' % os.path.join(workdir, 'bench.sqlite'))
+    try:
+        ctxt = context.RequestContext('bench-user', PROJECT_ID)
+        create_instances(ctxt.elevated(), num_instances)
+        loads = LoadCounter()
+
+        print "%d instances in the project" % num_instances
+        print "%-28s %9s %9s %10s" % ("search", "returned", "loaded",
+                                      "time (ms)")
+        for name, filters in SEARCHES:
+            elapsed = 0
+            loads.count = 0
+            for _i in xrange(repeat):
+                start = time.time()
+                instances = db.instance_get_all_by_filters(ctxt, filters,
+                                                           'created_at',
+                                                           'desc')
+                elapsed += time.time() - start
+            print "%-28s %9d %9d %10.1f" % (name, len(instances),
+                                            loads.count / repeat,
+                                            elapsed * 1000 / repeat)
+    finally:
+        shutil.rmtree(workdir)
+
+
+def parse_options():
+    parser = optparse.OptionParser("%prog [options]")
+    parser.add_option("--instances", type="int", default=5000,
+                      help="number of instances in the project")
+    parser.add_option("--repeat", type="int", default=3,
+                      help="number of timed searches of each kind")
+    options, args = parser.parse_args()
+    if args or options.repeat < 1:
+        parser.print_usage()
+        sys.exit(1)
+    return options
+
+
+def main():
+    options = parse_options()
+    bench(options.instances, options.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2012 OpenStack, LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""scheduler_benchmark.py - Time the FilterScheduler's host selection.
+
+Runs FilterScheduler._schedule() over synthetic compute host states with
+the per-host filter_hosts()/weighted_sum() path, with batch placement
+and with the vectorized engine (which needs numpy), and checks they all
+pick the same hosts.
+
+    tools/scheduler_benchmark.py filter --sizes 1000,10000,50000 \\
+        --instances 1,10,100
+
+No database or message queue is used.
+"""
+
+import datetime
+import gettext
+import optparse
+import os
+import sys
+import time
+
+POSSIBLE_TOPDIR = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                   os.pardir,
+                                   os.pardir))
+if os.path.exists(os.path.join(POSSIBLE_TOPDIR, 'nova', '__init__.py')):
+    sys.path.insert(0, POSSIBLE_TOPDIR)
+
+gettext.install('nova', unicode=1)
+
+from nova import context
+from nova import flags
+from nova.scheduler import filter_scheduler
+from nova.scheduler import host_manager
+from nova.scheduler import vectorized
+from nova import utils
+
+FLAGS = flags.FLAGS
+dummy = ["fakearg"]
+utils.default_flagfile(args=dummy)
+FLAGS(dummy)
+
+
+def _host_states(size):
+    """Returns size compute host states, a few of them disabled or down."""
+    now = utils.utcnow()
+    down = now - datetime.timedelta(hours=1)
+    host_states = {}
+    for i in xrange(size):
+        host = 'host%06d' % i
+        service = {'host': host,
+                   'disabled': i % 101 == 7,
+                   'updated_at': down if i % 53 == 3 else now,
+                   'created_at': now,
+                   'availability_zone': 'nova'}
+        host_state = host_manager.HostState(host, 'compute',
+                capabilities={'compute': {'enabled': True}},
+                service=service)
+        host_state.update_from_compute_node(
+                dict(local_gb=500 + i % 1500,
+                     memory_mb=8192 + (i * 7919) % 65536,
+                     vcpus=8 + i % 24))
+        host_states[host] = host_state
+    return host_states
+
+
+def _request_spec(num_instances):
+    return {'num_instances': num_instances,
+            'instance_type': {'memory_mb': 2048, 'root_gb': 20,
+                              'ephemeral_gb': 0, 'vcpus': 2},
+            'instance_properties': {'project_id': 1,
+                                    'memory_mb': 2048,
+                                    'root_gb': 20,
+                                    'ephemeral_gb': 0,
+                                    'vcpus': 2}}
+
+
+def _time_schedule(sched, size, num_instances, repeat):
+    """Returns the average seconds of a _schedule() call and the hosts
+    it picked."""
+    ctxt = context.get_admin_context()
+    elapsed = 0
+    for _i in xrange(repeat):
+        # NOTE: _schedule() consumes from the host states
+        host_states = _host_states(size)
+        sched.host_manager.get_all_host_states = (
+                lambda context, topic: host_states)
+        start = time.time()
+        weighted_hosts = sched._schedule(ctxt, 'compute',
+                                         _request_spec(num_instances),
+                                         filter_properties={})
+        elapsed += time.time() - start
+    return elapsed / repeat, [w.host_state.host for w in weighted_hosts]
+
+
+def bench_filter(sizes, instances, repeat):
+    """Times _schedule() with each engine for each number of hosts and
+    of instances requested."""
+    if not vectorized.is_available():
+        print "numpy could not be imported"
+        sys.exit(1)
+    FLAGS.set_override('scheduler_default_filters',
+                       ['AvailabilityZoneFilter', 'RamFilter', 'CoreFilter',
+                        'ComputeFilter'])
+    sched = filter_scheduler.FilterScheduler()
+    sched.host_manager = host_manager.HostManager()
+    print "%8s %10s %14s %14s %16s" % ("hosts", "instances", "per-host (ms)",
+                                       "batch (ms)", "vectorized (ms)")
+    for size in sizes:
+        for num_instances in instances:
+            timings = []
+            expected = None
+            for batch, vector in ((False, False), (True, False),
+                                  (False, True)):
+                FLAGS.set_override('scheduler_batch_placement', batch)
+                FLAGS.set_override('scheduler_vectorized_engine', vector)
+                elapsed, result = _time_schedule(sched, size, num_instances,
+                                                 repeat)
+                timings.append(elapsed * 1000)
+                if expected is None:
+                    expected = result
+                elif result != expected:
+                    print "%8d WARNING: the engines picked different " \
+                          "hosts" % size
+            print "%8d %10d %14.1f %14.1f %16.1f" % tuple(
+                    [size, num_instances] + timings)
+
+
+def parse_options():
+    parser = optparse.OptionParser("%prog [options] filter")
+    parser.add_option("--sizes", default="1000,10000,50000",
+                      help="comma separated numbers of hosts")
+    parser.add_option("--instances", default="1,10,100",
+                      help="comma separated numbers of instances requested")
+    parser.add_option("--repeat", type="int", default=3,
+                      help="number of timed calls per size")
+    options, args = parser.parse_args()
+    if args != ["filter"]:
+        parser.print_usage()
+        sys.exit(1)
+    return options, args
+
+
+def main():
+    options, _args = parse_options()
+    bench_filter([int(size) for size in options.sizes.split(",")],
+                 [int(num) for num in options.instances.split(",")],
+                 options.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,475 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2012 OpenStack, LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""scheduler_simulator.py - Replay a request trace against the schedulers.
+
+Builds a synthetic fleet of compute hosts in a sqlite database, then
+replays a trace of run/resize/delete requests against each scheduler
+driver, feeding it update_service_capabilities() reports and the
+update_instance_usage() events compute nodes send as it goes. The fake
+compute nodes (on the fake RPC backend) apply the resizes they are cast.
+
+    tools/scheduler_simulator.py --hosts 200 --requests 2000 \\
+        --drivers filter,simple,chance --save-trace /tmp/trace.json
+
+Each driver starts from the same fleet and replays the same trace. For
+each one it reports the scheduling decisions (instances placed or
+resized) per second of scheduler time, the p50/p99 latency of a request,
+the database queries per decision and the placement quality at the end
+of the trace: the fill ratio is the share of the RAM of the used hosts
+taken by instances, the fragmentation is the share of the free RAM left
+on hosts too small for the largest flavor requested.
+
+A trace is a file of JSON lines:
+
+    {"op": "run", "id": 7, "flavor": "m1.small", "num_instances": 2}
+    {"op": "resize", "id": 7, "flavor": "m1.large"}
+    {"op": "delete", "id": 7}
+
+where resize and delete apply to the instances of the run with that id.
+"""
+
+import gettext
+import json
+import optparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+POSSIBLE_TOPDIR = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                   os.pardir,
+                                   os.pardir))
+if os.path.exists(os.path.join(POSSIBLE_TOPDIR, 'nova', '__init__.py')):
+    sys.path.insert(0, POSSIBLE_TOPDIR)
+
+gettext.install('nova', unicode=1)
+
+from sqlalchemy import event
+
+from nova.compute import instance_types
+from nova import context
+from nova import db
+from nova.db import migration
+from nova.db.sqlalchemy import session
+from nova import exception
+from nova import flags
+from nova import rpc
+from nova import utils
+
+FLAGS = flags.FLAGS
+dummy = ["fakearg"]
+utils.default_flagfile(args=dummy)
+FLAGS(dummy)
+flags.DECLARE('ram_allocation_ratio', 'nova.scheduler.filters.ram_filter')
+
+DRIVERS = {
+    'filter': 'nova.scheduler.filter_scheduler.FilterScheduler',
+    'simple': 'nova.scheduler.simple.SimpleScheduler',
+    'chance': 'nova.scheduler.chance.ChanceScheduler',
+    }
+
+# (memory_mb, vcpus, local_gb) of the host classes of the fleet
+HOST_CLASSES = [(16384, 8, 500), (32768, 16, 1000), (65536, 32, 2000)]
+
+# Flavors requested by generated traces, with their relative frequency
+FLAVORS = [('m1.tiny', 3), ('m1.small', 5), ('m1.medium', 3),
+           ('m1.large', 2), ('m1.xlarge', 1)]
+
+PROJECT_ID = 'sim-project'
+USER_ID = 'sim-user'
+IMAGE = {'id': 'sim-image', 'properties': {}}
+
+
+class QueryCounter(object):
+    """Counts the statements run on the database engine while active."""
+
+    def __init__(self):
+        self.active = False
+        self.count = 0
+        event.listen(session.get_engine(), 'before_cursor_execute',
+                     self._before_cursor_execute)
+
+    def _before_cursor_execute(self, *_args):
+        if self.active:
+            self.count += 1
+
+
+class FakeComputeNode(object):
+    """Records the casts a compute node gets, for the simulator to apply
+    once the scheduler is done with the request."""
+
+    def __init__(self, host, casts):
+        self.host = host
+        self.casts = casts
+
+    def run_instance(self, context, **kwargs):
+        pass
+
+    def prep_resize(self, context, instance_uuid, instance_type_id,
+                    **_kwargs):
+        self.casts.append((self.host, instance_uuid, instance_type_id))
+
+
+def generate_trace(num_requests, seed, delete_ratio, resize_ratio):
+    """Returns num_requests run, resize and delete requests."""
+    rand = random.Random(seed)
+    flavors = []
+    for name, weight in FLAVORS:
+        flavors.extend([name] * weight)
+    live = []
+    trace = []
+    for request_id in xrange(num_requests):
+        pick = rand.random()
+        if live and pick < delete_ratio:
+            run_id = live.pop(rand.randrange(len(live)))
+            trace.append({'op': 'delete', 'id': run_id})
+        elif live and pick < delete_ratio + resize_ratio:
+            trace.append({'op': 'resize', 'id': rand.choice(live),
+                          'flavor': rand.choice(flavors)})
+        else:
+            num_instances = rand.random() < 0.9 and 1 or rand.randint(2, 5)
+            trace.append({'op': 'run', 'id': request_id,
+                          'flavor': rand.choice(flavors),
+                          'num_instances': num_instances})
+            live.append(request_id)
+    return trace
+
+
+def load_trace(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def save_trace(trace, path):
+    with open(path, 'w') as f:
+        for request in trace:
+            f.write('%s\n' % json.dumps(request, sort_keys=True))
+
+
+def build_fleet(ctxt, num_hosts):
+    """Creates the compute services and nodes of the fleet, and returns
+    { host : capabilities } of their reports."""
+    migration.db_sync()
+    db.security_group_create(ctxt, {'name': 'default',
+                                    'description': 'default',
+                                    'user_id': USER_ID,
+                                    'project_id': PROJECT_ID})
+    capabilities = {}
+    for i in xrange(num_hosts):
+        host = 'host%05d' % i
+        memory_mb, vcpus, local_gb = HOST_CLASSES[i % len(HOST_CLASSES)]
+        service = db.service_create(ctxt, {'host': host,
+                                           'binary': 'nova-compute',
+                                           'topic': 'compute',
+                                           'report_count': 0,
+                                           'availability_zone': 'nova'})
+        db.compute_node_create(ctxt, {'service_id': service['id'],
+                                      'vcpus': vcpus,
+                                      'memory_mb': memory_mb,
+                                      'local_gb': local_gb,
+                                      'vcpus_used': 0,
+                                      'memory_mb_used': 0,
+                                      'local_gb_used': 0,
+                                      'hypervisor_type': 'fake',
+                                      'hypervisor_version': 1,
+                                      'cpu_info': ''})
+        capabilities[host] = {'enabled': True,
+                              'host_memory_total': memory_mb,
+                              'disk_total': local_gb,
+                              'vcpus': vcpus}
+    return capabilities
+
+
+def _usage(instance):
+    return dict((key, instance[key])
+                for key in ('memory_mb', 'root_gb', 'ephemeral_gb', 'vcpus'))
+
+
+def _percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[int(round((len(values) - 1) * fraction))]
+
+
+class Simulation(object):
+    """Replays a trace against a scheduler driver."""
+
+    def __init__(self, driver_name, capabilities, report_interval,
+                 queries):
+        self.driver = utils.import_object(DRIVERS[driver_name])
+        self.capabilities = capabilities
+        self.report_interval = report_interval
+        self.ctxt = context.RequestContext(USER_ID, PROJECT_ID,
+                                           is_admin=True)
+        self.queries = queries
+        self.casts = []
+        self.connection = rpc.create_connection()
+        for host in capabilities:
+            self.connection.create_consumer(
+                    db.queue_get_for(self.ctxt, 'compute', host),
+                    FakeComputeNode(host, self.casts))
+        self.instances = {}  # { run id : [instance id, ...] }
+        self.latencies = []
+        self.decisions = 0
+        self.failures = 0
+        self.scheduler_seconds = 0.0
+        self.scheduler_queries = 0
+
+    def close(self):
+        self.connection.close()
+
+    def report_capabilities(self):
+        now = utils.utcnow()
+        for host, capabilities in self.capabilities.iteritems():
+            capabilities = dict(capabilities, timestamp=now)
+            self.driver.update_service_capabilities('compute', host,
+                                                    capabilities)
+
+    def _time(self, fn, *args, **kwargs):
+        """Calls the scheduler, counting its time and queries."""
+        self.queries.count = 0
+        self.queries.active = True
+        start = time.time()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            elapsed = time.time() - start
+            self.queries.active = False
+            self.scheduler_seconds += elapsed
+            self.scheduler_queries += self.queries.count
+            self.latencies.append(elapsed)
+
+    def run(self, trace):
+        self.report_capabilities()
+        for num, request in enumerate(trace):
+            if num and num % self.report_interval == 0:
+                self.report_capabilities()
+            getattr(self, '_%s' % request['op'])(request)
+
+    def _run(self, request):
+        instance_type = instance_types.get_instance_type_by_name(
+                request['flavor'])
+        num_instances = request['num_instances']
+        request_spec = {
+            'num_instances': num_instances,
+            'image': IMAGE,
+            'instance_type': instance_type,
+            'security_group': 'default',
+            'block_device_mapping': [],
+            'instance_properties': {
+                'reservation_id': utils.generate_uid('r'),
+                'image_ref': IMAGE['id'],
+                'user_id': USER_ID,
+                'project_id': PROJECT_ID,
+                'instance_type_id': instance_type['id'],
+                'memory_mb': instance_type['memory_mb'],
+                'vcpus': instance_type['vcpus'],
+                'root_gb': instance_type['root_gb'],
+                'ephemeral_gb': instance_type['ephemeral_gb'],
+                'availability_zone': None}}
+        try:
+            instances = self._time(self.driver.schedule_run_instance,
+                                   self.ctxt, request_spec,
+                                   filter_properties={})
+        except exception.NoValidHost:
+            self.failures += num_instances
+            return
+        self.failures += num_instances - len(instances)
+        self.decisions += len(instances)
+        self.instances[request['id']] = [instance['id']
+                                         for instance in instances]
+
+    def _resize(self, request):
+        instance_type = instance_types.get_instance_type_by_name(
+                request['flavor'])
+        for instance_id in self.instances.get(request['id'], []):
+            instance = db.instance_get(self.ctxt, instance_id)
+            if instance['instance_type_id'] == instance_type['id']:
+                continue
+            instance_uuid = instance['uuid']
+            instance_properties = dict(_usage(instance),
+                                       uuid=instance_uuid,
+                                       host=instance['host'],
+                                       project_id=PROJECT_ID,
+                                       availability_zone=None)
+            request_spec = {'num_instances': 1,
+                            'instance_type': instance_type,
+                            'instance_properties': instance_properties}
+            filter_properties = {'ignore_hosts': [instance['host']]}
+            try:
+                self._time(self.driver.schedule_prep_resize, self.ctxt,
+                           request_spec, filter_properties=filter_properties,
+                           instance_uuid=instance_uuid,
+                           instance_type_id=instance_type['id'],
+                           update_db=False)
+            except exception.NoValidHost:
+                self.failures += 1
+                continue
+            self.decisions += 1
+            self._apply_resizes(instance_properties)
+
+    def _apply_resizes(self, old_usage):
+        """Moves the instances the compute nodes were cast prep_resize
+        for, sending the usage events they would."""
+        while self.casts:
+            host, instance_uuid, instance_type_id = self.casts.pop(0)
+            instance = db.instance_get_by_uuid(self.ctxt, instance_uuid)
+            instance_type = instance_types.get_instance_type(
+                    instance_type_id)
+            new_usage = _usage(instance_type)
+            db.instance_update(self.ctxt, instance_uuid,
+                               dict(new_usage, host=host,
+                                    instance_type_id=instance_type_id))
+            # The scheduler consumed the old size on the new host
+            self.driver.update_instance_usage(instance['host'], 'delete',
+                                              _usage(old_usage))
+            self.driver.update_instance_usage(host, 'delete',
+                                              _usage(old_usage))
+            self.driver.update_instance_usage(host, 'create', new_usage)
+
+    def _delete(self, request):
+        for instance_id in self.instances.pop(request['id'], []):
+            instance = db.instance_get(self.ctxt, instance_id)
+            db.instance_destroy(self.ctxt, instance_id)
+            self.driver.update_instance_usage(instance['host'], 'delete',
+                                              _usage(instance))
+
+    def placement(self, reference_memory_mb):
+        """Returns the fill ratio, the fragmentation, the number of hosts
+        used and of hosts with more RAM taken than allowed."""
+        used = {}
+        for instance in db.instance_get_all(self.ctxt):
+            if instance['host']:
+                used[instance['host']] = (used.get(instance['host'], 0) +
+                                          instance['memory_mb'])
+        used_total = used_capacity = free_total = stranded = 0
+        overcommitted = 0
+        for compute in db.compute_node_get_all(self.ctxt):
+            host = compute['service']['host']
+            memory_mb = compute['memory_mb']
+            host_used = used.get(host, 0)
+            if host_used:
+                used_total += host_used
+                used_capacity += memory_mb
+            if host_used > memory_mb * FLAGS.ram_allocation_ratio:
+                overcommitted += 1
+            free = max(memory_mb - host_used, 0)
+            free_total += free
+            if free < reference_memory_mb:
+                stranded += free
+        fill = used_capacity and float(used_total) / used_capacity or 0.0
+        fragmentation = free_total and float(stranded) / free_total or 0.0
+        return fill, fragmentation, len(used), overcommitted
+
+
+def simulate(options, trace):
+    ctxt = context.get_admin_context()
+    workdir = tempfile.mkdtemp(prefix='scheduler-sim-')
+    db_path = os.path.join(workdir, 'sim.sqlite')
+    clean_path = os.path.join(workdir, 'clean.sqlite')
+    FLAGS.set_override('sql_connection', 'sqlite:///%s' % db_path)
+    FLAGS.set_override('rpc_backend', 'nova.rpc.impl_fake')
+    FLAGS.set_override('service_down_time', 7 * 24 * 3600)
+
+    queries = QueryCounter()
+    capabilities = build_fleet(ctxt, options.hosts)
+    shutil.copyfile(db_path, clean_path)
+
+    flavors = set(request['flavor'] for request in trace
+                  if 'flavor' in request)
+    reference_memory_mb = max(
+            instance_types.get_instance_type_by_name(name)['memory_mb']
+            for name in flavors)
+
+    print "%d hosts, %d requests" % (options.hosts, len(trace))
+    print "%-8s %9s %8s %11s %8s %8s %12s %7s %7s %6s %7s" % (
+            "driver", "decisions", "failed", "decisions/s", "p50 ms",
+            "p99 ms", "queries/dec", "fill %", "frag %", "hosts",
+            "overcmt")
+    try:
+        for driver_name in options.drivers.split(','):
+            shutil.copyfile(clean_path, db_path)
+            sim = Simulation(driver_name, capabilities,
+                             options.report_interval, queries)
+            try:
+                sim.run(trace)
+            finally:
+                sim.close()
+            fill, fragmentation, hosts_used, overcommitted = \
+                    sim.placement(reference_memory_mb)
+            decisions = max(sim.decisions, 1)
+            print ("%-8s %9d %8d %11.1f %8.2f %8.2f %12.1f %7.1f %7.1f "
+                   "%6d %7d" % (driver_name, sim.decisions, sim.failures,
+                   sim.decisions / max(sim.scheduler_seconds, 1e-9),
+                   _percentile(sim.latencies, 0.5) * 1000,
+                   _percentile(sim.latencies, 0.99) * 1000,
+                   float(sim.scheduler_queries) / decisions,
+                   fill * 100, fragmentation * 100, hosts_used,
+                   overcommitted))
+    finally:
+        shutil.rmtree(workdir)
+
+
+def parse_options():
+    parser = optparse.OptionParser("%prog [options]")
+    parser.add_option("--hosts", type="int", default=200,
+                      help="number of compute hosts in the fleet")
+    parser.add_option("--requests", type="int", default=2000,
+                      help="number of requests of a generated trace")
+    parser.add_option("--seed", type="int", default=0,
+                      help="random seed of a generated trace")
+    parser.add_option("--delete-ratio", type="float", default=0.3,
+                      help="share of deletes in a generated trace")
+    parser.add_option("--resize-ratio", type="float", default=0.05,
+                      help="share of resizes in a generated trace")
+    parser.add_option("--trace",
+                      help="replay this trace instead of generating one")
+    parser.add_option("--save-trace",
+                      help="write the trace replayed to this file")
+    parser.add_option("--drivers", default="filter,simple,chance",
+                      help="comma separated drivers to replay the trace "
+                           "against, out of %s" % ",".join(sorted(DRIVERS)))
+    parser.add_option("--report-interval", type="int", default=100,
+                      help="number of requests between two rounds of "
+                           "capability reports")
+    options, args = parser.parse_args()
+    unknown = set(options.drivers.split(',')) - set(DRIVERS)
+    if args or unknown or options.report_interval < 1:
+        parser.print_usage()
+        sys.exit(1)
+    return options
+
+
+def main():
+    options = parse_options()
+    if options.trace:
+        trace = load_trace(options.trace)
+    else:
+        trace = generate_trace(options.requests, options.seed,
+                               options.delete_ratio, options.resize_ratio)
+    if options.save_trace:
+        save_trace(trace, options.save_trace)
+    simulate(options, trace)
+
+
+if __name__ == "__main__":
+    main()